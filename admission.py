@@ -0,0 +1,154 @@
+"""
+Admission control for the model-backed endpoints: a token bucket per user plus a process-wide cap on
+concurrent model calls with a short, bounded wait queue. Work beyond the queue is turned away at once
+with a Retry-After hint, so overload shows up as fast 429s instead of every request slowing down
+and the process tripping Gemini's own rate limits.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import Counter, Histogram
+
+ADMISSION_REJECTIONS = Counter("urmindr_admission_rejections_total",
+                               "Requests turned away by admission control.", ["reason"])
+ADMISSION_WAIT_SECONDS = Histogram("urmindr_admission_wait_seconds",
+                                   "Time model calls spent queued for a concurrency slot.")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over its rate limit or the model queue is full; maps to HTTP 429."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Too many requests ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Token bucket per key (the uid): 'per_minute' requests sustained with bursts of up to 'burst'.
+    Buckets are kept in LRU order and the least recently seen are dropped beyond 'max_keys';
+    a dropped bucket simply starts full again. per_minute <= 0 disables the limiter.
+    """
+
+    def __init__(self, per_minute=30, burst=10, max_keys=10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """Takes one token for 'key', or raises AdmissionRejected with the seconds until the next one."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if not allowed:
+            ADMISSION_REJECTIONS.inc(reason="rate_limit")
+            raise AdmissionRejected("rate_limit", max(1, math.ceil((1 - tokens) / self.rate)))
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._buckets)}
+
+
+class ConcurrencyLimiter:
+    """
+    Allows at most 'max_concurrent' model calls at once. Up to 'max_queue' further callers wait, each for at
+    most 'queue_timeout' seconds; anyone beyond that is rejected immediately.
+    Calls made with required=True (follow-up steps of a turn that was already admitted, background work)
+    wait for a slot without counting against the queue bound or timing out, so admitted turns always finish.
+    """
+
+    def __init__(self, max_concurrent=16, max_queue=32, queue_timeout=5.0, retry_after=2):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def _reject(self, reason):
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise AdmissionRejected(reason, self.retry_after)
+
+    def check(self):
+        """Fast rejection for requests that cannot even queue, e.g. before a streaming response starts."""
+        if self.active >= self.max_concurrent and self.waiting >= self.max_queue:
+            self._reject("queue_full")
+
+    def try_acquire(self):
+        with self._condition:
+            if self.active < self.max_concurrent:
+                self.active += 1
+                return True
+            return False
+
+    def acquire(self, required=False):
+        started = time.perf_counter()
+        with self._condition:
+            if self.active >= self.max_concurrent:
+                if not required and self.waiting >= self.max_queue:
+                    self._reject("queue_full")
+                self.waiting += 1
+                try:
+                    timeout = None if required else self.queue_timeout
+                    if not self._condition.wait_for(lambda: self.active < self.max_concurrent, timeout=timeout):
+                        self._reject("queue_timeout")
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def _release_if_acquired(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.release()
+
+    @contextmanager
+    def slot(self, required=False):
+        self.acquire(required)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self, required=False):
+        """Event-loop version of slot(); only a call that actually has to queue waits on a worker thread."""
+        if self.try_acquire():
+            ADMISSION_WAIT_SECONDS.observe(0.0)
+        else:
+            acquiring = asyncio.ensure_future(asyncio.to_thread(self.acquire, required))
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The worker thread may still get the slot after the request is gone; hand it straight back
+                acquiring.add_done_callback(self._release_if_acquired)
+                raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {"active": self.active, "waiting": self.waiting,
+                "max_concurrent": self.max_concurrent, "max_queue": self.max_queue}
@@ -1,140 +1,795 @@
 from dotenv import load_dotenv
 load_dotenv()
-from flask import Flask, request, jsonify, g
+from flask import Blueprint, Flask, request, jsonify, g, Response, stream_with_context
 import os
+import json
+import copy
+import threading
+import time
+import uuid
 import datetime
-import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
-from google import genai
-from google.genai import types
-import firebase_admin
-from firebase_admin import credentials, auth, firestore
+from lazy import LazyModule, LazyClient
+from token_cache import TokenCache
+from calendar_client import CalendarClient, CALENDAR_API_BASE
+from event_cache import EventCache, CalendarSyncError, event_start
+from availability import BusyIndex, busy_intervals, parse_rfc3339
+from idempotency import IdempotencyScope, calendar_event_id
+from recurrence import Recurrence
+from jobs import Job, JobManager
+from metrics import (
+    render_metrics, timed, CallbackGauge, CONTENT_TYPE as METRICS_CONTENT_TYPE, REQUEST_SECONDS, STAGE_SECONDS,
+    FIRESTORE_SECONDS, GEMINI_SECONDS, GEMINI_TOKENS, TOOL_SECONDS, TOOL_ERRORS,
+)
+from response_cache import ResponseCache, cache_key
+from admission import RateLimiter, ConcurrencyLimiter, AdmissionRejected
+from deadline import (
+    Hedger, DeadlineExceeded, DEADLINE_EVENTS, bind, current_deadline, deadline_scope, time_left,
+)
+from intent_router import IntentRouter
+from memory_index import MemoryStore
+from chat_store import (
+    create_chat_store, legacy_chat_header, ChatNotFound, FIRESTORE_BATCH_LIMIT, PREVIEW_LENGTH, TITLE_LENGTH
+)
+from context_builder import fit_history_to_budget, messages_to_summarize, build_summary_prompt, SUMMARY_MIN_BATCH
+
+# The Google SDKs take most of the import time, so they are imported on first use
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+firebase_admin = LazyModule("firebase_admin")
+credentials = LazyModule("firebase_admin.credentials")
+auth = LazyModule("firebase_admin.auth")
+firestore = LazyModule("firebase_admin.firestore")
+requests = LazyModule("requests")
 
 # --- Firebase Admin SDK Initialization ---
-try:
-    cred = credentials.ApplicationDefault()
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-    print("✅ Firebase Admin SDK initialized successfully.")
-except Exception as e:
-    print(f"🔥 Error initializing Firebase Admin SDK: {e}")
-
-app = Flask(__name__)
-app.secret_key = os.environ.get("FLASK_SECRET", "dev-secret-change-in-prod")
-CORS(app, supports_credentials=True)
-client = genai.Client()
+_firebase_lock = threading.Lock()
+_firebase_attempted = False
+
+def init_firebase():
+    """Initializes the default Firebase app once; later calls return immediately."""
+    global _firebase_attempted
+    if _firebase_attempted:
+        return
+    with _firebase_lock:
+        if _firebase_attempted:
+            return
+        _firebase_attempted = True
+        try:
+            cred = credentials.ApplicationDefault()
+            firebase_admin.initialize_app(cred)
+            print("✅ Firebase Admin SDK initialized successfully.")
+        except Exception as e:
+            print(f"🔥 Error initializing Firebase Admin SDK: {e}")
+
+def create_firestore_client():
+    init_firebase()
+    return firestore.client()
+
+db = LazyClient("firestore", create_firestore_client)
+client = LazyClient("genai", lambda: genai.Client())
+bp = Blueprint('urmindr', __name__)
+TOOLCALL_MODEL = "gemini-2.5-flash"
+GENERATE_MODEL = "gemini-2.5-flash"
+
+# Identical /api/generate prompts within the TTL are answered from memory, and concurrent duplicates share one call
+generate_cache = ResponseCache(
+    "generate",
+    max_entries=int(os.environ.get("GENERATE_CACHE_SIZE", 1024)),
+    ttl_seconds=int(os.environ.get("GENERATE_CACHE_TTL", 300)),
+)
+
+def record_gemini_usage(model, response):
+    """Adds the token counts from a response's usage metadata to the token counters."""
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return
+    for kind, attribute in (('prompt', 'prompt_token_count'), ('output', 'candidates_token_count'),
+                            ('cached', 'cached_content_token_count'), ('thoughts', 'thoughts_token_count')):
+        count = getattr(usage, attribute, None)
+        if count:
+            GEMINI_TOKENS.inc(count, model=model, kind=kind)
+
+# --- Admission control ---
+# Each user gets a token bucket for model-backed requests, and the process runs at most MODEL_MAX_CONCURRENCY
+# model calls at once with up to MODEL_QUEUE_SIZE more waiting MODEL_QUEUE_TIMEOUT seconds for a slot.
+# Anything beyond that is answered with 429 and Retry-After. USER_RATE_PER_MINUTE=0 turns off the per-user limit.
+user_rate_limiter = RateLimiter(
+    per_minute=float(os.environ.get("USER_RATE_PER_MINUTE", 30)),
+    burst=int(os.environ.get("USER_RATE_BURST", 10)),
+)
+model_limiter = ConcurrencyLimiter(
+    max_concurrent=int(os.environ.get("MODEL_MAX_CONCURRENCY", 16)),
+    max_queue=int(os.environ.get("MODEL_QUEUE_SIZE", 32)),
+    queue_timeout=float(os.environ.get("MODEL_QUEUE_TIMEOUT", 5)),
+)
+
+def admit_model_request(key):
+    """Rejects a model-backed request up front if its user is over the rate limit or the model queue is full."""
+    user_rate_limiter.check(key)
+    model_limiter.check()
+
+def admission_rejected_response(e):
+    return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+
+def deadline_exceeded_response(e):
+    return jsonify({"error": str(e)}), 504
+
+# --- Deadlines and hedged model calls ---
+# /api/toolcall runs under a TOOLCALL_DEADLINE second deadline shared by its model calls, tools and Calendar requests
+# (0 turns it off). Every model call gets an HTTP timeout of at most MODEL_TIMEOUT seconds and is not started with less
+# than MODEL_MIN_TIME left. Calls made with less than MODEL_FALLBACK_WITHIN seconds left switch to the faster
+# MODEL_FALLBACK (empty turns that off). MODEL_HEDGING=true sends one duplicate of a model call still outstanding after
+# the MODEL_HEDGE_PERCENTILE latency of recent calls to the same model, if a model slot is free.
+TOOLCALL_DEADLINE = float(os.environ.get("TOOLCALL_DEADLINE", 30))
+MODEL_TIMEOUT = float(os.environ.get("MODEL_TIMEOUT", 30))
+MODEL_MIN_TIME = float(os.environ.get("MODEL_MIN_TIME", 1))
+MODEL_FALLBACK = os.environ.get("MODEL_FALLBACK", "gemini-2.5-flash-lite")
+MODEL_FALLBACK_WITHIN = float(os.environ.get("MODEL_FALLBACK_WITHIN", 8))
+model_hedger = Hedger(
+    # Every call on the pool holds a model slot, so it never needs more workers than there are slots
+    max_workers=model_limiter.max_concurrent,
+    enabled=os.environ.get("MODEL_HEDGING", "false").lower() == "true",
+    percentile=float(os.environ.get("MODEL_HEDGE_PERCENTILE", 0.95)),
+    min_samples=int(os.environ.get("MODEL_HEDGE_MIN_SAMPLES", 20)),
+)
+
+def plan_model_call(model, config=None):
+    """
+    (model, config, timeout) for a model call under the current deadline. Raises DeadlineExceeded with less than
+    MODEL_MIN_TIME left, switches to MODEL_FALLBACK close to the deadline and puts the timeout on the config.
+    """
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(f"calling {model}", reserve=MODEL_MIN_TIME)
+        # A Gemini context cache belongs to one model, so calls that use one stay on it
+        cached = config is not None and getattr(config, 'cached_content', None)
+        if MODEL_FALLBACK and model != MODEL_FALLBACK and not cached and deadline.remaining() < MODEL_FALLBACK_WITHIN:
+            DEADLINE_EVENTS.inc(event="fallback")
+            model = MODEL_FALLBACK
+    timeout = time_left(MODEL_TIMEOUT)
+    http_options = types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+    if config is None:
+        config = types.GenerateContentConfig(http_options=http_options)
+    else:
+        # The tool-call config is shared by every request of the day, so the timeout goes on a copy
+        config = config.model_copy(update={'http_options': http_options})
+    return model, config, timeout
+
+def call_gemini(model, contents, config=None, required=False):
+    """
+    client.models.generate_content with latency and token-usage metrics, inside a model_limiter slot and the
+    current deadline, hedged by model_hedger. Pass required=True for calls that must not be rejected
+    (follow-up steps of an admitted turn, background work).
+    """
+    model, config, timeout = plan_model_call(model, config)
+    model_limiter.acquire(required)
+    deadline = current_deadline()
+    if deadline is not None:
+        try:
+            # Required calls may have queued for a slot for a while
+            deadline.check(f"calling {model}", reserve=MODEL_MIN_TIME)
+        except DeadlineExceeded:
+            model_limiter.release()
+            raise
+        timeout = time_left(timeout)
+
+    def attempt():
+        # Runs holding a model slot: the one taken above, or the hedge's from try_acquire
+        try:
+            with GEMINI_SECONDS.time(model=model, mode='sync'):
+                return client.models.generate_content(model=model, contents=contents, config=config)
+        finally:
+            model_limiter.release()
+
+    response = model_hedger.call(model, attempt, timeout, try_hedge=model_limiter.try_acquire)
+    record_gemini_usage(model, response)
+    return response
+
+def stream_gemini(model, contents, config=None, required=False):
+    """client.models.generate_content_stream with time-to-first-chunk, latency and token-usage metrics."""
+    model, config, _ = plan_model_call(model, config)
+    with model_limiter.slot(required=required):
+        started = time.perf_counter()
+        last_chunk = None
+        for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+            if last_chunk is None:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage='gemini_first_chunk')
+            last_chunk = chunk
+            yield chunk
+    GEMINI_SECONDS.observe(time.perf_counter() - started, model=model, mode='stream')
+    # Streaming responses report cumulative usage on the final chunk
+    if last_chunk is not None:
+        record_gemini_usage(model, last_chunk)
+
+# Decoded ID tokens are cached until their 'exp' claim so polling endpoints skip signature checks.
+# Set FIREBASE_CHECK_REVOKED=true to always take the slow path and check for revoked tokens.
+token_cache = TokenCache(max_size=int(os.environ.get("TOKEN_CACHE_SIZE", 1024)))
+CHECK_REVOKED = os.environ.get("FIREBASE_CHECK_REVOKED", "false").lower() == "true"
+
+def verify_id_token_cached(id_token, check_revoked=False):
+    """
+    Verifies a Firebase ID token, serving repeat tokens from the in-process cache.
+    Revocation checks bypass the cache since they require a round trip to Firebase.
+    """
+    if check_revoked:
+        init_firebase()
+        decoded_token = auth.verify_id_token(id_token, check_revoked=True)
+    else:
+        decoded_token = token_cache.get(id_token)
+        if decoded_token is not None:
+            return decoded_token
+        init_firebase()
+        decoded_token = auth.verify_id_token(id_token)
+    token_cache.put(id_token, decoded_token)
+    return decoded_token
+
+# --- Startup ---
+# Clients are built on first use. With WARM_UP on, a background thread builds them right after startup
+# so the first request does not pay for SDK imports and credential discovery; /healthz reports when it is done.
+WARM_UP = os.environ.get("WARM_UP", "true").lower() == "true"
+# With READINESS_GATE on, requests other than /healthz and /metrics get a 503 until warm-up finishes
+READINESS_GATE = os.environ.get("READINESS_GATE", "false").lower() == "true"
+startup_state = {"warming": False, "warm_up_seconds": None, "errors": {}}
+_warm_up_lock = threading.Lock()
+
+def warm_up():
+    """Builds the Firestore and Gemini clients ahead of the first request."""
+    started = time.perf_counter()
+    errors = {}
+    for name, lazy_client in (('firestore', db), ('genai', client)):
+        # Clients swapped out after import (e.g. for the benchmark fakes) need no warming
+        if not isinstance(lazy_client, LazyClient):
+            continue
+        try:
+            with STAGE_SECONDS.time(stage=f'warm_up_{name}'):
+                lazy_client.resolve()
+        except Exception as e:
+            errors[name] = str(e)
+            print(f"🔥 Error warming up {name} client: {e}")
+    # Imports requests and builds the pooled Calendar session
+    calendar_client.session
+    elapsed = time.perf_counter() - started
+    startup_state.update(warming=False, errors=errors, warm_up_seconds=round(elapsed, 3))
+    print(f"✅ Warm-up finished in {elapsed:.2f}s")
+
+def start_warm_up():
+    """Starts the warm-up thread once per process."""
+    with _warm_up_lock:
+        if startup_state["warming"] or startup_state["warm_up_seconds"] is not None:
+            return
+        startup_state["warming"] = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Middleware to record per-route request latency
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@bp.before_app_request
+def readiness_gate():
+    if READINESS_GATE and startup_state["warming"] and request.path not in ('/healthz', '/metrics'):
+        return jsonify({"error": "Service is starting"}), 503, {"Retry-After": "1"}
+
+@bp.after_app_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Streaming responses are timed until their headers are ready, not until the stream ends
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method,
+                                status=response.status_code)
+    return response
 
 # Middleware to verify Firebase ID token
-@app.before_request
+@bp.before_app_request
 def verify_token():
     g.user = None
     auth_header = request.headers.get('Authorization', '')
     if auth_header.startswith('Bearer '):
         id_token = auth_header.split('Bearer ')[1]
         try:
-            decoded_token = auth.verify_id_token(id_token)
+            with STAGE_SECONDS.time(stage='verify_token'):
+                decoded_token = verify_id_token_cached(id_token, check_revoked=CHECK_REVOKED)
             g.user = decoded_token
         except Exception as e:
             print(f"🔥 Error verifying token: {e}")
 
-def get_user_context(uid):
-    # TODO: Fetch user-specific context from Firestore
-    return f"This is the context for user {uid}."
+# --- Long-term memory ---
+# Messages and scheduled events are embedded into a per-user vector index (see memory_index.py) as they are
+# written; each turn's prompt gets only the few most relevant snippets instead of replaying old chats.
+MEMORY_ENABLED = os.environ.get("MEMORY", "true").lower() == "true"
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "gemini-embedding-001")
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", 768))
+MEMORY_TOP_K = int(os.environ.get("MEMORY_TOP_K", 4))
+MEMORY_MIN_SCORE = float(os.environ.get("MEMORY_MIN_SCORE", 0.35))
+# Longest wait for an embedding call; a turn's memory search also stops at the turn's deadline
+EMBEDDING_TIMEOUT = float(os.environ.get("EMBEDDING_TIMEOUT", 10))
+NO_MEMORIES = "No relevant notes from earlier conversations."
+
+def embed_texts(texts, task_type):
+    timeout = time_left(EMBEDDING_TIMEOUT)
+    with GEMINI_SECONDS.time(model=EMBEDDING_MODEL, mode='embed'):
+        response = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type=task_type, output_dimensionality=EMBEDDING_DIM,
+                                            http_options=types.HttpOptions(timeout=max(1, int(timeout * 1000)))),
+        )
+    return [embedding.values for embedding in response.embeddings]
+
+memory_store = MemoryStore(
+    os.environ.get("MEMORY_DIR", "data/memory"),
+    embed_texts,
+    EMBEDDING_DIM,
+    max_open_users=int(os.environ.get("MEMORY_MAX_OPEN_USERS", 200)),
+)
+# Memory searches (one query embedding each) run alongside the turn's Firestore reads
+memory_search_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MEMORY_SEARCH_WORKERS", 8)))
+
+def remember_message(user_id, chat_id, message_id, role, content, timestamp):
+    """Queues a stored chat message for the user's memory index."""
+    if MEMORY_ENABLED:
+        memory_store.remember(user_id, 'message', message_id, f"{role}: {content}", chat_id=chat_id, timestamp=timestamp)
+
+def remember_scheduled(scope, summary):
+    """Queues an event created for 'scope' (a tool-result summary) for the user's memory index."""
+    if not MEMORY_ENABLED or scope is None:
+        return
+    text = f"Scheduled '{summary['topic']}' on {summary['date']} at {summary['time']} ({summary['duration']}h)"
+    if summary.get('recurrence'):
+        text += f", {summary['recurrence']}"
+    memory_store.remember(scope.user_id, 'event', text, text, timestamp=datetime.datetime.now(datetime.timezone.utc))
+
+def get_user_context(uid, query=None, chat_id=None):
+    """The past snippets most relevant to 'query', excluding the current chat, formatted for the prompt."""
+    if not MEMORY_ENABLED or not query:
+        return NO_MEMORIES
+    try:
+        snippets = memory_store.search(uid, query, k=MEMORY_TOP_K, min_score=MEMORY_MIN_SCORE, exclude_chat=chat_id)
+    except Exception as e:
+        print(f"🔥 Error searching memory for user {uid}: {e}")
+        return NO_MEMORIES
+    if not snippets:
+        return NO_MEMORIES
+    lines = [f"- ({snippet['at'][:10]}) {snippet['text']}" if snippet.get('at') else f"- {snippet['text']}"
+             for snippet in snippets]
+    return "Relevant notes from earlier conversations:\n" + "\n".join(lines)
+
+def user_context_result(search):
+    """The result of a get_user_context future, or NO_MEMORIES if it is not ready within the time left."""
+    try:
+        return search.result(timeout=time_left(EMBEDDING_TIMEOUT))
+    except TimeoutError:
+        print("🔥 Memory search timed out, continuing without memories")
+        return NO_MEMORIES
 
 # --- Chat History Functions ---
-def start_or_get_chat(user_id, chat_id=None):
+# Chats are kept in a chat_store.py backend: Firestore by default (a small header document per chat with a
+# 'messages' subcollection), or a local SQLite file with CHAT_STORE=sqlite.
+HISTORY_WINDOW = int(os.environ.get("HISTORY_WINDOW", 50))
+CHAT_STORE = os.environ.get("CHAT_STORE", "firestore")
+chat_store = create_chat_store(
+    CHAT_STORE,
+    firestore_client=lambda: db,
+    sqlite_path=os.environ.get("CHAT_DB_PATH", "data/chats.sqlite3"),
+)
+
+def get_chat_ref(user_id, chat_id):
+    return db.collection('users').document(user_id).collection('chats').document(chat_id)
+
+@timed(FIRESTORE_SECONDS, op='get_chat_messages')
+def get_chat_messages(user_id, chat_id, limit=None, since=None):
     """
-    Starts a new chat in Firestore if no chat_id is provided,
-    otherwise returns the provided chat_id.
+    Returns a window of a chat's messages, oldest first.
+    With 'since' (a message timestamp) only newer messages are returned; with 'limit' only the last N.
     """
-    user_chats_ref = db.collection('users').document(user_id).collection('chats')
-    if chat_id:
-        # TODO: Optionally, verify the chat_id exists before returning.
-        return chat_id
-    else:
-        # Create a new chat document with an ISO formatted timestamp as the ID
-        now_iso = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        new_chat_ref = user_chats_ref.document(now_iso)
-        new_chat_ref.set({
-            'startTime': datetime.datetime.now(datetime.timezone.utc),
-            'messages': []
-        })
-        return new_chat_ref.id
+    ensure_chat_migrated(user_id, chat_id)
+    return chat_store.get_messages(user_id, chat_id, limit=limit, since=since)
+
+# Legacy array-based chats only ever existed in Firestore, so the migration talks to it directly.
+# Chats are migrated lazily the first time their messages are read or their user's chats are listed, so legacy
+# history stays visible without waiting for migrate_chats.py; each process remembers what it already checked.
+MIGRATION_CHECK_CACHE_SIZE = 10000
+_migration_checked = OrderedDict()
+_migration_checked_lock = threading.Lock()
+
+def _migration_check_needed(key):
+    with _migration_checked_lock:
+        if key in _migration_checked:
+            _migration_checked.move_to_end(key)
+            return False
+        return True
 
-def add_message_to_chat(user_id, chat_id, role, content):
+def _migration_checked_add(key):
+    with _migration_checked_lock:
+        _migration_checked[key] = True
+        while len(_migration_checked) > MIGRATION_CHECK_CACHE_SIZE:
+            _migration_checked.popitem(last=False)
+
+def ensure_chat_migrated(user_id, chat_id):
+    """Migrates a legacy array-based chat before its messages are read; one header read per chat and process."""
+    if CHAT_STORE != "firestore" or chat_id is None or not _migration_check_needed((user_id, chat_id)):
+        return
+    migrate_array_chat(user_id, chat_id)
+    _migration_checked_add((user_id, chat_id))
+
+def ensure_user_chats_migrated(user_id):
     """
-    Adds a message to a specific chat's 'messages' array in Firestore.
+    Backfills the headers of a user's never-touched legacy chats before they are listed: without 'lastActivity'
+    they would be left out of the listing, which is ordered by it. Legacy chats that have already had new turns
+    have a 'lastActivity' and are migrated on first read instead.
     """
-    chat_ref = db.collection('users').document(user_id).collection('chats').document(chat_id)
-    message = {
-        'role': role,
-        'content': content,
-        'timestamp': datetime.datetime.now(datetime.timezone.utc)
+    if CHAT_STORE != "firestore" or not _migration_check_needed((user_id, None)):
+        return
+    for chat_doc in db.collection('users').document(user_id).collection('chats').select(['lastActivity']).stream():
+        if (chat_doc.to_dict() or {}).get('lastActivity') is None:
+            migrate_array_chat(user_id, chat_doc.id)
+    _migration_checked_add((user_id, None))
+
+def migrate_array_chat(user_id, chat_id):
+    """
+    Moves a legacy chat's 'messages' array into the messages subcollection and merges it into the header:
+    turns written to the subcollection before the migration keep their count, and the newer activity wins.
+    Message document IDs are deterministic and the header update removes the array, so an interrupted
+    migration can safely be re-run. Returns the number of messages migrated.
+    """
+    chat_ref = get_chat_ref(user_id, chat_id)
+    chat_snap = chat_ref.get()
+    if not chat_snap.exists:
+        return 0
+    header = chat_snap.to_dict()
+    legacy_messages = header.get('messages')
+    if legacy_messages is None:
+        return 0
+
+    messages_ref = chat_ref.collection('messages')
+    for offset in range(0, len(legacy_messages), FIRESTORE_BATCH_LIMIT):
+        batch = db.batch()
+        for index, message in enumerate(legacy_messages[offset:offset + FIRESTORE_BATCH_LIMIT], start=offset):
+            batch.set(messages_ref.document(f"legacy-{index:06d}"), message)
+        batch.commit()
+
+    header_update = {
+        'messageCount': firestore.Increment(len(legacy_messages)),
+        'messages': firestore.DELETE_FIELD,
     }
-    # Atomically add the new message to the 'messages' array
-    chat_ref.update({
-        'messages': firestore.ArrayUnion([message])
-    })
+    if not header.get('title'):
+        header_update['title'] = 'New chat'
+        if legacy_messages:
+            first_user_message = next((m for m in legacy_messages if m.get('role') == 'user'), legacy_messages[0])
+            header_update['title'] = first_user_message.get('content', '')[:TITLE_LENGTH]
+    legacy_activity = legacy_messages[-1].get('timestamp') if legacy_messages else header.get('startTime')
+    current_activity = header.get('lastActivity')
+    # Turns added since the upgrade already set a newer lastActivity and preview; keep those
+    if current_activity is None or (legacy_activity is not None and legacy_activity > current_activity):
+        header_update['lastActivity'] = legacy_activity
+        header_update['lastMessagePreview'] = legacy_messages[-1].get('content', '')[:PREVIEW_LENGTH] if legacy_messages else ''
+    chat_ref.update(header_update)
+    return len(legacy_messages)
+
+def migrate_user_array_chats(user_id):
+    """Migrates every legacy array-based chat for a user and returns the number of chats migrated."""
+    migrated = 0
+    for chat_doc in db.collection('users').document(user_id).collection('chats').stream():
+        if 'messages' in chat_doc.to_dict():
+            migrate_array_chat(user_id, chat_doc.id)
+            migrated += 1
+    return migrated
 
+def chat_summary(chat_id, chat_info):
+    """The JSON summary of a chat header."""
+    last_activity = chat_info.get('lastActivity')
+    return {
+        'chat_id': chat_id,
+        'title': chat_info.get('title', ''),
+        'lastMessagePreview': chat_info.get('lastMessagePreview', ''),
+        'messageCount': chat_info.get('messageCount', 0),
+        'lastActivity': last_activity.isoformat() if hasattr(last_activity, 'isoformat') else last_activity
+    }
+
+@timed(FIRESTORE_SECONDS, op='list_chat_summaries')
+def list_chat_summaries(user_id, limit=20, cursor=None):
+    """
+    Returns one page of chat summaries, most recently active first, and the cursor for the next page.
+    Only the header summary fields are read; the cursor is the ISO 'lastActivity' of the last chat returned.
+    """
+    before_activity = datetime.datetime.fromisoformat(cursor) if cursor else None
+    ensure_user_chats_migrated(user_id)
+    # Fetch one extra chat to find out whether another page exists
+    chats = chat_store.list_chats(user_id, limit + 1, before_activity=before_activity)
+    summaries = [chat_summary(chat_id, chat_info) for chat_id, chat_info in chats[:limit]]
+    next_cursor = summaries[-1]['lastActivity'] if len(chats) > limit and summaries else None
+    return summaries, next_cursor
+
+def serialize_message(message):
+    """Converts a stored message to JSON, keeping full timestamp precision so it can be used as a cursor."""
+    timestamp = message.get('timestamp')
+    return {
+        'role': message.get('role'),
+        'content': message.get('content'),
+        'timestamp': timestamp.isoformat() if hasattr(timestamp, 'isoformat') else timestamp
+    }
+
+# Client request ids become part of Firestore document IDs (chat and message IDs)
+MAX_REQUEST_ID_LENGTH = 128
+
+def request_id_error(request_id):
+    """Why a client 'request_id' cannot be used as a turn ID, or None if it can (or is absent)."""
+    if request_id is None:
+        return None
+    if not isinstance(request_id, str) or not request_id:
+        return "'request_id' must be a non-empty string"
+    if '/' in request_id or request_id.startswith('__') or request_id in ('.', '..'):
+        return "'request_id' must not contain '/' or be '.', '..' or start with '__'"
+    if len(request_id.encode('utf-8')) > MAX_REQUEST_ID_LENGTH:
+        return f"'request_id' must be at most {MAX_REQUEST_ID_LENGTH} bytes"
+    return None
+
+class ChatTurnWriter:
+    """
+    Buffers the chat writes of one /api/toolcall turn (new chat header, user and agent messages)
+    and commits them in a single atomic write at the end of the turn.
+    Nothing is written if the turn fails, and message IDs (and a new chat's ID) derive from the turn ID,
+    so a replayed turn (same client 'request_id') is rejected atomically instead of duplicating messages
+    or starting a second chat.
+    """
+
+    def __init__(self, user_id, chat_id=None, title=None, turn_id=None):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.user_id = user_id
+        self.new_chat = chat_id is None
+        self.chat_id = chat_id or (f"chat-{turn_id}" if turn_id else now.isoformat())
+        self.title = title
+        self.turn_id = turn_id or uuid.uuid4().hex
+        self.messages = []
+
+    def add_message(self, role, content):
+        self.messages.append({
+            'role': role,
+            'content': content,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc)
+        })
+
+    def message_items(self):
+        """The buffered messages as (message_id, message) pairs."""
+        return [(f"{self.turn_id}-{index}", message) for index, message in enumerate(self.messages)]
+
+    def remember(self):
+        """Hands the committed messages to the memory index."""
+        for message_id, message in self.message_items():
+            remember_message(self.user_id, self.chat_id, message_id, message['role'], message['content'], message['timestamp'])
+
+    @timed(FIRESTORE_SECONDS, op='commit_turn')
+    def commit(self):
+        """Commits the buffered writes; returns False if this turn had already been committed."""
+        if not self.messages:
+            return True
+        if not chat_store.add_messages(self.user_id, self.chat_id, self.message_items(), new_chat=self.new_chat, title=self.title):
+            print(f"Turn {self.turn_id} was already saved to chat {self.chat_id}, skipping")
+            return False
+        self.remember()
+        return True
+
+@timed(FIRESTORE_SECONDS, op='get_user_chats')
 def get_user_chats(user_id):
     """
     Fetches all chat IDs and their basic information for a given user.
     """
-    user_chats_ref = db.collection('users').document(user_id).collection('chats')
-    chats = {}
-    for chat_doc in user_chats_ref.stream():
-        chats[chat_doc.id] = chat_doc.to_dict()
-    return chats
+    return chat_store.get_chats(user_id)
+
+# Shared, pooled Calendar client used by every tool call
+calendar_client = CalendarClient(
+    base_url=os.environ.get("CALENDAR_API_BASE", CALENDAR_API_BASE),
+    pool_size=int(os.environ.get("CALENDAR_POOL_SIZE", 10)),
+    connect_timeout=float(os.environ.get("CALENDAR_CONNECT_TIMEOUT", 3.05)),
+    read_timeout=float(os.environ.get("CALENDAR_READ_TIMEOUT", 10)),
+    max_retries=int(os.environ.get("CALENDAR_MAX_RETRIES", 3)),
+)
+# Upper bound on concurrent inserts per schedule_multiple_events call
+CALENDAR_INSERT_WORKERS = int(os.environ.get("CALENDAR_INSERT_WORKERS", 8))
+
+# Per-user event cache kept current with incremental sync, so refreshes only download deltas
+event_cache = EventCache(
+    calendar_client,
+    max_users=int(os.environ.get("EVENT_CACHE_MAX_USERS", 500)),
+    ttl_seconds=int(os.environ.get("EVENT_CACHE_TTL", 1800)),
+    refresh_interval=float(os.environ.get("EVENT_CACHE_REFRESH_INTERVAL", 15)),
+)
 
 # Direct Google Calendar API calls
 def fetch_events_direct(access_token, max_results=15):
-    """Direct API call to Google Calendar"""
-    url = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
-    headers = {"Authorization": f"Bearer {access_token}"}
-    params = {
-        "maxResults": max_results,
-        "orderBy": "startTime",
-        "singleEvents": "true",
-        "timeMin": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    }
-    response = requests.get(url, headers=headers, params=params)
-    if response.status_code == 200:
-        return response.json().get("items", [])
-    else:
-        print(f"Calendar API error: {response.status_code} - {response.text}")
+    """Upcoming events from the user's cached calendar, synced incrementally with Google Calendar"""
+    try:
+        return event_cache.upcoming_events(access_token, max_results=max_results)
+    except CalendarSyncError as e:
+        print(f"Calendar API error: {e}")
         return []
 
-def create_event_direct(access_token, name, start_time, end_time):
-    """Direct API call to create calendar event"""
-    url = "https://www.googleapis.com/calendar/v3/calendars/primary/events"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
+def create_event_direct(access_token, name, start_time, end_time, event_id=None, recurrence=None):
+    """
+    Direct API call to create calendar event. With an 'event_id' that already exists, returns that event instead.
+    'recurrence' is a list of RRULE/EXDATE lines for a recurring event, whose first occurrence is start_time.
+    """
     event_data = {
         "summary": name,
         "start": {"dateTime": start_time.isoformat(), "timeZone": "UTC"},
         "end": {"dateTime": end_time.isoformat(), "timeZone": "UTC"}
     }
-    response = requests.post(url, headers=headers, json=event_data)
+    if event_id:
+        event_data["id"] = event_id
+    if recurrence:
+        event_data["recurrence"] = recurrence
+    response = calendar_client.insert_event(access_token, event_data)
+    if response.status_code == 409 and event_id:
+        return get_existing_event(access_token, event_id, event_data)
     if response.status_code in [200, 201]:
-        return response.json()
+        event = response.json()
+        event_cache.record_event(access_token, event)
+        return event
     else:
         print(f"Create event error: {response.status_code} - {response.text}")
         return None
 
+def get_existing_event(access_token, event_id, event_data):
+    """Fetches an event whose ID is already taken, restoring it if it has been deleted since."""
+    response = calendar_client.get_event(access_token, event_id)
+    if response.status_code != 200:
+        print(f"Get event error: {response.status_code} - {response.text}")
+        return None
+    event = response.json()
+    if event.get('status') == 'cancelled':
+        # Calendar never reuses an event ID, so a deleted event is brought back rather than recreated
+        restored = {key: value for key, value in event_data.items() if key != 'id'}
+        restored['status'] = 'confirmed'
+        response = calendar_client.patch_event(access_token, event_id, restored)
+        if response.status_code != 200:
+            print(f"Restore event error: {response.status_code} - {response.text}")
+            return None
+        event = response.json()
+    event_cache.record_event(access_token, event)
+    return event
+
+# Calendar writes made on behalf of an IdempotencyScope are keyed per event (see idempotency.py), so a retried
+# /api/toolcall gets back the events it already created. Recent results are answered from memory; the key is also
+# the Calendar event ID, so a replay that misses memory still cannot create a second copy. Memory is only trusted for
+# turns with a client request id: without one, the same event asked for again may have been deleted meanwhile, so
+# only the synced event cache (which drops cancelled events) and Google itself are asked.
+calendar_writes = ResponseCache(
+    "calendar_writes",
+    max_entries=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 4096)),
+    ttl_seconds=int(os.environ.get("IDEMPOTENCY_TTL", 86400)),
+)
+
+def find_created_event(access_token, key, remembered=True, start=None):
+    """
+    The event already created for an idempotency key, from memory (with 'remembered') or the synced event cache.
+    Google is only asked, by the key's event ID, when the cache does not span 'start' (or there is no 'start',
+    as for a series, whose occurrences are cached under other IDs): a cold cache cannot rule the event out.
+    """
+    event = calendar_writes.get(key) if remembered else None
+    if event is None:
+        event = event_cache.cached_event(access_token, calendar_event_id(key))
+    if event is None and (start is None or not event_cache.covers(access_token, start)):
+        event = fetch_created_event(access_token, calendar_event_id(key))
+    return event
+
+def fetch_created_event(access_token, event_id):
+    """An event by ID from Google; None if it does not exist, has been deleted or cannot be read."""
+    try:
+        response = calendar_client.get_event(access_token, event_id)
+    except requests.RequestException as e:
+        print(f"Get event error: {e}")
+        return None
+    if response.status_code != 200:
+        if response.status_code != 404:
+            print(f"Get event error: {response.status_code} - {response.text}")
+        return None
+    event = response.json()
+    # A deleted event is restored by the insert instead (see get_existing_event)
+    return None if event.get('status') == 'cancelled' else event
+
+def create_event_once(access_token, key, name, start_time, end_time, recurrence=None, remembered=True):
+    """
+    create_event_direct guarded by an idempotency key (None to skip). Returns (event, replayed); with 'remembered',
+    concurrent calls with the same key share the first caller's insert and recent results are answered from memory.
+    """
+    if key is None:
+        return create_event_direct(access_token, name, start_time, end_time, recurrence=recurrence), False
+    insert = lambda: create_event_direct(access_token, name, start_time, end_time,
+                                         event_id=calendar_event_id(key), recurrence=recurrence)
+    if remembered:
+        event, outcome = calendar_writes.get_or_compute(key, insert)
+    else:
+        # Google still answers a repeated ID with the original event, restoring it if it was deleted
+        event, outcome = insert(), 'miss'
+    # An insert that hit an existing ID returns the original event, which may have been booked at another time
+    return event, outcome != 'miss' or (event is not None and event_start_time(event) != start_time)
+
+def event_start_time(event):
+    start = event.get('start', {})
+    return parse_rfc3339(start['dateTime']) if 'dateTime' in start else None
+
+def replayed_summary(summary, event):
+    """A tool-result summary for an event that had already been created, at the time it was actually booked."""
+    summary = {key: value for key, value in summary.items() if key != 'shifted_from'}
+    start = event_start_time(event)
+    if start is None:
+        return dict(summary, replayed=True)
+    return dict(summary, date=start.date().isoformat(), time=start.strftime('%H:%M'), replayed=True)
+
+# Proposed events are checked against the user's busy time before anything is inserted.
+# 'report' rejects a conflicting event; 'shift' moves it to the next free slot that day.
+CONFLICT_POLICIES = ('report', 'shift')
+SCHEDULE_DAY_END_HOUR = int(os.environ.get("SCHEDULE_DAY_END_HOUR", 22))
+
+def latest_slot_end(start):
+    """How late an event starting at 'start' may be shifted to end."""
+    return datetime.datetime.combine(start.date(), datetime.time(SCHEDULE_DAY_END_HOUR))
+
+def fetch_busy_index(access_token, proposals):
+    """Builds a BusyIndex from one freeBusy call spanning every proposal; None if busy time is unavailable."""
+    time_min = min(start for _, _, start, _ in proposals)
+    time_max = max(max(end, latest_slot_end(start)) for _, _, start, end in proposals)
+    try:
+        response = calendar_client.free_busy(access_token, time_min.replace(tzinfo=datetime.timezone.utc),
+                                             time_max.replace(tzinfo=datetime.timezone.utc))
+        if response.status_code != 200:
+            print(f"freeBusy error: {response.status_code} - {response.text}")
+            return None
+        return BusyIndex(busy_intervals(response.json()))
+    except Exception as e:
+        print(f"🔥 Error fetching busy time: {e}")
+        return None
+
+def plan_event_slots(access_token, proposals, on_conflict):
+    """
+    Checks proposed events, as (index, summary, start, end) tuples, against the user's busy time and each other.
+    Returns (accepted, rejected): the proposals to insert, moved to a later slot where on_conflict is 'shift'
+    (their summary gains 'shifted_from'), and (index, reason) pairs for the ones that cannot be placed.
+    """
+    busy = fetch_busy_index(access_token, proposals)
+    if busy is None:
+        # Still keep the plan from double-booking itself
+        busy = BusyIndex()
+    accepted = []
+    rejected = []
+    # Earlier proposals claim their slots first, so shifts only ever move events later in the day
+    for index, summary, start, end in sorted(proposals, key=lambda proposal: proposal[2]):
+        conflicts = busy.conflicts(start, end)
+        if conflicts:
+            slot = busy.next_free(start, end - start, max(end, latest_slot_end(start)))
+            if on_conflict != 'shift' or slot is None:
+                reason = f"'{summary['topic']}' - conflicts with {', '.join(conflicts)}"
+                reason += f"; the next free slot is {slot:%Y-%m-%d %H:%M}" if slot else "; no free slot later that day"
+                rejected.append((index, reason))
+                continue
+            summary = dict(summary, date=slot.date().isoformat(), time=slot.strftime('%H:%M'),
+                           shifted_from=f"{summary['date']} {summary['time']}")
+            start, end = slot, slot + (end - start)
+        busy.add(start, end, f"'{summary['topic']}'")
+        accepted.append((index, summary, start, end))
+    return accepted, rejected
+
 # Routes
-@app.route("/api/cal/events", methods=["POST"])
+@bp.route("/api/cal/events", methods=["POST"])
 def get_events():
     """Get calendar events using access token from request"""
     if not request.json or 'accessToken' not in request.json:
         return jsonify({"error": "Missing accessToken in request body"}), 400
     access_token = request.json['accessToken']
+    if g.user:
+        event_cache.bind_token(access_token, g.user['uid'])
     events = fetch_events_direct(access_token)
     return jsonify({"events": events})
 
-def handle_schedule_meeting(args, access_token):
-    """Handles the logic for the 'schedule_meeting' tool and returns a dictionary."""
+def handle_schedule_meeting(args, access_token, scope=None):
+    """
+    Handles the logic for the 'schedule_meeting' tool and returns a dictionary.
+    With an IdempotencyScope, a replay of a meeting that was already created returns the original event.
+    """
     print(f"Access token received: {access_token[:20]}..." if access_token else "No access token")
     if not access_token:
         return {"error": "Missing access token for calendar operations"}
@@ -155,17 +810,47 @@ def handle_schedule_meeting(args, access_token):
         start_datetime_str = f"{date}T{time}"
         start_datetime = datetime.datetime.fromisoformat(start_datetime_str)
         end_datetime = start_datetime + datetime.timedelta(hours=1)
-        event = create_event_direct(access_token, topic, start_datetime, end_datetime)
+        summary = {"topic": topic, "date": date, "time": time, "duration": 1}
+
+        # Replays are answered before the conflict check, which would otherwise see the original as a conflict
+        key = scope.event_key(topic, start_datetime, 1) if scope else None
+        remembered = scope is not None and scope.request_id is not None
+        event = find_created_event(access_token, key, remembered, start_datetime) if key else None
+        if event:
+            summary = replayed_summary(summary, event)
+            return {"response": f"The meeting about '{topic}' is already scheduled for {summary['date']} at {summary['time']}.",
+                    "event": event}
+
+        # A meeting the user asked for at a given time is not moved unless the model asks for it
+        on_conflict = args.get('on_conflict') if args.get('on_conflict') in CONFLICT_POLICIES else 'report'
+        accepted, rejected = plan_event_slots(access_token, [(0, summary, start_datetime, end_datetime)], on_conflict)
+        if rejected:
+            return {"error": f"Cannot schedule meeting {rejected[0][1]}"}
+        _, summary, start_datetime, end_datetime = accepted[0]
+
+        event, replayed = create_event_once(access_token, key, topic, start_datetime, end_datetime, remembered=remembered)
         print(topic,start_datetime,end_datetime)
+        if event and replayed:
+            summary = replayed_summary(summary, event)
+            return {"response": f"The meeting about '{topic}' is already scheduled for {summary['date']} at {summary['time']}.",
+                    "event": event}
         if event:
-            return {"response": f"I've scheduled a meeting about '{topic}' for {date} at {time}.", "event": event}
+            remember_scheduled(scope, summary)
+            message = f"I've scheduled a meeting about '{topic}' for {summary['date']} at {summary['time']}."
+            if 'shifted_from' in summary:
+                message += f" It was moved from {summary['shifted_from']} to avoid a conflict."
+            return {"response": message, "event": event}
         else:
             return {"error": "Failed to create calendar event"}
     except Exception as e:
         return {"error": f"Error creating event: {str(e)}"}
 
-def handle_schedule_multiple_events(args, access_token):
-    """Handles scheduling multiple events and returns a dictionary."""
+def handle_schedule_multiple_events(args, access_token, scope=None, progress=None):
+    """
+    Handles scheduling multiple events and returns a dictionary.
+    With an IdempotencyScope, events that were already created are reported from the original result and not sent again.
+    'progress' (a background Job) is told how many inserts are planned and as each one finishes.
+    """
     if not access_token:
         return {"error": "Missing access token for calendar operations"}
     
@@ -173,53 +858,116 @@ def handle_schedule_multiple_events(args, access_token):
     if not events_to_schedule:
         return {"response": "No events provided to schedule."}
     
-    scheduled_events = []
-    failed_events = []
     today = datetime.datetime.now().date()
+    # One outcome per requested event so results are reported in the original order
+    outcomes = [None] * len(events_to_schedule)
+    pending = []
+    # Idempotency keys by request index, derived from the requested start so a conflict shift keeps the key
+    keys = {}
+    remembered = scope is not None and scope.request_id is not None
     
-    for event_data in events_to_schedule:
+    for index, event_data in enumerate(events_to_schedule):
+        topic = event_data.get('topic', 'Task')
         try:
-            topic = event_data.get('topic', 'Task')
             date = event_data.get('date')
             time = event_data.get('time')
             duration_hours = event_data.get('duration_hours', 1)
             
             if not date or not time:
-                failed_events.append(f"'{topic}' - missing date or time")
+                outcomes[index] = ('failed', f"'{topic}' - missing date or time")
                 continue
                 
             # Validate date is not in the past
             event_date = datetime.datetime.fromisoformat(date).date()
             if event_date < today:
-                failed_events.append(f"'{topic}' - date {date} is in the past")
+                outcomes[index] = ('failed', f"'{topic}' - date {date} is in the past")
                 continue
                 
             start_datetime_str = f"{date}T{time}"
             start_datetime = datetime.datetime.fromisoformat(start_datetime_str)
             end_datetime = start_datetime + datetime.timedelta(hours=duration_hours)
-            
-            event = create_event_direct(access_token, topic, start_datetime, end_datetime)
-            
+            summary = {
+                "topic": topic,
+                "date": date,
+                "time": time,
+                "duration": duration_hours
+            }
+            if scope:
+                keys[index] = scope.event_key(topic, start_datetime, duration_hours)
+            pending.append((index, summary, start_datetime, end_datetime))
+        except Exception as e:
+            outcomes[index] = ('failed', f"'{topic}' - {str(e)}")
+    
+    # Replays are answered before the conflict check, which would otherwise see the originals as conflicts.
+    # Lookups that have to ask Google run concurrently.
+    if keys and pending:
+        with ThreadPoolExecutor(max_workers=min(CALENDAR_INSERT_WORKERS, len(pending))) as executor:
+            lookups = [executor.submit(bind(find_created_event), access_token, keys[index], remembered, start)
+                       for index, _, start, _ in pending]
+        unscheduled = []
+        for proposal, lookup in zip(pending, lookups):
+            index, summary = proposal[0], proposal[1]
+            try:
+                event = lookup.result()
+            except Exception as e:
+                outcomes[index] = ('failed', f"'{summary['topic']}' - {str(e)}")
+                continue
             if event:
-                scheduled_events.append({
-                    "topic": topic,
-                    "date": date,
-                    "time": time,
-                    "duration": duration_hours
-                })
-                print(f"Scheduled: {topic} on {date} at {time}")
+                outcomes[index] = ('scheduled', replayed_summary(summary, event))
             else:
-                failed_events.append(f"'{topic}' - API error")
-                
-        except Exception as e:
-            failed_events.append(f"'{topic}' - {str(e)}")
+                unscheduled.append(proposal)
+        pending = unscheduled
+    
+    # Check the whole plan against busy time (and itself) before sending any inserts
+    if pending:
+        on_conflict = args.get('on_conflict') if args.get('on_conflict') in CONFLICT_POLICIES else 'shift'
+        pending, rejected = plan_event_slots(access_token, pending, on_conflict)
+        for index, reason in rejected:
+            outcomes[index] = ('failed', reason)
+    
+    # Insert the validated events concurrently so the plan takes about as long as the slowest insert
+    if pending:
+        if progress:
+            progress.plan(len(pending))
+        workers = min(CALENDAR_INSERT_WORKERS, len(pending))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                (index, summary, executor.submit(bind(create_event_once), access_token, keys.get(index), summary['topic'],
+                                                 start, end, remembered=remembered))
+                for index, summary, start, end in pending
+            ]
+            for index, summary, future in futures:
+                try:
+                    event, replayed = future.result()
+                except Exception as e:
+                    outcomes[index] = ('failed', f"'{summary['topic']}' - {str(e)}")
+                    if progress:
+                        progress.event_finished(False)
+                    continue
+                if progress:
+                    progress.event_finished(event is not None)
+                if event:
+                    outcomes[index] = ('scheduled', replayed_summary(summary, event) if replayed else summary)
+                    if not replayed:
+                        remember_scheduled(scope, summary)
+                    print(f"Scheduled: {summary['topic']} on {summary['date']} at {summary['time']}")
+                else:
+                    outcomes[index] = ('failed', f"'{summary['topic']}' - API error")
+    
+    scheduled_events = [value for status, value in outcomes if status == 'scheduled']
+    failed_events = [value for status, value in outcomes if status == 'failed']
     
     # Build response message
     response_parts = []
     if scheduled_events:
         response_parts.append(f"Successfully scheduled {len(scheduled_events)} events:")
         for event in scheduled_events:
-            response_parts.append(f"• {event['topic']} on {event['date']} at {event['time']} ({event['duration']}h)")
+            line = f"• {event['topic']} on {event['date']} at {event['time']} ({event['duration']}h)"
+            if 'shifted_from' in event:
+                line += f" - moved from {event['shifted_from']} to avoid a conflict"
+            if event.get('replayed'):
+                line += " - already scheduled earlier"
+            response_parts.append(line)
     
     if failed_events:
         response_parts.append(f"\nFailed to schedule {len(failed_events)} events:")
@@ -233,174 +981,643 @@ def handle_schedule_multiple_events(args, access_token):
         "scheduled_events": scheduled_events
     }
 
+# A recurring event is one insert however many occurrences it has; this bounds the local expansion
+# used for the past-date and conflict checks (and so the freeBusy range).
+MAX_RECURRENCE_OCCURRENCES = int(os.environ.get("MAX_RECURRENCE_OCCURRENCES", 100))
+# 'report' rejects a series with conflicting occurrences; 'skip' leaves those dates out of it
+RECURRENCE_CONFLICT_POLICIES = ('report', 'skip')
+
+def handle_schedule_recurring_event(args, access_token, scope=None):
+    """
+    Handles the 'schedule_recurring_event' tool and returns a dictionary.
+    The rule is expanded locally for the past-date and conflict checks, then a single recurring event is created.
+    """
+    if not access_token:
+        return {"error": "Missing access token for calendar operations"}
+    topic = args.get('topic', 'Task')
+    start_date = args.get('start_date')
+    time = args.get('time')
+    if not start_date or not time:
+        return {"response": "I need a start date and time to schedule the recurring event."}
+    try:
+        duration_hours = args.get('duration_hours', 1)
+        duration = datetime.timedelta(hours=duration_hours)
+        if duration <= datetime.timedelta(0):
+            raise ValueError(f"duration_hours must be positive, got {duration_hours}")
+        rule = Recurrence(args.get('frequency'), interval=args.get('interval', 1), by_day=args.get('by_day'),
+                          count=args.get('count'), until=args.get('until'))
+        occurrences = rule.expand(datetime.datetime.fromisoformat(f"{start_date}T{time}"), MAX_RECURRENCE_OCCURRENCES)
+    except (TypeError, ValueError) as e:
+        return {"error": f"Cannot schedule recurring event '{topic}': {e}"}
+    if not occurrences:
+        return {"error": f"Cannot schedule recurring event '{topic}': {rule.describe()} has no occurrences"}
+
+    first_start = occurrences[0]
+    if first_start.date() < datetime.datetime.now().date():
+        return {"error": f"Cannot schedule recurring event '{topic}' - the first occurrence ({first_start.date()}) is in the past"}
+    summary = {"topic": topic, "date": first_start.date().isoformat(), "time": first_start.strftime('%H:%M'),
+               "duration": duration_hours, "recurrence": rule.describe(), "occurrences": len(occurrences)}
+
+    # The rule is part of the key, so a series never replays a one-off event at the same start
+    key = scope.event_key(f"{topic} {rule.rrule()}", first_start, duration_hours) if scope else None
+    remembered = scope is not None and scope.request_id is not None
+    event = find_created_event(access_token, key, remembered) if key else None
+    if event:
+        return {"response": f"'{topic}' is already scheduled {rule.describe()} from {summary['date']} at {summary['time']}.",
+                "event": event}
+
+    # One freeBusy call covers the whole series
+    busy = fetch_busy_index(access_token, [(index, summary, start, start + duration) for index, start in enumerate(occurrences)])
+    conflicting = [start for start in occurrences if busy and busy.conflicts(start, start + duration)]
+    on_conflict = args.get('on_conflict') if args.get('on_conflict') in RECURRENCE_CONFLICT_POLICIES else 'report'
+    if conflicting and (on_conflict != 'skip' or len(conflicting) == len(occurrences)):
+        dates = ", ".join(f"{start:%Y-%m-%d}" for start in conflicting)
+        return {"error": f"Cannot schedule '{topic}' {rule.describe()} - {len(conflicting)} of {len(occurrences)} "
+                         f"occurrences conflict with existing events ({dates})"}
+
+    recurrence = [rule.rrule()]
+    if conflicting:
+        recurrence.append("EXDATE:" + ",".join(f"{start:%Y%m%dT%H%M%S}Z" for start in conflicting))
+        summary["skipped"] = [f"{start:%Y-%m-%d}" for start in conflicting]
+    try:
+        event, replayed = create_event_once(access_token, key, topic, first_start, first_start + duration,
+                                            recurrence=recurrence, remembered=remembered)
+    except Exception as e:
+        return {"error": f"Error creating recurring event: {str(e)}"}
+    if not event:
+        return {"error": "Failed to create calendar event"}
+    if replayed:
+        return {"response": f"'{topic}' is already scheduled {rule.describe()} from {summary['date']} at {summary['time']}.",
+                "event": event}
+    remember_scheduled(scope, summary)
+    message = f"I've scheduled '{topic}' {rule.describe()}, starting {summary['date']} at {summary['time']} ({duration_hours}h)."
+    if conflicting:
+        message += f" Skipped {len(conflicting)} dates that conflict with existing events: {', '.join(summary['skipped'])}."
+    return {"response": message, "event": event, "scheduled": summary}
+
 def get_current_time():
     current_time = datetime.datetime.now()
     print(current_time)
     return current_time.strftime("%Y-%m-%d %H:%M:%S")
 
-def execute_function_call(function_call, access_token):
+def execute_function_call(function_call, access_token, scope=None, progress=None):
     """Executes the appropriate function based on the model's call and returns a dictionary."""
+    with TOOL_SECONDS.time(tool=function_call.name):
+        result = dispatch_function_call(function_call, access_token, scope, progress)
+    if 'error' in result:
+        TOOL_ERRORS.inc(tool=function_call.name)
+    return result
+
+def dispatch_function_call(function_call, access_token, scope=None, progress=None):
     if function_call.name == 'schedule_meeting':
-        return handle_schedule_meeting(function_call.args, access_token)
+        return handle_schedule_meeting(function_call.args, access_token, scope)
     elif function_call.name == 'schedule_multiple_events':
-        return handle_schedule_multiple_events(function_call.args, access_token)
+        return handle_schedule_multiple_events(function_call.args, access_token, scope, progress)
+    elif function_call.name == 'schedule_recurring_event':
+        return handle_schedule_recurring_event(function_call.args, access_token, scope)
     elif function_call.name == "get_time":
         return {"response": f"The current time is {get_current_time()}."}
     else:
         return {"error": f"Unknown function call: {function_call.name}"}
 
-def handle_gemini_response(response, access_token):
-    """Processes the response from the Gemini model and returns a dictionary."""
-    if not response.candidates:
-        return {"response": "No response from the model."}
-    
-    candidate = response.candidates[0]
-    if not candidate.content or not candidate.content.parts:
-        return {"response": "Empty response from the model."}
-    
-    # Look for function calls in all parts
-    function_call = None
+# --- Function-call execution loop ---
+# Each step is one model round trip; tool results are fed back until the model answers in text
+MAX_TOOL_STEPS = int(os.environ.get("MAX_TOOL_STEPS", 4))
+TOOL_TIME_BUDGET = float(os.environ.get("TOOL_TIME_BUDGET", 20))
+TOOL_CALL_WORKERS = int(os.environ.get("TOOL_CALL_WORKERS", 4))
+
+def split_parts(parts):
+    """Splits model content parts into (function_calls, text)."""
+    function_calls = []
     text_parts = []
-    
-    for part in candidate.content.parts:
+    for part in parts:
         if hasattr(part, 'function_call') and part.function_call:
-            function_call = part.function_call
-            print(f"Found function call: {function_call.name}")
-            print(f"Arguments: {function_call.args}")
+            function_calls.append(part.function_call)
+            print(f"Found function call: {part.function_call.name}")
+            print(f"Arguments: {part.function_call.args}")
         elif hasattr(part, 'text') and part.text:
             text_parts.append(part.text)
-    
-    # If we found a function call, execute it
-    if function_call:
-        return execute_function_call(function_call, access_token)
-    
-    # Otherwise, return the text response
-    full_text = ''.join(text_parts)
-    if full_text:
-        print("No function call found in the response.")
-        print(f"Text response: {full_text}")
-        return {"response": full_text}
-    else:
-        return {"response": "No usable response from the model."}
+    return function_calls, ''.join(text_parts)
 
-@app.route("/api/generate", methods=["POST"])
-def generate():
-    if not request.json or 'prompt' not in request.json:
-        return jsonify({"error": "Missing 'prompt' in request body"}), 400
-    prompt = request.json['prompt']
-    try:
-        response = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
-        return jsonify({"response": response.text})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+def execute_function_calls(function_calls, access_token, scope=None, progress=None):
+    """
+    Runs every function call from one model turn concurrently and returns their results in order.
+    'scope' is the turn's IdempotencyScope, which makes calendar writes safe to replay;
+    'progress' is the background Job running the turn, if any.
+    """
+    if len(function_calls) == 1:
+        return [execute_function_call(function_calls[0], access_token, scope, progress)]
+    with ThreadPoolExecutor(max_workers=min(TOOL_CALL_WORKERS, len(function_calls))) as executor:
+        return list(executor.map(
+            bind(lambda function_call: execute_function_call(function_call, access_token, scope, progress)), function_calls))
 
-@app.route("/api/toolcall", methods=["POST"])
-def genwithtools():
-    if not g.user:
-        return jsonify({"error": "Unauthorized"}), 401
-    if not request.json or 'prompt' not in request.json:
-        return jsonify({"error": "Missing 'prompt' in request body"}), 400
+def function_response_content(function_calls, results):
+    """Packages tool results as the function-response turn that is sent back to the model."""
+    return types.Content(role='user', parts=[
+        types.Part.from_function_response(name=function_call.name, response=result)
+        for function_call, result in zip(function_calls, results)
+    ])
 
-    user_id = g.user['uid']
-    prompt = request.json['prompt']
-    chat_id = request.json.get('chat_id')  # Optional chat_id from client
-    access_token = request.json.get('accessToken')  # Google access token for calendar operations
+def build_agent_response(tool_calls, final_text):
+    """
+    Combines the executed tool calls and the model's final text into the endpoint's response dictionary.
+    Fields from the last tool result (e.g. 'scheduled_count', 'event') are kept at the top level.
+    """
+    if not tool_calls:
+        return {"response": final_text or "No usable response from the model."}
+    agent_response_data = dict(tool_calls[-1]['result'])
+    if final_text:
+        agent_response_data['response'] = final_text
+    else:
+        # No closing text from the model (e.g. the step budget ran out), so report the tools' own messages
+        agent_response_data['response'] = "\n".join(
+            call['result'].get('response') or call['result'].get('error', '') for call in tool_calls
+        )
+    agent_response_data['tool_calls'] = tool_calls
+    return agent_response_data
 
-    try:
-        # Start a new chat or get the existing one
-        active_chat_id = start_or_get_chat(user_id, chat_id)
-        # Save user's message
-        add_message_to_chat(user_id, active_chat_id, 'user', prompt)
+def handle_gemini_response(response, access_token, contents=None, config=None, scope=None, progress=None):
+    """
+    Processes the response from the Gemini model and returns a dictionary.
+    When the request contents and config are given, tool results are fed back to the model and the loop
+    continues for up to MAX_TOOL_STEPS model calls or TOOL_TIME_BUDGET seconds.
+    """
+    started = time.monotonic()
+    tool_calls = []
+    step = 1
+    while True:
+        if not response.candidates:
+            return build_agent_response(tool_calls, "" if tool_calls else "No response from the model.")
         
-        current_datetime = datetime.datetime.now()
-        current_date = current_datetime.strftime("%Y-%m-%d")
-        current_time = current_datetime.strftime("%H:%M:%S")
-        current_day = current_datetime.strftime("%A")  # Monday, Tuesday, etc.
-        tomorrow_date = (current_datetime + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        candidate = response.candidates[0]
+        if not candidate.content or not candidate.content.parts:
+            return build_agent_response(tool_calls, "" if tool_calls else "Empty response from the model.")
         
-        user_context = get_user_context(user_id)
+        function_calls, text = split_parts(candidate.content.parts)
+        if not function_calls:
+            if text and not tool_calls:
+                print("No function call found in the response.")
+                print(f"Text response: {text}")
+            return build_agent_response(tool_calls, text)
         
-        # Function Calling with dynamic date context
-        schedule_meeting_function = {
-            "name": "schedule_meeting",
-            "description": "Schedules a single meeting with specified attendees at a given time and date.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "attendees": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "List of people attending the meeting.",
-                    },
-                    "date": {
-                        "type": "string",
-                        "description": f"Date of the meeting in YYYY-MM-DD format. Today is {current_date}. Use dates >= {current_date}",
-                    },
-                    "time": {
-                        "type": "string",
-                        "description": "Time of the meeting in HH:MM format (e.g., '15:00')",
-                    },
-                    "topic": {
-                        "type": "string",
-                        "description": "The subject or topic of the meeting.",
-                    },
-                },
-                "required": ["date", "time", "topic"],
+        results = execute_function_calls(function_calls, access_token, scope, progress)
+        for function_call, result in zip(function_calls, results):
+            tool_calls.append({'name': function_call.name, 'args': dict(function_call.args or {}), 'result': result})
+        
+        out_of_budget = step >= MAX_TOOL_STEPS or time.monotonic() - started >= TOOL_TIME_BUDGET or deadline_near()
+        if contents is None or config is None or out_of_budget:
+            return build_agent_response(tool_calls, "")
+        
+        contents.append(candidate.content)
+        contents.append(function_response_content(function_calls, results))
+        response = call_gemini(TOOLCALL_MODEL, contents, config, required=True)
+        step += 1
+
+def deadline_near():
+    """True once the current deadline leaves too little time for another model call."""
+    remaining = time_left()
+    return remaining is not None and remaining <= MODEL_MIN_TIME
+
+def cache_bypassed():
+    """Clients skip the response cache with 'Cache-Control: no-cache' or an 'X-Cache-Bypass' header."""
+    return 'no-cache' in request.headers.get('Cache-Control', '') or bool(request.headers.get('X-Cache-Bypass'))
+
+# --- Server-sent events streaming ---
+def wants_stream():
+    """Streaming is opt-in, either with '"stream": true' in the body or an 'Accept: text/event-stream' header."""
+    if request.json and request.json.get('stream'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def chunk_parts(chunk):
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return []
+    return chunk.candidates[0].content.parts or []
+
+def stream_toolcall(turn, contents, config, access_token, scope=None):
+    """
+    Streams a tool-call turn as server-sent events.
+    'token' events carry text as it arrives, 'function_call' events are sent once a call is complete and
+    'function_result' once it has run. Results are fed back to the model as in handle_gemini_response,
+    and a final 'done' event carries the same payload the non-streaming endpoint returns.
+    """
+    # The body runs after the route has returned, so it picks the request's deadline back up
+    deadline = current_deadline()
+
+    def events():
+        with deadline_scope(deadline):
+            yield from toolcall_events()
+
+    def toolcall_events():
+        try:
+            started = time.monotonic()
+            tool_calls = []
+            text = ""
+            for step in range(1, MAX_TOOL_STEPS + 1):
+                parts = []
+                # Admitted before the stream started, so these calls wait for a slot rather than fail mid-stream
+                for chunk in stream_gemini(TOOLCALL_MODEL, contents, config, required=True):
+                    for part in chunk_parts(chunk):
+                        parts.append(part)
+                        if part.function_call:
+                            yield sse_event('function_call', {
+                                'name': part.function_call.name,
+                                'args': dict(part.function_call.args or {})
+                            })
+                        elif part.text:
+                            yield sse_event('token', {'text': part.text})
+
+                function_calls, text = split_parts(parts)
+                if not function_calls:
+                    break
+                results = execute_function_calls(function_calls, access_token, scope)
+                for function_call, result in zip(function_calls, results):
+                    tool_calls.append({'name': function_call.name, 'args': dict(function_call.args or {}), 'result': result})
+                    yield sse_event('function_result', {'name': function_call.name, 'result': result})
+                text = ""
+                if time.monotonic() - started >= TOOL_TIME_BUDGET or deadline_near():
+                    break
+                contents.append(types.Content(role='model', parts=parts))
+                contents.append(function_response_content(function_calls, results))
+
+            if not tool_calls and not text:
+                text = "Empty response from the model."
+            agent_response_data = build_agent_response(tool_calls, text)
+            turn.add_message('agent', agent_response_data.get('response', ''))
+            turn.commit()
+            agent_response_data['chat_id'] = turn.chat_id
+            yield sse_event('done', agent_response_data)
+        except Exception as e:
+            print(f"Error streaming /api/toolcall: {e}")
+            yield sse_event('error', {'error': str(e)})
+
+    return sse_response(events())
+
+def stream_generate(prompt):
+    def events():
+        try:
+            text_parts = []
+            for chunk in stream_gemini(GENERATE_MODEL, prompt, required=True):
+                if chunk.text:
+                    text_parts.append(chunk.text)
+                    yield sse_event('token', {'text': chunk.text})
+            yield sse_event('done', {'response': ''.join(text_parts)})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+
+    return sse_response(events())
+
+# --- Local fast path ---
+# Trivial prompts ("what time is it", "what's on my calendar today") are recognised by intent_router.py and
+# answered here in milliseconds, without a model round trip; everything else goes to Gemini as before.
+intent_router = IntentRouter(
+    threshold=float(os.environ.get("INTENT_ROUTER_THRESHOLD", 0.8)),
+    enabled=os.environ.get("INTENT_ROUTER", "true").lower() == "true",
+)
+AGENDA_MAX_EVENTS = 50
+
+def event_local_date(event):
+    """The local date an event starts on; an all-day event's own date."""
+    start = event.get('start', {})
+    if 'date' in start:
+        return datetime.date.fromisoformat(start['date'])
+    return event_start(event).astimezone().date()
+
+def agenda_result(access_token, days_ahead):
+    """Tool-style result listing the user's remaining events on one day; None if the calendar cannot be read."""
+    if not access_token:
+        return None
+    try:
+        events = event_cache.upcoming_events(access_token, max_results=AGENDA_MAX_EVENTS)
+    except (CalendarSyncError, requests.RequestException, DeadlineExceeded) as e:
+        # Calendar is down or slow (retries exhausted); the model can still answer, so let the turn go to it
+        print(f"Calendar API error: {e}")
+        return None
+    # 'Today' is the server's local day, as for the 'date' intent and the scheduling tools
+    day = datetime.datetime.now().date() + datetime.timedelta(days=days_ahead)
+    events = [event for event in events if event_start(event) and event_local_date(event) == day]
+    # Events that have already ended are not in the upcoming list, hence 'still' for today
+    if not events:
+        return {"response": "Nothing else is on your calendar today." if days_ahead == 0
+                else "Nothing is on your calendar tomorrow.", "events": []}
+    lines = [f"Still on your calendar today ({len(events)}):" if days_ahead == 0
+             else f"On your calendar tomorrow ({len(events)}):"]
+    for event in events:
+        when = event_start(event).astimezone().strftime('%H:%M') if 'dateTime' in event.get('start', {}) else "all day"
+        lines.append(f"• {event.get('summary', '(no title)')} - {when}")
+    return {"response": "\n".join(lines), "events": events}
+
+INTENT_HANDLERS = {
+    'time': lambda access_token: {"response": f"The current time is {get_current_time()}."},
+    'date': lambda access_token: {"response": f"Today is {datetime.datetime.now():%A, %Y-%m-%d}."},
+    'agenda_today': lambda access_token: agenda_result(access_token, 0),
+    'agenda_tomorrow': lambda access_token: agenda_result(access_token, 1),
+}
+
+def answer_trivial_prompt(intent, access_token):
+    """The /api/toolcall payload for a routed intent, or None if it has to go to the model after all."""
+    if intent is None:
+        return None
+    with TOOL_SECONDS.time(tool=intent):
+        result = INTENT_HANDLERS[intent](access_token)
+    intent_router.answered(intent, result is not None)
+    if result is None:
+        return None
+    return build_agent_response([{'name': intent, 'args': {}, 'result': result}], "")
+
+# --- Background jobs ---
+# With '"async": true' in the body or a 'Prefer: respond-async' header, /api/toolcall answers 202 as soon as the
+# model has asked for tools; the tool calls, follow-up model calls and chat writes then run on the job pool,
+# and clients follow progress at /api/jobs/<job_id>. Job snapshots live in users/{uid}/jobs/{job_id}.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# Firestore deletes job documents after 'expireAt' once a TTL policy is configured on that field
+JOB_RECORD_TTL = datetime.timedelta(days=int(os.environ.get("JOB_RECORD_TTL_DAYS", 7)))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+# A job's event stream ends with an 'error' event after JOB_STREAM_MAX_SECONDS (clients can keep polling the job),
+# or once a job running elsewhere has not saved a snapshot for JOB_STALE_SECONDS, e.g. because its worker died
+JOB_STREAM_MAX_SECONDS = float(os.environ.get("JOB_STREAM_MAX_SECONDS", 600))
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", 300))
+
+def get_job_ref(user_id, job_id):
+    return db.collection('users').document(user_id).collection('jobs').document(job_id)
+
+@timed(FIRESTORE_SECONDS, op='save_job')
+def save_job(job):
+    record = job.to_dict()
+    record['expireAt'] = record['updated_at'] + JOB_RECORD_TTL
+    get_job_ref(job.user_id, job.id).set(record)
+
+@timed(FIRESTORE_SECONDS, op='get_job')
+def get_job_record(user_id, job_id):
+    """A job's last persisted snapshot, for jobs that ran in another process; None if there is none."""
+    job_snap = get_job_ref(user_id, job_id).get()
+    if not job_snap.exists:
+        return None
+    record = job_snap.to_dict()
+    record.pop('expireAt', None)
+    return record
+
+job_manager = JobManager(
+    save_job,
+    max_workers=JOB_WORKERS,
+    retention_seconds=int(os.environ.get("JOB_RETENTION", 900)),
+    persist_interval=float(os.environ.get("JOB_PERSIST_INTERVAL", 1.0)),
+)
+
+def wants_async():
+    if request.json and request.json.get('async'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+def response_has_function_calls(response):
+    if not response.candidates or not response.candidates[0].content:
+        return False
+    return any(part.function_call for part in response.candidates[0].content.parts or [])
+
+def start_toolcall_job(user_id, chat_id, response, access_token, contents, config, scope, finish):
+    """
+    Runs the rest of a tool-call turn on the job pool. 'finish' stores the agent's reply in the chat;
+    the job's result is the payload the synchronous endpoint would have returned.
+    """
+    def work(job):
+        try:
+            agent_response_data = handle_gemini_response(response, access_token, contents, config, scope, progress=job)
+        except Exception as e:
+            # The client already got a 202, so the user's message is kept, with the error as the reply
+            finish(f"Sorry, I couldn't finish that: {e}")
+            raise
+        finish(agent_response_data.get('response', ''))
+        agent_response_data['chat_id'] = chat_id
+        return agent_response_data
+
+    return job_manager.submit(Job(user_id, 'toolcall', chat_id=chat_id), work)
+
+def job_accepted_payload(job):
+    return {"job_id": job.id, "status": job.status, "chat_id": job.chat_id, "status_url": f"/api/jobs/{job.id}"}
+
+def stream_job(user_id, job_id, job):
+    """
+    SSE 'progress' events on every change, then 'done' with the final snapshot; 'error' if the job is
+    still running after JOB_STREAM_MAX_SECONDS or its persisted snapshot has gone stale.
+    """
+    ends_at = time.monotonic() + JOB_STREAM_MAX_SECONDS
+    timed_out = {'error': f'Job {job_id} is still running; poll /api/jobs/{job_id} for its status'}
+
+    def events():
+        if job is not None:
+            version = None
+            while True:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    yield sse_event('error', timed_out)
+                    return
+                seen = job.wait_for_change(version, timeout=min(15, remaining)) if version is not None else job.version
+                if seen == version:
+                    # Comment line as a keep-alive through idle proxies
+                    yield ": keep-alive\n\n"
+                    continue
+                version = seen
+                snapshot = job.to_dict()
+                yield sse_event('done' if job.done else 'progress', snapshot)
+                if job.done:
+                    return
+        # Jobs running in another process are followed through their persisted snapshots
+        last = None
+        while True:
+            record = get_job_record(user_id, job_id)
+            if record is None:
+                yield sse_event('error', {'error': 'Job not found'})
+                return
+            done = record['status'] in ('succeeded', 'failed')
+            if record != last:
+                yield sse_event('done' if done else 'progress', record)
+                last = record
+            if done:
+                return
+            idle = datetime.datetime.now(datetime.timezone.utc) - record['updated_at']
+            if idle.total_seconds() > JOB_STALE_SECONDS:
+                yield sse_event('error', {'error': f'Job {job_id} stopped reporting progress'})
+                return
+            if time.monotonic() >= ends_at:
+                yield sse_event('error', timed_out)
+                return
+            time.sleep(JOB_POLL_INTERVAL)
+
+    return sse_response(events())
+
+# --- Tool declarations and prompt prefix ---
+# The declarations are static; only the date hints in their descriptions change, once per day.
+CONTEXT_CACHE_ENABLED = os.environ.get("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+
+SCHEDULE_MEETING_FUNCTION = {
+    "name": "schedule_meeting",
+    "description": "Schedules a single meeting with specified attendees at a given time and date.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "attendees": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "List of people attending the meeting.",
+            },
+            "date": {
+                "type": "string",
+                "description": "Date of the meeting in YYYY-MM-DD format.",
             },
-        }
-
-        schedule_multiple_events_function = {
-            "name": "schedule_multiple_events",
-            "description": "Schedules multiple events/tasks at once. Useful for breaking down large projects into smaller scheduled tasks.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "events": {
-                        "type": "array",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "topic": {
-                                    "type": "string",
-                                    "description": "The subject or topic of the event/task.",
-                                },
-                                "date": {
-                                    "type": "string",
-                                    "description": f"Date of the event in YYYY-MM-DD format. Today is {current_date}. Use dates >= {current_date}",
-                                },
-                                "time": {
-                                    "type": "string",
-                                    "description": "Time of the event in HH:MM format (e.g., '15:00')",
-                                },
-                                "duration_hours": {
-                                    "type": "number",
-                                    "description": "Duration of the event in hours (default: 1)",
-                                }
-                            },
-                            "required": ["topic", "date", "time"]
+            "time": {
+                "type": "string",
+                "description": "Time of the meeting in HH:MM format (e.g., '15:00')",
+            },
+            "topic": {
+                "type": "string",
+                "description": "The subject or topic of the meeting.",
+            },
+            "on_conflict": {
+                "type": "string",
+                "enum": ["report", "shift"],
+                "description": "What to do if the time is already busy: 'report' the conflict (default) or 'shift' to the next free slot that day.",
+            },
+        },
+        "required": ["date", "time", "topic"],
+    },
+}
+
+SCHEDULE_MULTIPLE_EVENTS_FUNCTION = {
+    "name": "schedule_multiple_events",
+    "description": "Schedules multiple events/tasks at once. Useful for breaking down large projects into smaller scheduled tasks.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "events": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "topic": {
+                            "type": "string",
+                            "description": "The subject or topic of the event/task.",
+                        },
+                        "date": {
+                            "type": "string",
+                            "description": "Date of the event in YYYY-MM-DD format.",
                         },
-                        "description": "List of events to schedule.",
+                        "time": {
+                            "type": "string",
+                            "description": "Time of the event in HH:MM format (e.g., '15:00')",
+                        },
+                        "duration_hours": {
+                            "type": "number",
+                            "description": "Duration of the event in hours (default: 1)",
+                        }
                     },
+                    "required": ["topic", "date", "time"]
                 },
-                "required": ["events"],
+                "description": "List of events to schedule.",
             },
-        }
-
-        get_time_function = {
-            "name": "get_time",
-            "description": "Gets the current user's time",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                },
-                "required": [],
+            "on_conflict": {
+                "type": "string",
+                "enum": ["report", "shift"],
+                "description": "What to do with events that overlap busy time or each other: 'shift' them to the next free slot that day (default) or 'report' them unscheduled.",
             },
-        }
-        
-        system_instructions = f"""You are an intelligent assistant that specializes in task planning and calendar management.
+        },
+        "required": ["events"],
+    },
+}
+
+SCHEDULE_RECURRING_EVENT_FUNCTION = {
+    "name": "schedule_recurring_event",
+    "description": "Schedules one repeating event (e.g. every weekday, every other week, monthly) as a single recurring calendar entry.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "topic": {
+                "type": "string",
+                "description": "The subject or topic of the event.",
+            },
+            "start_date": {
+                "type": "string",
+                "description": "Date of the first occurrence in YYYY-MM-DD format.",
+            },
+            "time": {
+                "type": "string",
+                "description": "Time of every occurrence in HH:MM format (e.g., '15:00')",
+            },
+            "duration_hours": {
+                "type": "number",
+                "description": "Duration of each occurrence in hours (default: 1)",
+            },
+            "frequency": {
+                "type": "string",
+                "enum": ["daily", "weekly", "monthly"],
+                "description": "How often the event repeats.",
+            },
+            "interval": {
+                "type": "integer",
+                "description": "Repeat every N days/weeks/months (default: 1, e.g. 2 for every other week).",
+            },
+            "by_day": {
+                "type": "array",
+                "items": {"type": "string", "enum": ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]},
+                "description": "Weekdays the event falls on, for daily or weekly events (e.g. MO-FR for every weekday).",
+            },
+            "count": {
+                "type": "integer",
+                "description": "Total number of occurrences. Give either count or until.",
+            },
+            "until": {
+                "type": "string",
+                "description": "Last date the event may occur on, in YYYY-MM-DD format. Give either count or until.",
+            },
+            "on_conflict": {
+                "type": "string",
+                "enum": ["report", "skip"],
+                "description": "What to do if some occurrences overlap busy time: 'report' them and schedule nothing (default) or 'skip' those dates.",
+            },
+        },
+        "required": ["topic", "start_date", "time", "frequency"],
+    },
+}
+
+GET_TIME_FUNCTION = {
+    "name": "get_time",
+    "description": "Gets the current user's time",
+    "parameters": {
+        "type": "object",
+        "properties": {
+        },
+        "required": [],
+    },
+}
+
+def build_function_declarations(current_date):
+    """Returns the tool declarations with today's date filled into the date descriptions."""
+    date_hint = f" Today is {current_date}. Use dates >= {current_date}"
+    schedule_meeting_function = copy.deepcopy(SCHEDULE_MEETING_FUNCTION)
+    schedule_meeting_function["parameters"]["properties"]["date"]["description"] += date_hint
+    schedule_multiple_events_function = copy.deepcopy(SCHEDULE_MULTIPLE_EVENTS_FUNCTION)
+    schedule_multiple_events_function["parameters"]["properties"]["events"]["items"]["properties"]["date"]["description"] += date_hint
+    schedule_recurring_event_function = copy.deepcopy(SCHEDULE_RECURRING_EVENT_FUNCTION)
+    schedule_recurring_event_function["parameters"]["properties"]["start_date"]["description"] += date_hint
+    return [schedule_meeting_function, schedule_multiple_events_function, schedule_recurring_event_function, GET_TIME_FUNCTION]
+
+def build_system_prefix(current_datetime):
+    """The date-dependent but otherwise stable part of the system instructions."""
+    current_date = current_datetime.strftime("%Y-%m-%d")
+    current_day = current_datetime.strftime("%A")  # Monday, Tuesday, etc.
+    tomorrow_date = (current_datetime + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+    return f"""You are an intelligent assistant that specializes in task planning and calendar management.
 
 ⚠️ CRITICAL DATE INFORMATION - READ CAREFULLY ⚠️
-TODAY IS: {current_day}, {current_date} ({current_time})
+TODAY IS: {current_day}, {current_date}
 CURRENT YEAR: {current_datetime.year}
 CURRENT MONTH: {current_datetime.strftime('%B')} ({current_datetime.month})
 
@@ -415,6 +1632,7 @@ CORE CAPABILITIES:
 - Break down large, complex tasks into smaller, manageable scheduled events
 - Schedule single meetings with 'schedule_meeting'
 - Schedule multiple events at once with 'schedule_multiple_events'
+- Schedule repeating events (every weekday, weekly, monthly...) with 'schedule_recurring_event' - one call, not one entry per occurrence
 - Help users organize and plan their work effectively
 
 TASK BREAKDOWN APPROACH:
@@ -434,69 +1652,419 @@ SCHEDULING GUIDELINES:
 
 Always try to use 'schedule_multiple_events' when breaking down complex tasks.
 Consider the entire conversation history when generating responses.
-Be helpful, friendly, and occasionally add a playful "quack" if it feels natural.
+Be helpful, friendly, and occasionally add a playful "quack" if it feels natural."""
+
+# Daily tool-call setups keyed by (date, UTC offset), each valid until the next local midnight
+_daily_toolcall_setups = {}
+_daily_toolcall_lock = threading.Lock()
+
+def create_prefix_cache(system_prefix, tools, expires_at):
+    """
+    Uploads the stable prefix to Gemini's explicit context cache and returns the cache name.
+    Returns None when caching is disabled or rejected (e.g. the prefix is below the model's minimum size).
+    """
+    if not CONTEXT_CACHE_ENABLED:
+        return None
+    ttl_seconds = max(int((expires_at - datetime.datetime.now(expires_at.tzinfo)).total_seconds()), 60)
+    try:
+        cache = client.caches.create(
+            model=TOOLCALL_MODEL,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_prefix,
+                tools=[tools],
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        print(f"✅ Created Gemini context cache {cache.name} ({ttl_seconds}s)")
+        return cache.name
+    except Exception as e:
+        print(f"🔥 Gemini context caching unavailable, sending the prefix inline: {e}")
+        return None
+
+def get_daily_toolcall_setup(current_datetime):
+    """
+    Returns the tool-call GenerateContentConfig for the current day, building it at most once per day.
+    When the prefix is cached on Gemini's side the config references it instead of re-sending it.
+    """
+    local_now = current_datetime.astimezone()
+    key = (local_now.strftime("%Y-%m-%d"), local_now.utcoffset())
+    setup = _daily_toolcall_setups.get(key)
+    if setup is not None:
+        return setup
+    with _daily_toolcall_lock:
+        setup = _daily_toolcall_setups.get(key)
+        if setup is not None:
+            return setup
+        tomorrow = local_now.date() + datetime.timedelta(days=1)
+        expires_at = datetime.datetime.combine(tomorrow, datetime.time.min, tzinfo=local_now.tzinfo)
+        system_prefix = build_system_prefix(current_datetime)
+        tools = types.Tool(function_declarations=build_function_declarations(key[0]))
+        cache_name = create_prefix_cache(system_prefix, tools, expires_at)
+        if cache_name:
+            config = types.GenerateContentConfig(cached_content=cache_name)
+        else:
+            config = types.GenerateContentConfig(system_instruction=system_prefix, tools=[tools])
+        # Older days can never be requested again, so drop them
+        _daily_toolcall_setups.clear()
+        _daily_toolcall_setups[key] = config
+        return config
+
+# --- Rolling summaries of older turns ---
+SUMMARY_MODEL = os.environ.get("SUMMARY_MODEL", "gemini-2.5-flash-lite")
+# Messages older than the history window that are read per request to catch the summary up
+SUMMARY_BACKLOG_LIMIT = int(os.environ.get("SUMMARY_BACKLOG_LIMIT", 100))
+SUMMARY_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+summary_executor = ThreadPoolExecutor(max_workers=2)
+_summaries_in_flight = set()
+_summaries_lock = threading.Lock()
+
+@timed(FIRESTORE_SECONDS, op='get_chat_summary')
+def get_chat_summary(user_id, chat_id):
+    """
+    Reads only the rolling-summary fields of a chat header. Raises ChatNotFound for an unknown chat, which
+    /api/toolcall turns into a 404 before the model or any tool has run.
+    """
+    summary = chat_store.get_summary(user_id, chat_id)
+    if summary is None:
+        raise ChatNotFound(f"No chat {chat_id} for user {user_id}")
+    return summary
+
+def update_rolling_summary(user_id, chat_id, previous_summary, messages):
+    """Folds newly evicted messages into the chat's stored summary. Runs on summary_executor, off the request path."""
+    try:
+        response = call_gemini(SUMMARY_MODEL, build_summary_prompt(previous_summary, messages), required=True)
+        if response.text:
+            chat_store.set_summary(user_id, chat_id, response.text.strip(), messages[-1]['timestamp'])
+    except Exception as e:
+        print(f"🔥 Error updating summary for chat {chat_id}: {e}")
+    finally:
+        with _summaries_lock:
+            _summaries_in_flight.discard((user_id, chat_id))
+
+def schedule_summary_update(user_id, chat_id, chat_summary, evicted):
+    """Queues an incremental summary update once enough evicted messages have accumulated."""
+    pending = messages_to_summarize(evicted, chat_summary.get('summaryThrough'))
+    if len(pending) < SUMMARY_MIN_BATCH:
+        return
+    key = (user_id, chat_id)
+    with _summaries_lock:
+        if key in _summaries_in_flight:
+            return
+        _summaries_in_flight.add(key)
+    summary_executor.submit(update_rolling_summary, user_id, chat_id, chat_summary.get('summary'), pending)
+
+def get_summary_backlog(user_id, chat_id, chat_summary, chat_history):
+    """
+    Messages older than the fetched history window that the rolling summary does not cover yet, oldest first
+    and at most SUMMARY_BACKLOG_LIMIT. Only a full window can have older messages, and only one that starts
+    after 'summaryThrough' can have unsummarized ones.
+    """
+    if len(chat_history) < HISTORY_WINDOW:
+        return []
+    through = chat_summary.get('summaryThrough')
+    window_start = chat_history[0]['timestamp']
+    if through is not None and through >= window_start:
+        return []
+    return chat_store.get_messages(user_id, chat_id, limit=SUMMARY_BACKLOG_LIMIT,
+                                   since=through or SUMMARY_EPOCH, before=window_start)
+
+def assemble_contents(user_id, chat_id, request_context, chat_summary, chat_history, prompt, backlog=()):
+    """
+    Builds the Gemini contents from the most recent turns that fit HISTORY_TOKEN_BUDGET.
+    Older turns, including the 'backlog' that already fell out of the fetched window, are represented by
+    the chat's rolling summary instead of being replayed; until there are SUMMARY_MIN_BATCH of them to
+    summarize, the ones the summary does not cover yet are replayed as well.
+    """
+    evicted, kept = fit_history_to_budget(chat_history)
+    if len(backlog) >= SUMMARY_BACKLOG_LIMIT:
+        # More backlog is waiting; summarize this part alone so summaryThrough does not skip past the rest
+        evicted = list(backlog)
+    else:
+        evicted = list(backlog) + evicted
+    pending = messages_to_summarize(evicted, chat_summary.get('summaryThrough'))
+    if len(pending) < SUMMARY_MIN_BATCH:
+        kept = pending + kept
+    else:
+        schedule_summary_update(user_id, chat_id, chat_summary, pending)
+    if chat_summary.get('summary'):
+        request_context += f"\n\nSummary of the earlier conversation: {chat_summary['summary']}"
+    
+    # The 'contents' argument should be a list of alternating user/model messages
+    contents = [request_context]
+    # Then add the recent chat history
+    for message in kept:
+        role = 'user' if message['role'] == 'user' else 'model'
+        contents.append({'role': role, 'parts': [{'text': message['content']}]})
+    # Finally, add the current user prompt
+    contents.append({'role': 'user', 'parts': [{'text': prompt}]})
+    return contents
+
+def build_request_context(current_datetime, user_context):
+    """The per-request part of a tool-call prompt, shared by the sync and async routes."""
+    return f"""CURRENT TIME: {current_datetime.strftime("%H:%M:%S")}
 
 User context: {user_context}"""
 
-        tools = types.Tool(function_declarations=[schedule_meeting_function, schedule_multiple_events_function, get_time_function])
-        config = types.GenerateContentConfig(tools=[tools])
-        
-        # Get the history of the current chat to provide context to the model
-        chat_ref = db.collection('users').document(user_id).collection('chats').document(active_chat_id)
-        chat_history_snap = chat_ref.get()
-        chat_history = chat_history_snap.to_dict().get('messages', []) if chat_history_snap.exists else []
+@timed(STAGE_SECONDS, stage='build_prompt')
+def build_toolcall_contents(user_id, chat_id, prompt):
+    """Builds the Gemini contents (per-request context, chat history, prompt) and tool config for a tool-call turn."""
+    current_datetime = datetime.datetime.now()
+    config = get_daily_toolcall_setup(current_datetime)
+    user_context = memory_search_executor.submit(bind(get_user_context), user_id, prompt, chat_id)
+    
+    # Get the history of the current chat to provide context to the model.
+    # A chat created by this turn has no stored history, so both reads are skipped.
+    if chat_id:
+        chat_summary = get_chat_summary(user_id, chat_id)
+        chat_history = get_chat_messages(user_id, chat_id, limit=HISTORY_WINDOW)
+        backlog = get_summary_backlog(user_id, chat_id, chat_summary, chat_history)
+    else:
+        chat_summary, chat_history, backlog = {}, [], []
+    request_context = build_request_context(current_datetime, user_context_result(user_context))
+    contents = assemble_contents(user_id, chat_id, request_context, chat_summary, chat_history, prompt, backlog)
+
+    return contents, config
+
+@bp.route("/api/generate", methods=["POST"])
+def generate():
+    if not request.json or 'prompt' not in request.json:
+        return jsonify({"error": "Missing 'prompt' in request body"}), 400
+    prompt = request.json['prompt']
+    admission_key = g.user['uid'] if g.user else request.remote_addr
+    if wants_stream():
+        try:
+            admit_model_request(admission_key)
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
+        return stream_generate(prompt)
+
+    def compute():
+        # Cache hits cost no model call, so only a miss is admitted
+        admit_model_request(admission_key)
+        return call_gemini(GENERATE_MODEL, prompt).text
+
+    try:
+        if cache_bypassed():
+            generate_cache.record('bypass')
+            text, outcome = compute(), 'bypass'
+        else:
+            text, outcome = generate_cache.get_or_compute(cache_key(GENERATE_MODEL, prompt), compute)
+        response = jsonify({"response": text})
+        response.headers['X-Cache'] = outcome.upper()
+        return response
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@bp.route("/api/toolcall", methods=["POST"])
+def genwithtools():
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 401
+    if not request.json or 'prompt' not in request.json:
+        return jsonify({"error": "Missing 'prompt' in request body"}), 400
+
+    user_id = g.user['uid']
+    prompt = request.json['prompt']
+    chat_id = request.json.get('chat_id')  # Optional chat_id from client
+    access_token = request.json.get('accessToken')  # Google access token for calendar operations
+    invalid_request_id = request_id_error(request.json.get('request_id'))
+    if invalid_request_id:
+        return jsonify({"error": invalid_request_id}), 400
+    event_cache.bind_token(access_token, user_id)
+    try:
+        user_rate_limiter.check(user_id)
+        # Prompts answered on the local fast path never wait for a model slot
+        intent = intent_router.route(prompt)
+        if intent is None:
+            model_limiter.check()
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+
+    # The turn's model calls, tools and Calendar requests share one deadline
+    with deadline_scope(TOOLCALL_DEADLINE):
+        try:
+            # All chat writes for this turn are buffered and committed together at the end
+            turn = ChatTurnWriter(user_id, chat_id, title=prompt, turn_id=request.json.get('request_id'))
+            turn.add_message('user', prompt)
+
+            fast_response = answer_trivial_prompt(intent, access_token)
+            if fast_response is not None:
+                turn.add_message('agent', fast_response['response'])
+                turn.commit()
+                fast_response['chat_id'] = turn.chat_id
+                response = sse_response(iter([sse_event('done', fast_response)])) if wants_stream() else jsonify(fast_response)
+                response.headers['X-Fast-Path'] = intent
+                return response
+            # A retried request (same client 'request_id', or the same event proposed again) gets the original events back
+            scope = IdempotencyScope(user_id, request.json.get('request_id'))
         
-        # The 'contents' argument should be a list of alternating user/model messages
-        contents = [system_instructions]
-        # Then add the existing chat history
-        for message in chat_history:
-            role = 'user' if message['role'] == 'user' else 'model'
-            contents.append({'role': role, 'parts': [{'text': message['content']}]})
-        # Finally, add the current user prompt
-        contents.append({'role': 'user', 'parts': [{'text': prompt}]})
-
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents,
-            config=config,
-        )
+            contents, config = build_toolcall_contents(user_id, chat_id, prompt)
+            if wants_stream():
+                return stream_toolcall(turn, contents, config, access_token, scope)
+
+            response = call_gemini(TOOLCALL_MODEL, contents, config)
+            if wants_async() and response_has_function_calls(response):
+                def finish(agent_message):
+                    turn.add_message('agent', agent_message)
+                    turn.commit()
+                job = start_toolcall_job(user_id, turn.chat_id, response, access_token, contents, config, scope, finish)
+                return jsonify(job_accepted_payload(job)), 202, {"Location": f"/api/jobs/{job.id}"}
         
-        # Process and save the agent's response
-        agent_response_data = handle_gemini_response(response, access_token)
-        agent_message = agent_response_data.get('response', '')
+            # Process and save the agent's response
+            agent_response_data = handle_gemini_response(response, access_token, contents, config, scope)
+            agent_message = agent_response_data.get('response', '')
         
-        add_message_to_chat(user_id, active_chat_id, 'agent', agent_message)
+            turn.add_message('agent', agent_message)
+            turn.commit()
         
-        # Add the chat_id to the response for the client
-        agent_response_data['chat_id'] = active_chat_id
+            # Add the chat_id to the response for the client
+            agent_response_data['chat_id'] = turn.chat_id
         
-        return jsonify(agent_response_data)
+            return jsonify(agent_response_data)
         
+        except AdmissionRejected as e:
+            # Only the turn's first model call can be turned away, before any tool has run or anything was written
+            return admission_rejected_response(e)
+        except ChatNotFound as e:
+            return jsonify({"error": str(e)}), 404
+        except DeadlineExceeded as e:
+            print(f"Deadline exceeded in /api/toolcall: {e}")
+            return deadline_exceeded_response(e)
+        except Exception as e:
+            print(f"Error in /api/toolcall: {e}")  # Log the error for debugging
+            return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    """Status, progress and (once finished) result of a background job; add '?stream=1' for server-sent events."""
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 401
+    user_id = g.user['uid']
+    job = job_manager.get(job_id)
+    if job is not None and job.user_id != user_id:
+        job = None
+    try:
+        if request.args.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            if job is None and get_job_record(user_id, job_id) is None:
+                return jsonify({"error": "Job not found"}), 404
+            return stream_job(user_id, job_id, job)
+        record = job.to_dict() if job is not None else get_job_record(user_id, job_id)
+        if record is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(record), 200
     except Exception as e:
-        print(f"Error in /api/toolcall: {e}")  # Log the error for debugging
+        print(f"Error fetching job {job_id} for user {user_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/get_all_user_chats', methods=['GET'])
+@bp.route('/api/chats', methods=['GET'])
+def list_chats_route():
+    """Paginated chat summaries for the signed-in user. Messages are fetched per chat on demand."""
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        summaries, next_cursor = list_chat_summaries(g.user['uid'], limit=limit, cursor=request.args.get('cursor'))
+        return jsonify({"chats": summaries, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameters: {e}"}), 400
+    except Exception as e:
+        print(f"Error listing chats for user {g.user['uid']}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/api/chats/<chat_id>/messages', methods=['GET'])
+def chat_messages_route(chat_id):
+    """A window of one chat's messages: the last 'limit' messages, or those after the 'since' timestamp."""
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 401
+    try:
+        limit = request.args.get('limit', type=int)
+        since = request.args.get('since')
+        since = datetime.datetime.fromisoformat(since) if since else None
+        messages = get_chat_messages(g.user['uid'], chat_id, limit=limit, since=since)
+        return jsonify({"chat_id": chat_id, "messages": [serialize_message(m) for m in messages]}), 200
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'since' cursor: {e}"}), 400
+    except Exception as e:
+        print(f"Error fetching messages for chat {chat_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@bp.route('/get_all_user_chats', methods=['GET'])
 def get_all_user_chats_route():
+    """
+    Legacy listing of every chat's summary, keyed by chat ID, from the headers alone. Messages are loaded
+    per chat from /api/chats/<chat_id>/messages; prefer the paginated /api/chats for the listing itself.
+    """
     user_id = request.args.get('user_id')
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
 
     try:
         chats_data = {}
-        chats = get_user_chats(user_id)
-        for chat_id, chat_info in chats.items():
-            # Retrieve the chat document to get the messages array
-            chat_doc_ref = db.collection('users').document(user_id).collection('chats').document(chat_id)
-            chat_doc = chat_doc_ref.get()
-            messages = []
-            if chat_doc.exists and 'messages' in chat_doc.to_dict():
-                messages = chat_doc.to_dict()['messages']
-            chats_data[chat_id] = messages
+        for chat_id, chat_info in get_user_chats(user_id).items():
+            # Chats that have not been migrated yet still carry their messages inline
+            if 'messages' in chat_info:
+                chat_info = legacy_chat_header(chat_info)
+            chats_data[chat_id] = chat_summary(chat_id, chat_info)
         return jsonify(chats_data), 200
     except Exception as e:
         print(f"Error fetching all user chats for user {user_id}: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Cache sizes and hit counters are read at scrape time rather than tracked on the hot path
+CallbackGauge("urmindr_token_cache", "Firebase ID token cache size and hit/miss counts.",
+              lambda: {(key,): value for key, value in token_cache.stats().items()}, ["stat"])
+CallbackGauge("urmindr_generate_cache", "/api/generate response cache size and in-flight calls.",
+              lambda: {(key,): value for key, value in generate_cache.stats().items()}, ["stat"])
+CallbackGauge("urmindr_event_cache", "Calendar event cache users, hits and syncs.",
+              lambda: {(key,): value for key, value in event_cache.stats().items()}, ["stat"])
+CallbackGauge("urmindr_model_concurrency", "Model calls in flight and queued for a slot, and the configured limits.",
+              lambda: {(key,): value for key, value in model_limiter.stats().items()}, ["stat"])
+CallbackGauge("urmindr_jobs", "Background jobs held in memory, by status.",
+              lambda: {(status,): count for status, count in job_manager.stats().items()}, ["status"])
+CallbackGauge("urmindr_intent_router", "Prompts seen by the local intent router, answered locally, and the hit rate.",
+              lambda: {(key,): value for key, value in intent_router.stats().items()}, ["stat"])
+CallbackGauge("urmindr_memory_index", "Memory indexes open in this process, snippets queued and indexed.",
+              lambda: {(key,): value for key, value in memory_store.stats().items()}, ["stat"])
+CallbackGauge("urmindr_rate_limited_users", "Users with a rate-limit bucket in memory.",
+              lambda: {(): user_rate_limiter.stats()["users"]})
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_route():
+    """Prometheus scrape endpoint."""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Readiness probe: 503 while the warm-up thread is running or if it failed to build a client."""
+    body = {
+        "status": "ok",
+        "firestore": db.initialized if isinstance(db, LazyClient) else True,
+        "genai": client.initialized if isinstance(client, LazyClient) else True,
+        "warm_up_seconds": startup_state["warm_up_seconds"],
+    }
+    if startup_state["warming"]:
+        body["status"] = "starting"
+        return jsonify(body), 503
+    if startup_state["errors"]:
+        body.update(status="unhealthy", errors=startup_state["errors"])
+        return jsonify(body), 503
+    return jsonify(body), 200
+
+def create_app(warm_up_clients=WARM_UP):
+    """
+    Builds the Flask app around this module's routes. Clients are still created lazily;
+    warm_up_clients starts building them on a background thread right away.
+    """
+    flask_app = Flask(__name__)
+    flask_app.secret_key = os.environ.get("FLASK_SECRET", "dev-secret-change-in-prod")
+    CORS(flask_app, supports_credentials=True)
+    flask_app.register_blueprint(bp)
+    if warm_up_clients:
+        start_warm_up()
+    return flask_app
+
+app = create_app()
+
 if __name__ == "__main__":  
     app.run("localhost", 5000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,408 @@
+"""
+Async (ASGI) serving mode.
+
+The model-backed endpoints (/api/toolcall, /api/generate) are served by Quart on an event loop using
+async Firestore and the async genai client, so a worker is never parked on a multi-second LLM call.
+Every other route is delegated to the Flask app in app.py.
+
+Run with:
+    hypercorn asgi:application --bind localhost:5000
+"""
+import asyncio
+import datetime
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+from firebase_admin import firestore, firestore_async
+from google.api_core import exceptions as api_exceptions
+from quart import Quart, request, jsonify, g
+from quart_cors import cors
+
+import app as core
+from admission import AdmissionRejected
+from chat_store import ChatNotFound, new_chat_header, turn_header_update
+from deadline import DeadlineExceeded, current_deadline, deadline_scope
+from idempotency import IdempotencyScope
+from lazy import LazyClient
+from metrics import GEMINI_SECONDS
+
+CORS_ORIGINS = os.environ.get("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
+
+async_app = cors(Quart(__name__), allow_credentials=True, allow_origin=CORS_ORIGINS)
+
+
+def create_async_firestore_client():
+    core.init_firebase()
+    return firestore_async.client()
+
+
+# Built on first use, like the sync clients in app.py
+adb = LazyClient("async firestore", create_async_firestore_client)
+flask_app = WsgiToAsgi(core.app)
+
+ASYNC_PATHS = {"/api/toolcall", "/api/generate"}
+
+# Model calls for /api/generate keyed by cache key, so concurrent duplicates share one call
+_generate_in_flight = {}
+
+
+# With another chat store (CHAT_STORE=sqlite) the chat functions below run app.chat_store on worker threads
+NATIVE_FIRESTORE = core.CHAT_STORE == "firestore"
+
+
+async def application(scope, receive, send):
+    """Routes the async endpoints (and lifespan events) to Quart and everything else to Flask."""
+    if scope["type"] == "lifespan" or scope.get("path") in ASYNC_PATHS:
+        await async_app(scope, receive, send)
+    else:
+        await flask_app(scope, receive, send)
+
+
+@async_app.before_request
+async def verify_token():
+    g.user = None
+    auth_header = request.headers.get('Authorization', '')
+    if auth_header.startswith('Bearer '):
+        id_token = auth_header.split('Bearer ')[1]
+        try:
+            decoded_token = None if core.CHECK_REVOKED else core.token_cache.get(id_token)
+            if decoded_token is None:
+                # Cache misses may fetch Google's public certs, so keep them off the event loop
+                decoded_token = await asyncio.to_thread(core.verify_id_token_cached, id_token, core.CHECK_REVOKED)
+            g.user = decoded_token
+        except Exception as e:
+            print(f"🔥 Error verifying token: {e}")
+
+
+# --- Async chat history functions (same layout as app.py) ---
+def get_async_chat_ref(user_id, chat_id):
+    return adb.collection('users').document(user_id).collection('chats').document(chat_id)
+
+
+async def commit_turn(turn):
+    """
+    Async counterpart of app.ChatTurnWriter.commit: the turn's messages (and a new chat's header) in one batch,
+    rejected as a whole if the turn was already saved. Returns False for a replayed turn.
+    """
+    if not NATIVE_FIRESTORE:
+        return await asyncio.to_thread(turn.commit)
+    if not turn.messages:
+        return True
+    messages = turn.message_items()
+    chat_ref = get_async_chat_ref(turn.user_id, turn.chat_id)
+    batch = adb.batch()
+    for message_id, message in messages:
+        batch.create(chat_ref.collection('messages').document(message_id), message)
+    if turn.new_chat:
+        batch.create(chat_ref, new_chat_header([message for _, message in messages], turn.title))
+    else:
+        batch.update(chat_ref, turn_header_update([message for _, message in messages]))
+    try:
+        await batch.commit()
+    except api_exceptions.AlreadyExists:
+        print(f"Turn {turn.turn_id} was already saved to chat {turn.chat_id}, skipping")
+        return False
+    except api_exceptions.NotFound:
+        raise ChatNotFound(f"No chat {turn.chat_id} for user {turn.user_id}")
+    turn.remember()
+    return True
+
+
+async def get_chat_history(user_id, chat_id, before, limit=core.HISTORY_WINDOW):
+    """The last 'limit' messages strictly before 'before', oldest first."""
+    if chat_id is None:
+        return []
+    if not NATIVE_FIRESTORE:
+        return await asyncio.to_thread(core.chat_store.get_messages, user_id, chat_id, limit, None, before)
+    await asyncio.to_thread(core.ensure_chat_migrated, user_id, chat_id)
+    query = (get_async_chat_ref(user_id, chat_id).collection('messages')
+             .order_by('timestamp', direction=firestore.Query.DESCENDING)
+             .start_after({'timestamp': before})
+             .limit(limit))
+    messages = [doc.to_dict() async for doc in query.stream()]
+    messages.reverse()
+    return messages
+
+
+async def get_chat_summary(user_id, chat_id):
+    """As app.get_chat_summary: raises ChatNotFound for an unknown chat."""
+    if chat_id is None:
+        return {}
+    if not NATIVE_FIRESTORE:
+        return await asyncio.to_thread(core.get_chat_summary, user_id, chat_id)
+    chat_snap = await get_async_chat_ref(user_id, chat_id).get(field_paths=['summary', 'summaryThrough'])
+    if not chat_snap.exists:
+        raise ChatNotFound(f"No chat {chat_id} for user {user_id}")
+    return chat_snap.to_dict() or {}
+
+
+async def get_user_context(user_id, prompt, chat_id):
+    """core.get_user_context on a worker thread, which carries the deadline; NO_MEMORIES if it runs out of time."""
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(core.get_user_context, user_id, prompt, chat_id),
+                                      core.time_left(core.EMBEDDING_TIMEOUT))
+    except asyncio.TimeoutError:
+        print("🔥 Memory search timed out, continuing without memories")
+        return core.NO_MEMORIES
+
+
+def wants_stream(body):
+    return bool(body.get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def wants_async(body):
+    return bool(body.get('async')) or 'respond-async' in request.headers.get('Prefer', '')
+
+
+def sse_response(events):
+    return events, 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    }
+
+
+async def single_event(event, data):
+    yield core.sse_event(event, data).encode()
+
+
+@async_app.route("/api/generate", methods=["POST"])
+async def generate():
+    body = await request.get_json(silent=True)
+    if not body or 'prompt' not in body:
+        return jsonify({"error": "Missing 'prompt' in request body"}), 400
+    admission_key = g.user['uid'] if g.user else request.remote_addr
+    if wants_stream(body):
+        try:
+            core.admit_model_request(admission_key)
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
+        return sse_response(stream_generate(body['prompt']))
+    try:
+        bypass = 'no-cache' in request.headers.get('Cache-Control', '') or bool(request.headers.get('X-Cache-Bypass'))
+        if bypass:
+            core.generate_cache.record('bypass')
+            core.admit_model_request(admission_key)
+            text, outcome = await generate_text(body['prompt']), 'bypass'
+        else:
+            text, outcome = await generate_cached(body['prompt'], admission_key)
+        return jsonify({"response": text}), 200, {'X-Cache': outcome.upper()}
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def admission_rejected_response(e):
+    return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+
+
+async def generate_text(prompt):
+    # Model calls share app.model_limiter's slots with the sync routes
+    async with core.model_limiter.async_slot():
+        with GEMINI_SECONDS.time(model=core.GENERATE_MODEL, mode='async'):
+            response = await core.client.aio.models.generate_content(model=core.GENERATE_MODEL, contents=prompt)
+    core.record_gemini_usage(core.GENERATE_MODEL, response)
+    return response.text
+
+
+async def generate_cached(prompt, admission_key):
+    """
+    Event-loop counterpart of ResponseCache.get_or_compute, sharing app.generate_cache's entries.
+    Only a miss, which costs a model call, goes through admission.
+    """
+    key = core.cache_key(core.GENERATE_MODEL, prompt)
+    text = core.generate_cache.get(key)
+    if text is not None:
+        core.generate_cache.record('hit')
+        return text, 'hit'
+    in_flight = _generate_in_flight.get(key)
+    if in_flight is not None:
+        core.generate_cache.record('coalesced')
+        return await asyncio.shield(in_flight), 'coalesced'
+    core.generate_cache.record('miss')
+    core.admit_model_request(admission_key)
+    in_flight = _generate_in_flight[key] = asyncio.ensure_future(generate_text(prompt))
+    try:
+        text = await asyncio.shield(in_flight)
+        core.generate_cache.put(key, text)
+        return text, 'miss'
+    finally:
+        _generate_in_flight.pop(key, None)
+
+
+@async_app.route("/api/toolcall", methods=["POST"])
+async def genwithtools():
+    if not g.user:
+        return jsonify({"error": "Unauthorized"}), 401
+    body = await request.get_json(silent=True)
+    if not body or 'prompt' not in body:
+        return jsonify({"error": "Missing 'prompt' in request body"}), 400
+
+    user_id = g.user['uid']
+    prompt = body['prompt']
+    chat_id = body.get('chat_id')
+    access_token = body.get('accessToken')
+    invalid_request_id = core.request_id_error(body.get('request_id'))
+    if invalid_request_id:
+        return jsonify({"error": invalid_request_id}), 400
+    scope = IdempotencyScope(user_id, body.get('request_id'))
+    core.event_cache.bind_token(access_token, user_id)
+    try:
+        core.user_rate_limiter.check(user_id)
+        # Prompts answered on the local fast path never wait for a model slot
+        intent = core.intent_router.route(prompt)
+        if intent is None:
+            core.model_limiter.check()
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+
+    # Same deadline as the sync route; asyncio.to_thread carries it into the tool loop
+    with deadline_scope(core.TOOLCALL_DEADLINE):
+        try:
+            # As in the sync route, the turn's chat writes are buffered and committed together at the end
+            turn = core.ChatTurnWriter(user_id, chat_id, title=prompt, turn_id=body.get('request_id'))
+            turn.add_message('user', prompt)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            if intent is not None:
+                fast_response = await asyncio.to_thread(core.answer_trivial_prompt, intent, access_token)
+                if fast_response is not None:
+                    turn.add_message('agent', fast_response['response'])
+                    await commit_turn(turn)
+                    fast_response['chat_id'] = turn.chat_id
+                    if wants_stream(body):
+                        events, status, headers = sse_response(single_event('done', fast_response))
+                        return events, status, dict(headers, **{'X-Fast-Path': intent})
+                    return jsonify(fast_response), 200, {'X-Fast-Path': intent}
+
+            local_now = datetime.datetime.now()
+            # Loading history and resolving context are independent, so overlap them
+            chat_history, chat_summary, user_context, config = await asyncio.gather(
+                get_chat_history(user_id, chat_id, before=now),
+                get_chat_summary(user_id, chat_id),
+                get_user_context(user_id, prompt, chat_id),
+                asyncio.to_thread(core.get_daily_toolcall_setup, local_now),
+            )
+            backlog = await asyncio.to_thread(core.get_summary_backlog, user_id, chat_id, chat_summary, chat_history)
+            request_context = core.build_request_context(local_now, user_context)
+            contents = core.assemble_contents(user_id, chat_id, request_context, chat_summary, chat_history, prompt,
+                                              backlog)
+            if wants_stream(body):
+                return sse_response(stream_toolcall(turn, contents, config, access_token, scope, current_deadline()))
+
+            response = await generate_toolcall(contents, config)
+
+            if wants_async(body) and core.response_has_function_calls(response):
+                # The job runs on app.job_manager's threads, so it commits the turn with the sync chat store
+                def finish(agent_message):
+                    turn.add_message('agent', agent_message)
+                    turn.commit()
+                job = core.start_toolcall_job(user_id, turn.chat_id, response, access_token, contents, config, scope, finish)
+                return jsonify(core.job_accepted_payload(job)), 202, {"Location": f"/api/jobs/{job.id}"}
+
+            # Tool handlers use the shared sync Calendar client, so the tool loop runs off the event loop
+            agent_response_data = await asyncio.to_thread(core.handle_gemini_response, response, access_token, contents, config, scope)
+            turn.add_message('agent', agent_response_data.get('response', ''))
+            await commit_turn(turn)
+
+            agent_response_data['chat_id'] = turn.chat_id
+            return jsonify(agent_response_data)
+
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
+        except ChatNotFound as e:
+            return jsonify({"error": str(e)}), 404
+        except DeadlineExceeded as e:
+            print(f"Deadline exceeded in async /api/toolcall: {e}")
+            return jsonify({"error": str(e)}), 504
+        except Exception as e:
+            print(f"Error in async /api/toolcall: {e}")
+            return jsonify({"error": str(e)}), 500
+
+
+async def generate_toolcall(contents, config):
+    """
+    The turn's first model call under the request deadline, with app.plan_model_call's timeout and fallback model.
+    Hedging (app.model_hedger) only applies to the sync routes.
+    """
+    model, config, timeout = core.plan_model_call(core.TOOLCALL_MODEL, config)
+    async with core.model_limiter.async_slot():
+        with GEMINI_SECONDS.time(model=model, mode='async'):
+            try:
+                response = await asyncio.wait_for(
+                    core.client.aio.models.generate_content(model=model, contents=contents, config=config), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"No answer from {model} within {timeout:.1f}s")
+    core.record_gemini_usage(model, response)
+    return response
+
+
+async def stream_generate(prompt):
+    try:
+        text_parts = []
+        async with core.model_limiter.async_slot(required=True):
+            async for chunk in await core.client.aio.models.generate_content_stream(model=core.GENERATE_MODEL, contents=prompt):
+                if chunk.text:
+                    text_parts.append(chunk.text)
+                    yield core.sse_event('token', {'text': chunk.text}).encode()
+        yield core.sse_event('done', {'response': ''.join(text_parts)}).encode()
+    except Exception as e:
+        yield core.sse_event('error', {'error': str(e)}).encode()
+
+
+async def stream_toolcall(turn, contents, config, access_token, scope=None, deadline=None):
+    """Async counterpart of app.stream_toolcall, emitting the same events and running the same tool loop."""
+    # Iterated after the route has returned, so the request's deadline is passed back in
+    with deadline_scope(deadline):
+        async for event in toolcall_events(turn, contents, config, access_token, scope):
+            yield event
+
+
+async def toolcall_events(turn, contents, config, access_token, scope):
+    try:
+        started = time.monotonic()
+        tool_calls = []
+        text = ""
+        for step in range(1, core.MAX_TOOL_STEPS + 1):
+            parts = []
+            model, step_config, _ = core.plan_model_call(core.TOOLCALL_MODEL, config)
+            async with core.model_limiter.async_slot(required=True):
+                async for chunk in await core.client.aio.models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=step_config,
+                ):
+                    for part in core.chunk_parts(chunk):
+                        parts.append(part)
+                        if part.function_call:
+                            yield core.sse_event('function_call', {
+                                'name': part.function_call.name,
+                                'args': dict(part.function_call.args or {})
+                            }).encode()
+                        elif part.text:
+                            yield core.sse_event('token', {'text': part.text}).encode()
+
+            function_calls, text = core.split_parts(parts)
+            if not function_calls:
+                break
+            results = await asyncio.to_thread(core.execute_function_calls, function_calls, access_token, scope)
+            for function_call, result in zip(function_calls, results):
+                tool_calls.append({'name': function_call.name, 'args': dict(function_call.args or {}), 'result': result})
+                yield core.sse_event('function_result', {'name': function_call.name, 'result': result}).encode()
+            text = ""
+            if time.monotonic() - started >= core.TOOL_TIME_BUDGET or core.deadline_near():
+                break
+            contents.append(core.types.Content(role='model', parts=parts))
+            contents.append(core.function_response_content(function_calls, results))
+
+        if not tool_calls and not text:
+            text = "Empty response from the model."
+        agent_response_data = core.build_agent_response(tool_calls, text)
+        turn.add_message('agent', agent_response_data.get('response', ''))
+        await commit_turn(turn)
+        agent_response_data['chat_id'] = turn.chat_id
+        yield core.sse_event('done', agent_response_data).encode()
+    except Exception as e:
+        print(f"Error streaming async /api/toolcall: {e}")
+        yield core.sse_event('error', {'error': str(e)}).encode()
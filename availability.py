@@ -0,0 +1,83 @@
+"""
+Conflict detection for proposed calendar events.
+
+The user's busy time (from one freeBusy call) and the events accepted so far in a plan are kept in a
+BusyIndex: sorted, non-overlapping intervals searched with bisect. Building it from m busy intervals is
+O(m log m) and each proposal is checked (and, if needed, shifted) with binary searches, so a plan of
+n events costs O((n + m) log(n + m)) before a single insert is sent.
+"""
+import datetime
+from bisect import bisect_left, bisect_right
+
+EXISTING_EVENT = "an existing event"
+
+
+def parse_rfc3339(value):
+    """Parses a Calendar API timestamp to a naive UTC datetime, matching how app.py builds event times."""
+    moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def busy_intervals(free_busy_response, calendar_id="primary"):
+    """(start, end, label) tuples from a freeBusy response body."""
+    calendar = free_busy_response.get("calendars", {}).get(calendar_id, {})
+    if calendar.get("errors"):
+        raise ValueError(f"freeBusy failed for {calendar_id}: {calendar['errors']}")
+    return [(parse_rfc3339(busy["start"]), parse_rfc3339(busy["end"]), EXISTING_EVENT)
+            for busy in calendar.get("busy", [])]
+
+
+class BusyIndex:
+    """
+    Interval index over busy time. Overlapping or touching intervals are merged on insert, so the
+    start and end lists stay sorted together and every lookup is a binary search. Each merged interval
+    remembers the labels of what it covers, for reporting what a proposal collides with.
+    """
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        self._labels = []
+        for start, end, label in sorted(intervals, key=lambda interval: interval[:2]):
+            self.add(start, end, label)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def conflicts(self, start, end):
+        """Labels of the busy intervals overlapping [start, end)."""
+        labels = []
+        index = bisect_right(self._ends, start)
+        while index < len(self._starts) and self._starts[index] < end:
+            for label in self._labels[index]:
+                if label not in labels:
+                    labels.append(label)
+            index += 1
+        return labels
+
+    def add(self, start, end, label):
+        """Marks [start, end) busy, merging it with any intervals it overlaps or touches."""
+        first = bisect_left(self._ends, start)
+        last = bisect_right(self._starts, end)
+        if first < last:
+            start = min(start, self._starts[first])
+            end = max(end, self._ends[last - 1])
+            labels = [label for labels in self._labels[first:last] for label in labels]
+        else:
+            labels = []
+        labels.append(label)
+        self._starts[first:last] = [start]
+        self._ends[first:last] = [end]
+        self._labels[first:last] = [labels]
+
+    def next_free(self, start, duration, latest_end):
+        """The earliest start at or after 'start' with 'duration' free, ending by 'latest_end'; None if there is none."""
+        candidate = start
+        while candidate + duration <= latest_end:
+            index = bisect_right(self._ends, candidate)
+            if index == len(self._starts) or self._starts[index] >= candidate + duration:
+                return candidate
+            candidate = self._ends[index]
+        return None
@@ -0,0 +1,440 @@
+"""
+Local stand-ins for the Google services app.py talks to, used by the load-test harness:
+an in-memory Firestore, a scripted Gemini client and a Google Calendar HTTP stub.
+Each one counts its operations so benchmark runs can report storage and API usage.
+"""
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.genai import types
+
+
+# --- In-memory Firestore ---
+class FakeSnapshot:
+    def __init__(self, path, data):
+        self.id = path[-1]
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeFirestore:
+    """
+    Implements the subset of the Firestore client used by app.py: documents, subcollections, batches,
+    projections, ordering, start_after cursors and limits. 'latency' is added to every round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.ops = Counter()
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        return FakeCollection(self, (name,))
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def _apply(self, kind, path, data):
+        if kind == "create":
+            self._docs[path] = dict(data)
+        elif kind == "set":
+            self._docs[path] = dict(data)
+        elif kind == "update":
+            if path not in self._docs:
+                raise NotFound(f"No document to update: {'/'.join(path)}")
+            current = self._docs[path]
+            for key, value in data.items():
+                if value is firestore.DELETE_FIELD:
+                    current.pop(key, None)
+                elif isinstance(value, firestore.Increment):
+                    current[key] = current.get(key, 0) + value.value
+                else:
+                    current[key] = value
+
+    def _check(self, kind, path):
+        if kind == "create" and path in self._docs:
+            raise AlreadyExists(f"Document already exists: {'/'.join(path)}")
+
+    def _children(self, collection_path):
+        depth = len(collection_path) + 1
+        return [(path, data) for path, data in self._docs.items()
+                if len(path) == depth and path[:-1] == collection_path]
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self._path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return FakeCollection(self._db, self._path + (name,))
+
+    def get(self, field_paths=None):
+        self._db._round_trip()
+        with self._db._lock:
+            self._db.ops["reads"] += 1
+            data = self._db._docs.get(self._path)
+            if data is not None and field_paths:
+                data = {key: data[key] for key in field_paths if key in data}
+            return FakeSnapshot(self._path, dict(data) if data is not None else None)
+
+    def _write(self, kind, data):
+        self._db._round_trip()
+        with self._db._lock:
+            self._db.ops["writes"] += 1
+            self._db._check(kind, self._path)
+            self._db._apply(kind, self._path, data)
+
+    def set(self, data):
+        self._write("set", data)
+
+    def create(self, data):
+        self._write("create", data)
+
+    def update(self, data):
+        self._write("update", data)
+
+
+class FakeQuery:
+    def __init__(self, db, path, fields=None, orders=(), cursor=None, end_cursor=None, limit=None):
+        self._db = db
+        self._path = path
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._cursor = cursor
+        self._end_cursor = end_cursor
+        self._limit = limit
+
+    def _copy(self, **changes):
+        state = dict(fields=self._fields, orders=self._orders, cursor=self._cursor, end_cursor=self._end_cursor,
+                     limit=self._limit)
+        state.update(changes)
+        return FakeQuery(self._db, self._path, **state)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def start_after(self, values):
+        return self._copy(cursor=values)
+
+    def end_before(self, values):
+        return self._copy(end_cursor=values)
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def stream(self):
+        self._db._round_trip()
+        with self._db._lock:
+            rows = self._db._children(self._path)
+            for field, direction in reversed(self._orders):
+                rows = [row for row in rows if field in row[1]]
+                rows.sort(key=lambda row: row[1][field], reverse=direction == firestore.Query.DESCENDING)
+            if self._cursor and self._orders:
+                field, direction = self._orders[0]
+                bound = self._cursor[field]
+                if direction == firestore.Query.DESCENDING:
+                    rows = [row for row in rows if row[1][field] < bound]
+                else:
+                    rows = [row for row in rows if row[1][field] > bound]
+            if self._end_cursor and self._orders:
+                field, direction = self._orders[0]
+                bound = self._end_cursor[field]
+                if direction == firestore.Query.DESCENDING:
+                    rows = [row for row in rows if row[1][field] > bound]
+                else:
+                    rows = [row for row in rows if row[1][field] < bound]
+            if self._limit is not None:
+                rows = rows[:self._limit]
+            # Firestore bills a minimum of one read per query
+            self._db.ops["reads"] += max(len(rows), 1)
+            self._db.ops["queries"] += 1
+            snapshots = []
+            for path, data in rows:
+                if self._fields is not None:
+                    data = {key: data[key] for key in self._fields if key in data}
+                snapshots.append(FakeSnapshot(path, dict(data)))
+        return iter(snapshots)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+
+    def document(self, document_id=None):
+        return FakeDocument(self._db, self._path + (document_id or uuid.uuid4().hex,))
+
+    def list_documents(self):
+        depth = len(self._path) + 1
+        with self._db._lock:
+            ids = {path[len(self._path)] for path in self._db._docs
+                   if len(path) >= depth and path[:len(self._path)] == self._path}
+        return [self.document(document_id) for document_id in sorted(ids)]
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, ref, data):
+        self._writes.append(("set", ref._path, data))
+
+    def create(self, ref, data):
+        self._writes.append(("create", ref._path, data))
+
+    def update(self, ref, data):
+        self._writes.append(("update", ref._path, data))
+
+    def commit(self):
+        self._db._round_trip()
+        with self._db._lock:
+            # Validate every precondition first so the batch stays atomic
+            for kind, path, _ in self._writes:
+                self._db._check(kind, path)
+            for kind, path, data in self._writes:
+                self._db._apply(kind, path, data)
+            self._db.ops["writes"] += len(self._writes)
+            self._db.ops["commits"] += 1
+
+
+# --- Scripted Gemini ---
+class FakeGemini:
+    """
+    Stands in for genai.Client(). Each call sleeps for 'latency' (+/- 'jitter') seconds, or 'slow_latency' for a
+    'slow_ratio' share of calls (a tail to measure hedging against), and then either
+    answers in text or, with probability 'function_call_ratio', calls schedule_multiple_events with
+    'events_per_call' future events. A turn that follows a function response always answers in text.
+    """
+
+    def __init__(self, latency=0.8, jitter=0.2, function_call_ratio=0.5, events_per_call=5, seed=0,
+                 slow_ratio=0.0, slow_latency=5.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.function_call_ratio = function_call_ratio
+        self.events_per_call = events_per_call
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches()
+
+    def _sleep(self):
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            if self._random.random() < self.slow_ratio:
+                delay = self.slow_latency
+        time.sleep(delay)
+
+    def _wants_function_call(self, contents):
+        if isinstance(contents, str):
+            return False
+        last = contents[-1]
+        if isinstance(last, types.Content) and any(part.function_response for part in last.parts or []):
+            return False
+        with self._lock:
+            return self._random.random() < self.function_call_ratio
+
+    def _planned_events(self):
+        start = datetime.date.today() + datetime.timedelta(days=1)
+        return [{
+            "topic": f"Benchmark task {index + 1}",
+            "date": (start + datetime.timedelta(days=index // 4)).isoformat(),
+            "time": f"{9 + 2 * (index % 4):02d}:00",
+            "duration_hours": 1,
+        } for index in range(self.events_per_call)]
+
+    def _response(self, model, contents):
+        self.calls[model] += 1
+        if self._wants_function_call(contents):
+            part = types.Part(function_call=types.FunctionCall(
+                name="schedule_multiple_events", args={"events": self._planned_events()}))
+        else:
+            part = types.Part(text="Here is your plan. I've taken care of it, quack!")
+        prompt_tokens = sum(len(str(item)) for item in contents) // 4 if not isinstance(contents, str) else len(contents) // 4
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens, candidates_token_count=20),
+        )
+
+
+class _FakeModels:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def generate_content(self, model, contents, config=None):
+        self._fake._sleep()
+        return self._fake._response(model, contents)
+
+    def embed_content(self, model, contents, config=None):
+        """Hashed bag-of-words vectors, so texts sharing words come out similar."""
+        time.sleep(self._fake.latency / 4)
+        self._fake.calls[model] += 1
+        dim = (config.output_dimensionality if config else None) or 768
+        embeddings = []
+        for text in ([contents] if isinstance(contents, str) else contents):
+            values = [0.0] * dim
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                values[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+            embeddings.append(types.ContentEmbedding(values=values))
+        return types.EmbedContentResponse(embeddings=embeddings)
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self._fake._response(model, contents)
+        part = response.candidates[0].content.parts[0]
+        if part.function_call:
+            self._fake._sleep()
+            yield response
+            return
+        # Spread the latency over a handful of text chunks
+        words = part.text.split(" ")
+        for index, word in enumerate(words):
+            time.sleep(self._fake.latency / len(words))
+            yield types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(
+                role="model", parts=[types.Part(text=word + (" " if index < len(words) - 1 else ""))]))])
+
+
+class _FakeCaches:
+    def create(self, model, config=None):
+        raise RuntimeError("context caching is not available in the benchmark")
+
+
+# --- Google Calendar HTTP stub ---
+class CalendarStub:
+    """
+    Serves the Calendar v3 events list/insert and freeBusy endpoints on localhost, including syncToken deltas.
+    Events are stored per access token; 'latency' is added to every request.
+    """
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.requests = Counter()
+        self.events = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/calendar/v3"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _find(self, token):
+                event_id = urlparse(self.path).path.rsplit("/events/", 1)[-1]
+                return next((event for event in stub.events.get(token, []) if event["id"] == event_id), None)
+
+            def do_GET(self):
+                time.sleep(stub.latency)
+                query = parse_qs(urlparse(self.path).query)
+                token = self.headers.get("Authorization", "")
+                if "/events/" in urlparse(self.path).path:
+                    with stub.lock:
+                        stub.requests["get"] += 1
+                        event = self._find(token)
+                    self._reply(200, event) if event else self._reply(404, {"error": {"code": 404}})
+                    return
+                with stub.lock:
+                    stub.requests["list"] += 1
+                    events = stub.events.get(token, [])
+                    sync_token = query.get("syncToken", [None])[0]
+                    items = events[int(sync_token):] if sync_token else list(events)
+                    self._reply(200, {"items": items, "nextSyncToken": str(len(events))})
+
+            def do_POST(self):
+                time.sleep(stub.latency)
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                token = self.headers.get("Authorization", "")
+                if urlparse(self.path).path.endswith("/freeBusy"):
+                    self._free_busy(token, body)
+                    return
+                event = body
+                event.setdefault("id", uuid.uuid4().hex)
+                event["status"] = "confirmed"
+                with stub.lock:
+                    stub.requests["insert"] += 1
+                    # Client-specified IDs are unique per calendar, as in the real API
+                    duplicate = any(existing["id"] == event["id"] for existing in stub.events.get(token, []))
+                    if not duplicate:
+                        stub.events.setdefault(token, []).append(event)
+                if duplicate:
+                    self._reply(409, {"error": {"code": 409, "message": "The requested identifier already exists."}})
+                    return
+                self._reply(200, event)
+
+            def do_PATCH(self):
+                time.sleep(stub.latency)
+                length = int(self.headers.get("Content-Length", 0))
+                changes = json.loads(self.rfile.read(length) or b"{}")
+                token = self.headers.get("Authorization", "")
+                with stub.lock:
+                    stub.requests["patch"] += 1
+                    event = self._find(token)
+                    if event:
+                        event.update(changes)
+                self._reply(200, event) if event else self._reply(404, {"error": {"code": 404}})
+
+            def _free_busy(self, token, body):
+                def utc(value):
+                    moment = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+                    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
+
+                time_min, time_max = utc(body["timeMin"]), utc(body["timeMax"])
+                with stub.lock:
+                    stub.requests["freebusy"] += 1
+                    busy = [{"start": utc(event["start"]["dateTime"]).isoformat(),
+                             "end": utc(event["end"]["dateTime"]).isoformat()}
+                            for event in stub.events.get(token, [])
+                            if event.get("status") != "cancelled"
+                            and utc(event["start"]["dateTime"]) < time_max and utc(event["end"]["dateTime"]) > time_min]
+                self._reply(200, {"calendars": {"primary": {"busy": busy}}})
+
+        return Handler
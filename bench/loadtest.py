@@ -0,0 +1,232 @@
+"""
+Offline load test for app.py against local fakes (see bench/fakes.py).
+
+Runs the Flask app in-process on a threaded server, drives /api/toolcall, /api/cal/events and
+/get_all_user_chats at a fixed concurrency and writes p50/p95/p99 latency, RPS, error counts and
+Firestore/Gemini/Calendar operation counts to a JSON file.
+
+Usage:
+    python -m bench.loadtest --concurrency 16 --requests 200 --output bench/results.json
+    python -m bench.loadtest --baseline bench/baseline.json --tolerance 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Give app.py harmless settings before importing it; its real clients are never built since the fakes replace them
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_CONTEXT_CACHE", "false")
+os.environ.setdefault("WARM_UP", "false")
+# Simulated users send far faster than real ones; the global model limit still applies
+os.environ.setdefault("USER_RATE_PER_MINUTE", "0")
+# Each run starts with empty memory indexes
+os.environ.setdefault("MEMORY_DIR", tempfile.mkdtemp(prefix="urmindr-memory-"))
+os.environ.setdefault("CHAT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="urmindr-chats-"), "chats.sqlite3"))
+
+from bench.fakes import FakeFirestore, FakeGemini, CalendarStub  # noqa: E402
+
+ENDPOINTS = ("toolcall", "cal_events", "get_all_user_chats")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def install_fakes(args):
+    """Imports app.py and swaps its Firestore, Gemini, auth and Calendar dependencies for local fakes."""
+    calendar_stub = CalendarStub(latency=args.calendar_latency).start()
+    os.environ["CALENDAR_API_BASE"] = calendar_stub.base_url
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as core
+    fake_db = FakeFirestore(latency=args.firestore_latency)
+    fake_gemini = FakeGemini(latency=args.gemini_latency, jitter=args.gemini_jitter,
+                             function_call_ratio=args.function_call_ratio, events_per_call=args.events_per_call,
+                             slow_ratio=args.gemini_slow_ratio, slow_latency=args.gemini_slow_latency)
+    core.db = fake_db
+    core.client = fake_gemini
+    core.calendar_client.base_url = calendar_stub.base_url
+    # Bearer tokens are 'bench-<uid>' and always valid for an hour
+    core.auth.verify_id_token = lambda token, check_revoked=False: {
+        "uid": token.removeprefix("bench-"), "exp": time.time() + 3600}
+    return core, fake_db, fake_gemini, calendar_stub
+
+
+def start_server(flask_app, verbose=False):
+    from werkzeug.serving import make_server
+    if not verbose:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+class Driver:
+    """Issues requests for one endpoint; each simulated user keeps its own chat going."""
+
+    def __init__(self, base_url, users):
+        self.base_url = base_url
+        self.users = [f"user{index}" for index in range(users)]
+        self.chat_ids = {}
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def call(self, endpoint, index):
+        uid = self.users[index % len(self.users)]
+        headers = {"Authorization": f"Bearer bench-{uid}"}
+        access_token = f"google-{uid}"
+        if endpoint == "toolcall":
+            body = {"prompt": f"Plan my week, request {index}", "accessToken": access_token}
+            if uid in self.chat_ids:
+                body["chat_id"] = self.chat_ids[uid]
+            response = self.session().post(f"{self.base_url}/api/toolcall", json=body, headers=headers)
+            if response.ok:
+                self.chat_ids[uid] = response.json().get("chat_id")
+        elif endpoint == "cal_events":
+            response = self.session().post(f"{self.base_url}/api/cal/events", json={"accessToken": access_token},
+                                           headers=headers)
+        else:
+            response = self.session().get(f"{self.base_url}/get_all_user_chats", params={"user_id": uid},
+                                          headers=headers)
+        return response.status_code
+
+
+def run_endpoint(driver, endpoint, total, concurrency):
+    latencies = []
+    errors = 0
+    rejected = 0
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal errors, rejected
+        started = time.perf_counter()
+        try:
+            status = driver.call(endpoint, index)
+        except requests.RequestException:
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if status == 429:
+                rejected += 1
+            elif status is None or status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(total)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rejected": rejected,
+        "rps": round(total / wall, 2) if wall else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Prints per-endpoint latency/RPS changes against a baseline and returns the list of regressions."""
+    regressions = []
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (current[key] - previous[key]) / previous[key] if previous[key] else 0.0
+            marker = "  REGRESSION" if change > tolerance else ""
+            print(f"  {endpoint:20s} {key:7s} {previous[key]:9.2f} -> {current[key]:9.2f} ({change:+.1%}){marker}")
+            if marker:
+                regressions.append(f"{endpoint} {key}")
+        if previous.get("rps") and current["rps"] < previous["rps"] * (1 - tolerance):
+            print(f"  {endpoint:20s} rps     {previous['rps']:9.2f} -> {current['rps']:9.2f}  REGRESSION")
+            regressions.append(f"{endpoint} rps")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-jitter", type=float, default=0.2)
+    parser.add_argument("--gemini-slow-ratio", type=float, default=0.0, help="share of model calls that are slow")
+    parser.add_argument("--gemini-slow-latency", type=float, default=5.0)
+    parser.add_argument("--function-call-ratio", type=float, default=0.5)
+    parser.add_argument("--events-per-call", type=int, default=5)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--calendar-latency", type=float, default=0.05)
+    parser.add_argument("--chat-store", choices=("firestore", "sqlite"), default="firestore",
+                        help="chat history backend (sqlite keeps chats out of the fake Firestore)")
+    parser.add_argument("--output", default="bench/results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before failing")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's request logging")
+    args = parser.parse_args(argv)
+    os.environ["CHAT_STORE"] = args.chat_store
+
+    core, fake_db, fake_gemini, calendar_stub = install_fakes(args)
+    server, base_url = start_server(core.app, verbose=args.verbose)
+    driver = Driver(base_url, args.users)
+
+    results = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+               "endpoints": {}, "firestore_ops": {}, "gemini_calls": {}, "calendar_requests": {}}
+    try:
+        for endpoint in args.endpoints:
+            ops_before = dict(fake_db.ops)
+            gemini_before = sum(fake_gemini.calls.values())
+            calendar_before = dict(calendar_stub.requests)
+            output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                results["endpoints"][endpoint] = run_endpoint(driver, endpoint, args.requests, args.concurrency)
+            results["firestore_ops"][endpoint] = {key: value - ops_before.get(key, 0) for key, value in fake_db.ops.items()}
+            results["gemini_calls"][endpoint] = sum(fake_gemini.calls.values()) - gemini_before
+            results["calendar_requests"][endpoint] = {
+                key: value - calendar_before.get(key, 0) for key, value in calendar_stub.requests.items()}
+            summary = results["endpoints"][endpoint]
+            print(f"{endpoint:20s} rps={summary['rps']:8.2f} p50={summary['p50_ms']:8.2f}ms "
+                  f"p95={summary['p95_ms']:8.2f}ms p99={summary['p99_ms']:8.2f}ms errors={summary['errors']} "
+                  f"rejected={summary['rejected']}")
+    finally:
+        server.shutdown()
+        calendar_stub.stop()
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"🔥 {len(regressions)} regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
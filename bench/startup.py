@@ -0,0 +1,94 @@
+"""
+Cold-start benchmark for app.py.
+
+Each run starts a fresh interpreter and measures the time to import app.py, the first request
+(/healthz, no clients needed) and building the Firestore and Gemini clients (the warm-up work the
+first real request would otherwise pay). Medians over the runs are written to a JSON file.
+
+Usage:
+    python -m bench.startup --runs 5 --output bench/startup.json
+    python -m bench.startup --baseline bench/startup_baseline.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Runs inside the fresh interpreter; prints one JSON line of timings in milliseconds
+CHILD = r"""
+import contextlib, io, json, time
+started = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as core
+timings = {"import_ms": (time.perf_counter() - started) * 1000}
+
+test_client = core.app.test_client()
+started = time.perf_counter()
+test_client.get("/healthz")
+timings["first_request_ms"] = (time.perf_counter() - started) * 1000
+
+for name, lazy_client in (("firestore", core.db), ("genai", core.client)):
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            lazy_client.resolve()
+    except Exception:
+        timings[f"{name}_error"] = True
+    timings[f"{name}_init_ms"] = (time.perf_counter() - started) * 1000
+print(json.dumps(timings))
+"""
+
+TIMINGS = ("import_ms", "first_request_ms", "firestore_init_ms", "genai_init_ms")
+
+
+def run_once(env):
+    completed = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, env=env,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default="bench/startup.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before failing")
+    args = parser.parse_args(argv)
+
+    # Warm-up is disabled so the import and first-request numbers are not skewed by the background thread
+    env = dict(os.environ, WARM_UP="false")
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    results = {"runs": args.runs, "timings": {}}
+    for key in TIMINGS:
+        results["timings"][key] = round(statistics.median(run[key] for run in runs), 2)
+    results["client_errors"] = sorted({key.removesuffix("_error") for run in runs for key in run if key.endswith("_error")})
+    for key, value in results["timings"].items():
+        print(f"{key:20s} {value:9.2f} ms")
+    if results["client_errors"]:
+        print(f"Clients that failed to initialize (no credentials?): {', '.join(results['client_errors'])}")
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            previous = json.load(baseline_file).get("timings", {})
+        regressions = []
+        for key, value in results["timings"].items():
+            if previous.get(key) and value > previous[key] * (1 + args.tolerance):
+                regressions.append(key)
+                print(f"  {key:20s} {previous[key]:9.2f} -> {value:9.2f}  REGRESSION")
+        if regressions:
+            print(f"🔥 {len(regressions)} regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+        print("✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
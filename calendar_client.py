@@ -0,0 +1,140 @@
+import random
+import threading
+import time
+
+from deadline import current_deadline
+from lazy import LazyModule
+from metrics import CALENDAR_HTTP_SECONDS
+
+# requests is only imported once the first Calendar call needs a session
+requests = LazyModule("requests")
+
+CALENDAR_API_BASE = "https://www.googleapis.com/calendar/v3"
+
+# Partial-response field masks, limited to what the frontend actually renders
+EVENT_FIELDS = "id,summary,start,end,htmlLink,status"
+EVENT_LIST_FIELDS = f"items({EVENT_FIELDS}),nextPageToken"
+FREE_BUSY_FIELDS = "calendars"
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CalendarClient:
+    """
+    Shared Google Calendar HTTP client.
+    Keeps a pooled keep-alive session, applies connect/read timeouts and retries 429/5xx with jittered backoff.
+    Under a request deadline the read timeout shrinks to the time left and retries stop once a backoff would overrun it.
+    """
+
+    def __init__(self, base_url=CALENDAR_API_BASE, pool_size=10, connect_timeout=3.05, read_timeout=10,
+                 max_retries=3, backoff_base=0.25, backoff_max=4.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        """The pooled session, built on first use."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size,
+                                                            pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    # Google APIs only gzip responses when the user agent also mentions gzip
+                    session.headers.update({
+                        "Accept-Encoding": "gzip",
+                        "User-Agent": "urmindr-backend (gzip)",
+                    })
+                    self._session = session
+        return self._session
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # Full jitter: sleep anywhere between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _timeout(self, deadline):
+        if deadline is None:
+            return self.timeout
+        deadline.check("a Calendar request")
+        connect_timeout, read_timeout = self.timeout
+        return (min(connect_timeout, deadline.remaining()), min(read_timeout, deadline.remaining()))
+
+    def _sleep_before_retry(self, deadline, seconds):
+        """Sleeps before a retry; False if the deadline would pass first, so the last result should stand."""
+        if deadline is not None and seconds >= deadline.remaining():
+            return False
+        time.sleep(seconds)
+        return True
+
+    def request(self, method, path, access_token, params=None, json=None, fields=None, idempotent=None):
+        """
+        Sends a Calendar API request and returns the final requests.Response.
+        POSTs are only retried on 429 or a connect timeout, since a 5xx or read timeout may still have created the event;
+        pass idempotent=True for read-only POSTs such as freeBusy.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        headers = {"Authorization": f"Bearer {access_token}"}
+        params = dict(params or {})
+        if fields:
+            params["fields"] = fields
+        if idempotent is None:
+            idempotent = method.upper() == "GET"
+        retry_statuses = RETRY_STATUSES if idempotent else {429}
+        retry_errors = (requests.ConnectionError, requests.Timeout) if idempotent else (requests.ConnectTimeout,)
+
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            timeout = self._timeout(deadline)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, params=params, json=json,
+                                                timeout=timeout)
+            except Exception as e:
+                CALENDAR_HTTP_SECONDS.observe(time.perf_counter() - started, method=method, status="error")
+                if not isinstance(e, retry_errors) or attempt >= self.max_retries:
+                    raise
+                if not self._sleep_before_retry(deadline, self._backoff(attempt)):
+                    raise
+                attempt += 1
+                continue
+            CALENDAR_HTTP_SECONDS.observe(time.perf_counter() - started, method=method, status=response.status_code)
+            if response.status_code not in retry_statuses or attempt >= self.max_retries:
+                return response
+            if not self._sleep_before_retry(deadline, self._backoff(attempt, response)):
+                return response
+            attempt += 1
+
+    def list_events(self, access_token, params=None, fields=EVENT_LIST_FIELDS, calendar_id="primary"):
+        return self.request("GET", f"calendars/{calendar_id}/events", access_token, params=params, fields=fields)
+
+    def insert_event(self, access_token, event_data, fields=EVENT_FIELDS, calendar_id="primary"):
+        return self.request("POST", f"calendars/{calendar_id}/events", access_token, json=event_data, fields=fields)
+
+    def get_event(self, access_token, event_id, fields=EVENT_FIELDS, calendar_id="primary"):
+        return self.request("GET", f"calendars/{calendar_id}/events/{event_id}", access_token, fields=fields)
+
+    def patch_event(self, access_token, event_id, event_data, fields=EVENT_FIELDS, calendar_id="primary"):
+        # A patch sets the same fields however often it is repeated, so it is safe to retry
+        return self.request("PATCH", f"calendars/{calendar_id}/events/{event_id}", access_token, json=event_data,
+                            fields=fields, idempotent=True)
+
+    def free_busy(self, access_token, time_min, time_max, calendar_ids=("primary",)):
+        """Busy intervals for the calendars between two aware datetimes, in one request."""
+        body = {
+            "timeMin": time_min.isoformat(),
+            "timeMax": time_max.isoformat(),
+            "items": [{"id": calendar_id} for calendar_id in calendar_ids],
+        }
+        return self.request("POST", "freeBusy", access_token, json=body, fields=FREE_BUSY_FIELDS, idempotent=True)
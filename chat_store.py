@@ -0,0 +1,445 @@
+"""
+Chat persistence behind app.py's chat-history functions.
+
+ChatStore is the interface; FirestoreChatStore keeps the original layout (users/{uid}/chats/{chat_id}
+headers with a 'messages' subcollection) and SqliteChatStore keeps the same data in a local SQLite file
+in WAL mode, for on-box deployments and local benchmarking. Headers use the Firestore field names
+('title', 'lastActivity', 'messageCount', ...) and timestamps are aware UTC datetimes in both.
+transfer_chats.py moves chats between stores with export_chats() and import_chat().
+"""
+import datetime
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+from lazy import LazyModule
+
+firestore = LazyModule("firebase_admin.firestore")
+api_exceptions = LazyModule("google.api_core.exceptions")
+
+# Summary fields are kept on the header at write time so chat listings never touch messages
+CHAT_SUMMARY_FIELDS = ['title', 'lastMessagePreview', 'messageCount', 'lastActivity']
+PREVIEW_LENGTH = 120
+TITLE_LENGTH = 60
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class ChatNotFound(Exception):
+    """Messages were added to a chat that does not exist."""
+
+
+def new_chat_header(messages, title, start_time=None):
+    last_message = messages[-1] if messages else None
+    return {
+        'startTime': start_time or messages[0]['timestamp'],
+        'lastActivity': last_message['timestamp'] if last_message else start_time,
+        'messageCount': len(messages),
+        'title': (title or 'New chat')[:TITLE_LENGTH],
+        'lastMessagePreview': last_message['content'][:PREVIEW_LENGTH] if last_message else ''
+    }
+
+
+def legacy_chat_header(header):
+    """
+    A header with summary fields for a chat that still carries its messages inline, as migrating it
+    would leave them; the 'messages' array itself is dropped.
+    """
+    header = dict(header)
+    legacy_messages = header.pop('messages', None) or []
+    header['messageCount'] = header.get('messageCount', 0) + len(legacy_messages)
+    if not header.get('title'):
+        first_user_message = next((m for m in legacy_messages if m.get('role') == 'user'),
+                                  legacy_messages[0] if legacy_messages else {})
+        header['title'] = first_user_message.get('content', '')[:TITLE_LENGTH] or 'New chat'
+    legacy_activity = legacy_messages[-1].get('timestamp') if legacy_messages else header.get('startTime')
+    current_activity = header.get('lastActivity')
+    if current_activity is None or (legacy_activity is not None and legacy_activity > current_activity):
+        header['lastActivity'] = legacy_activity
+        header['lastMessagePreview'] = legacy_messages[-1].get('content', '')[:PREVIEW_LENGTH] if legacy_messages else ''
+    return header
+
+
+def turn_header_update(messages):
+    """Header fields to update when 'messages' are appended to an existing chat."""
+    last_message = messages[-1]
+    return {
+        'messageCount': firestore.Increment(len(messages)),
+        'lastActivity': last_message['timestamp'],
+        'lastMessagePreview': last_message['content'][:PREVIEW_LENGTH]
+    }
+
+
+class ChatStore(ABC):
+    """
+    Storage for chat headers and messages. Messages are dicts with 'role', 'content' and 'timestamp'
+    and are returned oldest first; writes that carry message IDs are idempotent per ID.
+    """
+
+    @abstractmethod
+    def create_chat(self, user_id, chat_id, title, now):
+        """Creates an empty chat; fails if the chat already exists."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_messages(self, user_id, chat_id, messages, new_chat=False, title=None):
+        """
+        Atomically adds (message_id, message) pairs and updates the header counters and preview, creating the
+        header first when new_chat is set. Returns False, writing nothing, if any message ID (or with new_chat,
+        the chat ID) is already taken.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_messages(self, user_id, chat_id, limit=None, since=None, before=None):
+        """
+        The last 'limit' messages (all if None) before 'before', or with 'since' the first 'limit' ones after
+        that timestamp (and before 'before').
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_chats(self, user_id):
+        """Every chat header of a user, by chat ID."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_chats(self, user_id, limit, before_activity=None):
+        """Up to 'limit' (chat_id, summary fields) pairs, most recently active first, older than 'before_activity'."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_summary(self, user_id, chat_id):
+        """The chat's rolling 'summary' and 'summaryThrough' fields; {} if there are none, None if there is no chat."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def set_summary(self, user_id, chat_id, summary, through):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_users(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def export_chats(self, user_id):
+        """Yields (chat_id, header, messages) for every chat of a user; each message carries its 'id'."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def import_chat(self, user_id, chat_id, header, messages):
+        """Writes a whole exported chat in bulk; re-importing the same chat does not duplicate messages."""
+        raise NotImplementedError
+
+
+class FirestoreChatStore(ChatStore):
+    """users/{uid}/chats/{chat_id} headers with one document per message in a 'messages' subcollection."""
+
+    def __init__(self, client):
+        # A callable returning the Firestore client, so it is only built (or swapped for a fake) when first used
+        self._client = client
+
+    def _chats(self, user_id):
+        return self._client().collection('users').document(user_id).collection('chats')
+
+    def create_chat(self, user_id, chat_id, title, now):
+        self._chats(user_id).document(chat_id).create(new_chat_header([], title, start_time=now))
+
+    def add_messages(self, user_id, chat_id, messages, new_chat=False, title=None):
+        chat_ref = self._chats(user_id).document(chat_id)
+        batch = self._client().batch()
+        for message_id, message in messages:
+            batch.create(chat_ref.collection('messages').document(message_id), message)
+        if new_chat:
+            # Fails the whole batch if the chat exists, e.g. a new chat replayed under the same ID
+            batch.create(chat_ref, new_chat_header([message for _, message in messages], title))
+        else:
+            batch.update(chat_ref, turn_header_update([message for _, message in messages]))
+        try:
+            batch.commit()
+        except api_exceptions.AlreadyExists:
+            return False
+        except api_exceptions.NotFound:
+            raise ChatNotFound(f"No chat {chat_id} for user {user_id}")
+        return True
+
+    def get_messages(self, user_id, chat_id, limit=None, since=None, before=None):
+        messages_ref = self._chats(user_id).document(chat_id).collection('messages')
+        if since is not None:
+            query = messages_ref.order_by('timestamp').start_after({'timestamp': since})
+            if before is not None:
+                query = query.end_before({'timestamp': before})
+            if limit:
+                query = query.limit(limit)
+            return [doc.to_dict() for doc in query.stream()]
+        query = messages_ref.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        if before is not None:
+            query = query.start_after({'timestamp': before})
+        if limit:
+            query = query.limit(limit)
+        messages = [doc.to_dict() for doc in query.stream()]
+        messages.reverse()
+        return messages
+
+    def get_chats(self, user_id):
+        return {chat_doc.id: chat_doc.to_dict() for chat_doc in self._chats(user_id).stream()}
+
+    def list_chats(self, user_id, limit, before_activity=None):
+        query = (self._chats(user_id)
+                 .select(CHAT_SUMMARY_FIELDS)
+                 .order_by('lastActivity', direction=firestore.Query.DESCENDING))
+        if before_activity is not None:
+            query = query.start_after({'lastActivity': before_activity})
+        return [(chat_doc.id, chat_doc.to_dict()) for chat_doc in query.limit(limit).stream()]
+
+    def get_summary(self, user_id, chat_id):
+        chat_snap = self._chats(user_id).document(chat_id).get(field_paths=['summary', 'summaryThrough'])
+        if not chat_snap.exists:
+            return None
+        return chat_snap.to_dict() or {}
+
+    def set_summary(self, user_id, chat_id, summary, through):
+        self._chats(user_id).document(chat_id).update({'summary': summary, 'summaryThrough': through})
+
+    def list_users(self):
+        return [user_ref.id for user_ref in self._client().collection('users').list_documents()]
+
+    def export_chats(self, user_id):
+        for chat_doc in self._chats(user_id).stream():
+            header = chat_doc.to_dict()
+            # Chats that were never migrated still carry their messages inline and may lack the summary fields
+            legacy_messages = header.get('messages')
+            if legacy_messages is not None:
+                messages = [dict(message, id=f"legacy-{index:06d}") for index, message in enumerate(legacy_messages)]
+                header = legacy_chat_header(header)
+            else:
+                messages = [dict(doc.to_dict(), id=doc.id)
+                            for doc in self._chats(user_id).document(chat_doc.id).collection('messages')
+                            .order_by('timestamp').stream()]
+            if header.get('lastActivity') is None:
+                # Listings are ordered by lastActivity, so a chat without one would never be paged to
+                header['lastActivity'] = messages[-1].get('timestamp') if messages else header.get('startTime')
+            yield chat_doc.id, header, messages
+
+    def import_chat(self, user_id, chat_id, header, messages):
+        chat_ref = self._chats(user_id).document(chat_id)
+        for offset in range(0, len(messages), FIRESTORE_BATCH_LIMIT):
+            batch = self._client().batch()
+            for message in messages[offset:offset + FIRESTORE_BATCH_LIMIT]:
+                batch.set(chat_ref.collection('messages').document(message['id']),
+                          {key: value for key, value in message.items() if key != 'id'})
+            batch.commit()
+        chat_ref.set(header)
+
+
+def to_micros(moment):
+    if moment is None:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return round(moment.timestamp() * 1_000_000)
+
+
+def from_micros(value):
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value / 1_000_000, tz=datetime.timezone.utc)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    user_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    last_message_preview TEXT NOT NULL DEFAULT '',
+    message_count INTEGER NOT NULL DEFAULT 0,
+    start_time INTEGER,
+    last_activity INTEGER,
+    summary TEXT,
+    summary_through INTEGER,
+    PRIMARY KEY (user_id, chat_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chats_by_activity ON chats (user_id, last_activity);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    PRIMARY KEY (user_id, chat_id, seq)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS messages_by_id ON messages (user_id, chat_id, message_id);
+"""
+
+# Fixed statement texts, so each connection's statement cache prepares them once
+CHAT_COLUMNS = ("(user_id, chat_id, title, last_message_preview, message_count, start_time, last_activity, summary, "
+                "summary_through) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+# New chats must not exist yet, like Firestore's create(); imports replace the header, like set()
+INSERT_CHAT = "INSERT INTO chats " + CHAT_COLUMNS
+REPLACE_CHAT = "INSERT OR REPLACE INTO chats " + CHAT_COLUMNS
+BUMP_CHAT = ("UPDATE chats SET message_count = message_count + ?, last_activity = ?, last_message_preview = ? "
+             "WHERE user_id = ? AND chat_id = ?")
+NEXT_SEQ = "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE user_id = ? AND chat_id = ?"
+INSERT_MESSAGE = "INSERT INTO messages (user_id, chat_id, seq, message_id, role, content, ts) VALUES (?, ?, ?, ?, ?, ?, ?)"
+IMPORT_MESSAGE = ("INSERT OR IGNORE INTO messages (user_id, chat_id, seq, message_id, role, content, ts) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)")
+MESSAGES_SINCE = ("SELECT role, content, ts FROM messages WHERE user_id = ? AND chat_id = ? AND ts > ? AND ts < ? "
+                  "ORDER BY seq LIMIT ?")
+LATEST_MESSAGES = ("SELECT role, content, ts FROM messages WHERE user_id = ? AND chat_id = ? AND ts < ? "
+                   "ORDER BY seq DESC LIMIT ?")
+ALL_MESSAGES = "SELECT message_id, role, content, ts FROM messages WHERE user_id = ? AND chat_id = ? ORDER BY seq"
+CHAT_HEADERS = ("SELECT chat_id, title, last_message_preview, message_count, start_time, last_activity, summary, "
+                "summary_through FROM chats WHERE user_id = ?")
+CHAT_PAGE = ("SELECT chat_id, title, last_message_preview, message_count, last_activity FROM chats "
+             "WHERE user_id = ? AND last_activity < ? ORDER BY last_activity DESC LIMIT ?")
+GET_SUMMARY = "SELECT summary, summary_through FROM chats WHERE user_id = ? AND chat_id = ?"
+SET_SUMMARY = "UPDATE chats SET summary = ?, summary_through = ? WHERE user_id = ? AND chat_id = ?"
+# Upper bound for 'older than' filters when there is no cursor
+MAX_MICROS = 2 ** 62
+
+
+class SqliteChatStore(ChatStore):
+    """
+    Chats in one SQLite file in WAL mode, so readers never block the writer. Each thread keeps its own
+    connection; messages are keyed by (user_id, chat_id, seq), which is also their read order.
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Autocommit mode; writes open their own transactions in _transaction()
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         cached_statements=64)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    connection.executescript(SQLITE_SCHEMA)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def create_chat(self, user_id, chat_id, title, now):
+        with self._transaction() as connection:
+            connection.execute(INSERT_CHAT, (user_id, chat_id, (title or 'New chat')[:TITLE_LENGTH], '', 0,
+                                             to_micros(now), to_micros(now), None, None))
+
+    def add_messages(self, user_id, chat_id, messages, new_chat=False, title=None):
+        last_message = messages[-1][1]
+        try:
+            with self._transaction() as connection:
+                if new_chat:
+                    header = new_chat_header([message for _, message in messages], title)
+                    connection.execute(INSERT_CHAT, (user_id, chat_id, header['title'], header['lastMessagePreview'],
+                                                     header['messageCount'], to_micros(header['startTime']),
+                                                     to_micros(header['lastActivity']), None, None))
+                elif connection.execute(BUMP_CHAT, (len(messages), to_micros(last_message['timestamp']),
+                                                    last_message['content'][:PREVIEW_LENGTH], user_id, chat_id)).rowcount == 0:
+                    raise ChatNotFound(f"No chat {chat_id} for user {user_id}")
+                seq = connection.execute(NEXT_SEQ, (user_id, chat_id)).fetchone()[0]
+                connection.executemany(INSERT_MESSAGE, [
+                    (user_id, chat_id, seq + offset, message_id, message['role'], message['content'],
+                     to_micros(message['timestamp']))
+                    for offset, (message_id, message) in enumerate(messages)
+                ])
+        except sqlite3.IntegrityError:
+            # A message ID (or new chat) that is already stored: this batch was written before
+            return False
+        return True
+
+    def get_messages(self, user_id, chat_id, limit=None, since=None, before=None):
+        connection = self._connection()
+        bound = to_micros(before) if before is not None else MAX_MICROS
+        if since is not None:
+            rows = connection.execute(MESSAGES_SINCE, (user_id, chat_id, to_micros(since), bound, limit or -1)).fetchall()
+        else:
+            rows = connection.execute(LATEST_MESSAGES, (user_id, chat_id, bound, limit or -1)).fetchall()
+            rows.reverse()
+        return [{'role': role, 'content': content, 'timestamp': from_micros(ts)} for role, content, ts in rows]
+
+    def _header(self, row):
+        _, title, preview, count, start_time, last_activity, summary, summary_through = row
+        header = {'title': title, 'lastMessagePreview': preview, 'messageCount': count,
+                  'startTime': from_micros(start_time), 'lastActivity': from_micros(last_activity)}
+        if summary is not None:
+            header.update(summary=summary, summaryThrough=from_micros(summary_through))
+        return header
+
+    def get_chats(self, user_id):
+        return {row[0]: self._header(row) for row in self._connection().execute(CHAT_HEADERS, (user_id,))}
+
+    def list_chats(self, user_id, limit, before_activity=None):
+        bound = to_micros(before_activity) if before_activity is not None else MAX_MICROS
+        rows = self._connection().execute(CHAT_PAGE, (user_id, bound, limit)).fetchall()
+        return [(chat_id, {'title': title, 'lastMessagePreview': preview, 'messageCount': count,
+                           'lastActivity': from_micros(last_activity)})
+                for chat_id, title, preview, count, last_activity in rows]
+
+    def get_summary(self, user_id, chat_id):
+        row = self._connection().execute(GET_SUMMARY, (user_id, chat_id)).fetchone()
+        if row is None:
+            return None
+        if row[0] is None:
+            return {}
+        return {'summary': row[0], 'summaryThrough': from_micros(row[1])}
+
+    def set_summary(self, user_id, chat_id, summary, through):
+        with self._transaction() as connection:
+            connection.execute(SET_SUMMARY, (summary, to_micros(through), user_id, chat_id))
+
+    def list_users(self):
+        return [row[0] for row in self._connection().execute("SELECT DISTINCT user_id FROM chats ORDER BY user_id")]
+
+    def export_chats(self, user_id):
+        connection = self._connection()
+        for row in connection.execute(CHAT_HEADERS, (user_id,)).fetchall():
+            messages = [{'id': message_id, 'role': role, 'content': content, 'timestamp': from_micros(ts)}
+                        for message_id, role, content, ts in connection.execute(ALL_MESSAGES, (user_id, row[0]))]
+            yield row[0], self._header(row), messages
+
+    def import_chat(self, user_id, chat_id, header, messages):
+        with self._transaction() as connection:
+            connection.execute(REPLACE_CHAT, (
+                user_id, chat_id, header.get('title', ''), header.get('lastMessagePreview', ''),
+                header.get('messageCount', len(messages)), to_micros(header.get('startTime')),
+                # A chat with no activity at all still sorts (last) in the listing instead of being left out
+                to_micros(header.get('lastActivity')) or 0, header.get('summary'), to_micros(header.get('summaryThrough'))))
+            seq = connection.execute(NEXT_SEQ, (user_id, chat_id)).fetchone()[0]
+            connection.executemany(IMPORT_MESSAGE, [
+                (user_id, chat_id, seq + offset, message['id'], message.get('role', ''), message.get('content', ''),
+                 to_micros(message.get('timestamp')) or 0)
+                for offset, message in enumerate(messages)
+            ])
+
+
+def create_chat_store(backend, firestore_client=None, sqlite_path=None):
+    """Builds the store named by CHAT_STORE: 'firestore' (default) or 'sqlite'."""
+    if backend == "sqlite":
+        return SqliteChatStore(sqlite_path)
+    if backend == "firestore":
+        return FirestoreChatStore(firestore_client)
+    raise ValueError(f"Unknown chat store '{backend}'; use 'firestore' or 'sqlite'")
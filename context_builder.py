@@ -0,0 +1,50 @@
+import os
+
+# Rough token estimate (~4 characters per token) plus a small per-message overhead for role markers
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 4000))
+# Evicted messages are only summarized once at least this many have accumulated
+SUMMARY_MIN_BATCH = int(os.environ.get("SUMMARY_MIN_BATCH", 6))
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def fit_history_to_budget(messages, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Splits messages (oldest first) into (evicted, kept), keeping the most recent ones that fit the token budget.
+    The newest message is always kept so the model never loses the latest turn.
+    """
+    used = 0
+    split = len(messages)
+    for index in range(len(messages) - 1, -1, -1):
+        cost = estimate_tokens(messages[index].get('content'))
+        if used + cost > budget and split < len(messages):
+            break
+        used += cost
+        split = index
+    return messages[:split], messages[split:]
+
+
+def messages_to_summarize(evicted, summary_through):
+    """The evicted messages not yet folded into the rolling summary."""
+    if summary_through is None:
+        return list(evicted)
+    return [message for message in evicted if message.get('timestamp') and message['timestamp'] > summary_through]
+
+
+def build_summary_prompt(previous_summary, messages):
+    transcript = "\n".join(f"{message.get('role')}: {message.get('content')}" for message in messages)
+    return f"""Update the running summary of a conversation between a user and a calendar planning assistant.
+Keep names, dates, times, scheduled events, decisions and open questions. Be concise (under 200 words).
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+New messages:
+{transcript}
+
+Updated summary:"""
@@ -0,0 +1,179 @@
+"""
+Per-request deadlines and hedged model calls.
+
+A request handler opens a deadline_scope; everything it calls on the same thread (and on worker threads
+it starts through bind()) can then ask how much time is left: the model calls size their HTTP timeout
+with it, the tool loop stops asking the model for more once it runs short, and the Calendar client
+caps its read timeout and gives up retrying. Code running without a deadline (background jobs, the
+rolling summaries) just sees None and falls back to its own fixed timeouts.
+
+Hedger keeps the recent latencies of each model. Once a call has been outstanding for longer than a
+chosen percentile of them, it sends one duplicate and takes whichever answer arrives first, which cuts
+the tail caused by the occasional slow response at the cost of a few percent extra calls.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from metrics import Counter
+
+DEADLINE_EVENTS = Counter("urmindr_deadline_events_total",
+                          "Requests that ran out of time or switched to the fallback model, by event.", ["event"])
+HEDGED_CALLS = Counter("urmindr_hedged_calls_total",
+                       "Duplicate model requests sent after the hedge delay, by outcome.", ["model", "outcome"])
+
+_current = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time; maps to HTTP 504."""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, what, reserve=0.0):
+        """Raises DeadlineExceeded unless more than 'reserve' seconds are left for 'what'."""
+        if self.remaining() <= reserve:
+            DEADLINE_EVENTS.inc(event="exceeded")
+            raise DeadlineExceeded(f"Request deadline of {self.seconds:g}s reached before {what}")
+
+
+def current_deadline():
+    return _current.get()
+
+
+def time_left(cap=None):
+    """Seconds left on the current deadline, at most 'cap'; just 'cap' when there is no deadline."""
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    return deadline.remaining() if cap is None else min(cap, deadline.remaining())
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Runs the block under a deadline 'seconds' from now (None or <= 0 for none), or under an existing Deadline,
+    e.g. to carry a request's deadline into the generator of a streaming response.
+    """
+    if isinstance(seconds, Deadline) or seconds is None:
+        deadline = seconds
+    else:
+        deadline = Deadline(seconds) if seconds > 0 else None
+    token = _current.set(deadline)
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def bind(func):
+    """Wraps 'func' to run under the caller's deadline, for work handed to another thread."""
+    deadline = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(deadline)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+class Hedger:
+    """
+    Runs blocking calls on a worker pool with a timeout. With 'enabled', a call still outstanding after the
+    'percentile' latency of the last 'window' calls with the same key gets one duplicate, if 'try_hedge()'
+    allows it; no hedge is sent until 'min_samples' latencies are known. The losing request is left to
+    finish in the background, since a blocking HTTP call cannot be cancelled.
+    """
+
+    def __init__(self, max_workers=16, enabled=False, percentile=0.95, min_samples=20, window=200, min_delay=0.05):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-call")
+
+    def observe(self, key, seconds):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key, fraction):
+        """The 'fraction' quantile of recent latencies for 'key', or None while there are fewer than min_samples."""
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def delay(self, key):
+        """Seconds to wait before hedging a call for 'key', or None if it should not be hedged."""
+        if not self.enabled:
+            return None
+        quantile = self.quantile(key, self.percentile)
+        return None if quantile is None else max(self.min_delay, quantile)
+
+    def _timed(self, key, func):
+        func = bind(func)
+
+        def run():
+            started = time.perf_counter()
+            result = func()
+            self.observe(key, time.perf_counter() - started)
+            return result
+        return run
+
+    def call(self, key, func, timeout=None, try_hedge=lambda: True):
+        """
+        Returns func()'s result from the first attempt that succeeds; raises DeadlineExceeded after 'timeout'
+        seconds, or the first attempt's error if every attempt fails.
+        """
+        started = time.monotonic()
+        pending = {self._executor.submit(self._timed(key, func))}
+        hedge_at = self.delay(key)
+        hedged = None
+        errors = []
+        while pending:
+            waited = time.monotonic() - started
+            wait_for = None if timeout is None else max(0.0, timeout - waited)
+            if hedged is None and hedge_at is not None:
+                wait_for = max(0.0, hedge_at - waited) if wait_for is None else min(wait_for, max(0.0, hedge_at - waited))
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if hedged is not None:
+                        HEDGED_CALLS.inc(model=key, outcome="won" if future is hedged else "lost")
+                    return future.result()
+                errors.append(future.exception())
+            if done:
+                continue
+            if timeout is not None and time.monotonic() - started >= timeout:
+                DEADLINE_EVENTS.inc(event="timeout")
+                raise DeadlineExceeded(f"No answer from {key} within {timeout:.1f}s")
+            if hedged is None and hedge_at is not None:
+                if try_hedge():
+                    hedged = self._executor.submit(self._timed(key, func))
+                    pending.add(hedged)
+                    HEDGED_CALLS.inc(model=key, outcome="sent")
+                else:
+                    HEDGED_CALLS.inc(model=key, outcome="no_slot")
+                hedge_at = None
+        raise errors[0]
+
+    def stats(self):
+        with self._lock:
+            keys = list(self._latencies)
+        return {key: {"p50": self.quantile(key, 0.5), "hedge_delay": self.delay(key)} for key in keys}
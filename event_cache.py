@@ -0,0 +1,216 @@
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from calendar_client import EVENT_FIELDS
+
+# Sync responses also need the page and sync tokens
+EVENT_SYNC_FIELDS = f"items({EVENT_FIELDS}),nextPageToken,nextSyncToken"
+SYNC_PAGE_SIZE = 250
+# Only events overlapping this window around now are synced and kept; the window is re-anchored with a
+# full sync once less than half of the look-ahead is left, so memory per user stays bounded
+SYNC_WINDOW_PAST = datetime.timedelta(days=1)
+SYNC_WINDOW_AHEAD = datetime.timedelta(days=28)
+
+
+class CalendarSyncError(Exception):
+    pass
+
+
+class UserCalendar:
+    """One user's cached primary calendar: events by id plus the sync token to fetch deltas from."""
+
+    def __init__(self):
+        self.events = {}
+        self.sync_token = None
+        self.window = None
+        self.last_sync = 0.0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+def event_start(event):
+    """Returns an event's start as an aware UTC datetime; all-day events start at midnight UTC."""
+    start = event.get("start", {})
+    if "dateTime" in start:
+        return datetime.datetime.fromisoformat(start["dateTime"]).astimezone(datetime.timezone.utc)
+    if "date" in start:
+        return datetime.datetime.fromisoformat(start["date"]).replace(tzinfo=datetime.timezone.utc)
+    return None
+
+
+def event_end(event):
+    end = event.get("end", {})
+    if "dateTime" in end:
+        return datetime.datetime.fromisoformat(end["dateTime"]).astimezone(datetime.timezone.utc)
+    if "date" in end:
+        return datetime.datetime.fromisoformat(end["date"]).replace(tzinfo=datetime.timezone.utc)
+    return event_start(event)
+
+
+class EventCache:
+    """
+    Per-user Google Calendar event cache fed by incremental sync (syncToken/nextPageToken).
+    The first read for a user does a full sync of the events within 'window_past' before and 'window_ahead'
+    after now; later reads only fetch what changed since. Changes outside the window are dropped.
+    Users are evicted after 'ttl_seconds' idle or least recently used beyond 'max_users'.
+    """
+
+    def __init__(self, calendar_client, max_users=500, ttl_seconds=1800, refresh_interval=15,
+                 window_past=SYNC_WINDOW_PAST, window_ahead=SYNC_WINDOW_AHEAD):
+        self.calendar_client = calendar_client
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.refresh_interval = refresh_interval
+        self.window_past = window_past
+        self.window_ahead = window_ahead
+        self.hits = 0
+        self.syncs = 0
+        self._users = OrderedDict()
+        self._token_owners = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bind_token(self, access_token, user_id):
+        """Associates a Google access token with a uid so the cache survives token refreshes."""
+        if not access_token or not user_id:
+            return
+        with self._lock:
+            self._token_owners[access_token] = user_id
+            self._token_owners.move_to_end(access_token)
+            while len(self._token_owners) > self.max_users * 4:
+                self._token_owners.popitem(last=False)
+
+    def _user_key(self, access_token):
+        owner = self._token_owners.get(access_token)
+        if owner:
+            return owner
+        return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+    def _get_user(self, access_token, create=True):
+        key = self._user_key(access_token)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            user = self._users.get(key)
+            if user is None and create:
+                user = UserCalendar()
+                self._users[key] = user
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            if user is not None:
+                user.last_used = now
+                self._users.move_to_end(key)
+            return user
+
+    def _evict_expired(self, now):
+        while self._users:
+            key, user = next(iter(self._users.items()))
+            if now - user.last_used < self.ttl_seconds:
+                break
+            del self._users[key]
+
+    def _count(self, stat):
+        with self._lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def _sync(self, user, access_token):
+        """
+        Applies all changes since the user's sync token, falling back to a full sync if it has expired
+        or the window has slid too far.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if user.window is not None and user.window[1] - now < self.window_ahead / 2:
+            user.sync_token = None
+        params = {"singleEvents": "true", "maxResults": SYNC_PAGE_SIZE}
+        if user.sync_token:
+            # Incremental syncs cannot repeat timeMin/timeMax; the window from the full sync still applies
+            params["syncToken"] = user.sync_token
+            window_start, window_end = user.window
+            events = {event_id: event for event_id, event in user.events.items() if event_end(event) > window_start}
+        else:
+            window_start, window_end = now - self.window_past, now + self.window_ahead
+            params["timeMin"] = window_start.isoformat()
+            params["timeMax"] = window_end.isoformat()
+            events = {}
+        while True:
+            response = self.calendar_client.list_events(access_token, params=params, fields=EVENT_SYNC_FIELDS)
+            if response.status_code == 410 and "syncToken" in params:
+                # The sync token expired server-side; start over with a full sync
+                user.sync_token = None
+                return self._sync(user, access_token)
+            if response.status_code != 200:
+                raise CalendarSyncError(f"{response.status_code} - {response.text}")
+            data = response.json()
+            for item in data.get("items", []):
+                start, end = event_start(item), event_end(item)
+                if item.get("status") == "cancelled" or start is None or end <= window_start or start >= window_end:
+                    events.pop(item["id"], None)
+                else:
+                    events[item["id"]] = item
+            page_token = data.get("nextPageToken")
+            if page_token:
+                params["pageToken"] = page_token
+                continue
+            user.events = events
+            user.sync_token = data.get("nextSyncToken")
+            user.window = (window_start, window_end)
+            user.last_sync = time.monotonic()
+            self._count("syncs")
+            return
+
+    def upcoming_events(self, access_token, max_results=15):
+        """Returns the next 'max_results' events that have not ended yet, syncing deltas first if stale."""
+        user = self._get_user(access_token)
+        with user.lock:
+            if user.sync_token and time.monotonic() - user.last_sync < self.refresh_interval:
+                self._count("hits")
+            else:
+                self._sync(user, access_token)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            upcoming = [event for event in user.events.values() if event_start(event) and event_end(event) > now]
+        upcoming.sort(key=event_start)
+        return upcoming[:max_results]
+
+    def cached_event(self, access_token, event_id):
+        """An event from the user's synced cache by ID, without calling Google; None if it is not known."""
+        user = self._get_user(access_token, create=False)
+        if user is None:
+            return None
+        with user.lock:
+            return user.events.get(event_id)
+
+    def covers(self, access_token, moment):
+        """
+        Whether the user's synced window spans 'moment' (naive datetimes are taken as UTC), so an event starting
+        then that is missing from the cache was not there at the last sync.
+        """
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=datetime.timezone.utc)
+        user = self._get_user(access_token, create=False)
+        if user is None:
+            return False
+        with user.lock:
+            return bool(user.sync_token) and user.window[0] <= moment < user.window[1]
+
+    def record_event(self, access_token, event):
+        """Write-through for events created by this server; ignored for users that have not synced yet."""
+        user = self._get_user(access_token, create=False)
+        if user is None or not event or "id" not in event:
+            return
+        with user.lock:
+            if not user.sync_token:
+                return
+            if event.get("recurrence"):
+                # The cache holds single instances; the next sync brings in the series' occurrences instead
+                user.last_sync = 0
+                return
+            start = event_start(event)
+            window_start, window_end = user.window
+            if start is not None and event_end(event) > window_start and start < window_end:
+                user.events[event["id"]] = event
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "hits": self.hits, "syncs": self.syncs}
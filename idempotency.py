@@ -0,0 +1,31 @@
+"""
+Idempotency keys for calendar-mutating tool calls.
+
+Each proposed event gets a stable key from the user, the event's topic, requested start and duration
+(plus the client's request id when it sends one, so deliberately repeated events in separate requests
+stay distinct). The key doubles as the Calendar event ID, so even a replay that reaches Google cannot
+create a second copy, and app.py keeps recent results in a TTL-bounded store so replays usually never
+reach Google at all.
+"""
+import base64
+import hashlib
+
+from response_cache import normalize_prompt
+
+
+def calendar_event_id(key):
+    """A Calendar client-specified event ID for 'key': base32hex (characters a-v and 0-9), 5 to 1024 long."""
+    return base64.b32hexencode(bytes.fromhex(key)).decode("ascii").rstrip("=").lower()
+
+
+class IdempotencyScope:
+    """The user (and optional client request id) that calendar writes of one /api/toolcall turn belong to."""
+
+    def __init__(self, user_id, request_id=None):
+        self.user_id = user_id
+        self.request_id = request_id
+
+    def event_key(self, topic, start, duration_hours):
+        """Stable key for one proposed event; 'start' is the start the model asked for, before any conflict shift."""
+        parts = [self.user_id, self.request_id or "", normalize_prompt(topic), start.isoformat(), str(float(duration_hours))]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
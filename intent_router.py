@@ -0,0 +1,165 @@
+"""
+Local fast path for trivial /api/toolcall prompts ("what time is it", "what's on my calendar today").
+
+IntentRouter scores a prompt against a handful of intents without any model call: an anchored pattern
+match scores 1.0, otherwise the score is the share of an intent's keyword groups the prompt hits times
+the share of its words the intent knows, so extra detail ("...in Tokyo", "...with Bob") drags the score
+down. app.py answers intents at or above the threshold with local handlers and sends everything else,
+including anything that asks for a change to the calendar, to Gemini as before.
+"""
+import re
+import threading
+
+from metrics import Counter
+from response_cache import normalize_prompt
+
+INTENT_ROUTES = Counter("urmindr_intent_routes_total",
+                        "Tool-call prompts seen by the local intent router, by best intent and outcome.",
+                        ["intent", "outcome"])
+
+# Prompts asking for something to be created or changed always go to the model
+ACTION_WORDS = frozenset((
+    "add", "book", "cancel", "change", "create", "delete", "move", "plan", "put", "remind",
+    "remove", "reschedule", "schedule", "set", "update",
+))
+# ...unless the word is a noun here, as in "what's on my schedule"
+DETERMINERS = frozenset(("my", "the", "today's", "tomorrow's"))
+# Words that carry no intent of their own and are known to every intent
+FILLER = frozenset((
+    "a", "am", "any", "anything", "are", "can", "could", "do", "does", "for", "got", "have", "hey", "hi",
+    "i", "is", "it", "me", "now", "ok", "okay", "please", "right", "show", "so", "tell", "the",
+    "there", "what", "what's", "whats", "you",
+))
+# Things with a time of their own; "what time is the standup" asks about the event, not the clock
+EVENT_NOUNS = frozenset((
+    "appointment", "appointments", "call", "calls", "class", "dinner", "event", "events", "flight", "lunch",
+    "meeting", "meetings", "party", "standup",
+))
+# Words that move the question to another day, which the 'today' answers cannot handle
+RELATIVE_DAY_WORDS = frozenset((
+    "after", "ago", "before", "last", "next", "tomorrow", "tomorrow's", "yesterday", "yesterday's",
+))
+
+
+def words_of(prompt):
+    return re.findall(r"[a-z0-9']+", normalize_prompt(prompt).replace("’", "'"))
+
+
+class Intent:
+    """
+    One routable intent: anchored regexes over the normalized prompt (words joined by single spaces),
+    keyword groups the prompt should each hit once, any further words it may contain, and words that
+    rule it out altogether. With 'phrases' a keyword match also needs one of them in the prompt, and a
+    'strict' intent scores 0 as soon as the prompt has a word it does not know.
+    """
+
+    def __init__(self, name, patterns=(), keywords=(), vocabulary=(), excludes=(), phrases=(), strict=False):
+        self.name = name
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.keywords = [frozenset(group) for group in keywords]
+        self.vocabulary = FILLER.union(vocabulary, *self.keywords)
+        self.excludes = frozenset(excludes)
+        self.phrases = [re.compile(rf"\b{re.escape(phrase)}\b") for phrase in phrases]
+        self.strict = strict
+
+    def score(self, words):
+        if self.excludes.intersection(words):
+            return 0.0
+        text = " ".join(words)
+        if any(pattern.fullmatch(text) for pattern in self.patterns):
+            return 1.0
+        if not self.keywords:
+            return 0.0
+        if self.phrases and not any(phrase.search(text) for phrase in self.phrases):
+            return 0.0
+        matched = sum(1 for group in self.keywords if group.intersection(words))
+        known = sum(1 for word in words if word in self.vocabulary)
+        if self.strict and known < len(words):
+            return 0.0
+        return matched / len(self.keywords) * known / len(words)
+
+
+AGENDA_NOUNS = ("agenda", "calendar", "events", "meetings", "on", "planned", "plans", "schedule")
+AGENDA_VOCABULARY = ("going", "happening", "how", "many", "my")
+
+DEFAULT_INTENTS = (
+    # Only questions about the clock itself: "what time is it", "the time", "current time" and filler around them
+    Intent("time",
+           patterns=[r"time\??", r"what time is it( now| right now)?( please)?"],
+           keywords=[("time",)],
+           vocabulary=("current", "currently", "exactly"),
+           excludes=EVENT_NOUNS | {"there"},
+           phrases=("what time is it", "the time", "current time"),
+           strict=True),
+    Intent("date",
+           patterns=[r"(what's|whats|what is) (the date|today's date)( today)?", r"what day is (it|today)"],
+           keywords=[("date", "day"), ("today", "today's", "it")],
+           vocabulary=("which",),
+           excludes=RELATIVE_DAY_WORDS),
+    Intent("agenda_today",
+           patterns=[r"(what's|whats|what is) on (my calendar |my agenda )?today"],
+           keywords=[AGENDA_NOUNS, ("today", "today's", "tonight")],
+           vocabulary=AGENDA_VOCABULARY),
+    Intent("agenda_tomorrow",
+           patterns=[r"(what's|whats|what is) on (my calendar |my agenda )?tomorrow"],
+           keywords=[AGENDA_NOUNS, ("tomorrow", "tomorrow's")],
+           vocabulary=AGENDA_VOCABULARY),
+)
+
+
+class IntentRouter:
+    """
+    Picks the best-scoring intent for a prompt and routes it locally if the score reaches 'threshold'.
+    Outcomes are counted in INTENT_ROUTES: 'hit' (answered locally), 'fallthrough' (routed, but the handler
+    could not answer), 'below_threshold' and 'miss' (no intent matched at all).
+    """
+
+    def __init__(self, intents=DEFAULT_INTENTS, threshold=0.8, enabled=True):
+        self.intents = intents
+        self.threshold = threshold
+        self.enabled = enabled
+        self.seen = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def classify(self, prompt):
+        """(intent name, confidence) of the best match, or (None, 0.0)."""
+        words = words_of(prompt)
+        if not words:
+            return None, 0.0
+        for index, word in enumerate(words):
+            if word in ACTION_WORDS and not (index > 0 and words[index - 1] in DETERMINERS):
+                return None, 0.0
+        best, confidence = None, 0.0
+        for intent in self.intents:
+            score = intent.score(words)
+            if score > confidence:
+                best, confidence = intent.name, score
+        return best, confidence
+
+    def route(self, prompt):
+        """The intent to answer 'prompt' locally, or None to send it to the model."""
+        if not self.enabled:
+            return None
+        intent, confidence = self.classify(prompt)
+        with self._lock:
+            self.seen += 1
+        if intent is None:
+            INTENT_ROUTES.inc(intent="none", outcome="miss")
+            return None
+        if confidence < self.threshold:
+            INTENT_ROUTES.inc(intent=intent, outcome="below_threshold")
+            return None
+        return intent
+
+    def answered(self, intent, ok):
+        """Records whether the handler for a routed intent produced the answer."""
+        INTENT_ROUTES.inc(intent=intent, outcome="hit" if ok else "fallthrough")
+        if ok:
+            with self._lock:
+                self.hits += 1
+
+    def stats(self):
+        with self._lock:
+            return {"seen": self.seen, "hits": self.hits,
+                    "hit_rate": round(self.hits / self.seen, 4) if self.seen else 0.0}
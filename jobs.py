@@ -0,0 +1,145 @@
+"""
+Background jobs for long-running tool work (large schedule_multiple_events plans).
+
+A Job holds the live state of one job in this process; JobManager runs jobs on a small worker pool,
+keeps finished ones in memory for a while for fast polling, and hands snapshots to a 'persist'
+callback (app.py writes them to Firestore) on every status change and at most every
+'persist_interval' seconds while progress is being made.
+"""
+import datetime
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class Job:
+    """Status and progress of one background job. Tool handlers report progress through plan() and event_finished()."""
+
+    def __init__(self, user_id, kind, chat_id=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.chat_id = chat_id
+        self.status = "queued"
+        self.planned = 0
+        self.completed = 0
+        self.failed = 0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.updated_at = self.created_at
+        self.finished_at = None
+        # Bumped on every change so watchers can wait for the next one
+        self.version = 0
+        self._changed = threading.Condition()
+        self._on_change = None
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+    def _update(self, status_change=False, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.updated_at = datetime.datetime.now(datetime.timezone.utc)
+            self.version += 1
+            self._changed.notify_all()
+        if self._on_change:
+            self._on_change(self, status_change)
+
+    def plan(self, count):
+        """Announces 'count' more calendar writes."""
+        self._update(planned=self.planned + count)
+
+    def event_finished(self, ok):
+        if ok:
+            self._update(completed=self.completed + 1)
+        else:
+            self._update(failed=self.failed + 1)
+
+    def wait_for_change(self, version, timeout):
+        """Blocks until the job changes past 'version' or 'timeout' seconds pass; returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "chat_id": self.chat_id,
+            "progress": {"planned": self.planned, "completed": self.completed, "failed": self.failed},
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobManager:
+    """Runs jobs on 'max_workers' threads and remembers finished ones for 'retention_seconds'."""
+
+    def __init__(self, persist, max_workers=4, retention_seconds=900, persist_interval=1.0):
+        self.persist = persist
+        self.retention_seconds = retention_seconds
+        self.persist_interval = persist_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._last_persisted = {}
+        self._lock = threading.Lock()
+
+    def _save(self, job, status_change):
+        now = time.monotonic()
+        with self._lock:
+            if not status_change and now - self._last_persisted.get(job.id, 0) < self.persist_interval:
+                return
+            self._last_persisted[job.id] = now
+        try:
+            self.persist(job)
+        except Exception as e:
+            print(f"🔥 Error persisting job {job.id}: {e}")
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.retention_seconds
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+                del self._jobs[job_id]
+                self._last_persisted.pop(job_id, None)
+
+    def submit(self, job, work):
+        """Persists the queued job and runs work(job) in the background; its return value becomes the result."""
+        self._prune()
+        job._on_change = self._save
+        with self._lock:
+            self._jobs[job.id] = job
+        self._save(job, status_change=True)
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def _run(self, job, work):
+        job._update(status_change=True, status="running")
+        try:
+            result = work(job)
+        except Exception as e:
+            print(f"🔥 Job {job.id} failed: {e}")
+            job.finished_at = time.monotonic()
+            job._update(status_change=True, status="failed", error=str(e))
+            return
+        job.finished_at = time.monotonic()
+        job._update(status_change=True, status="succeeded", result=result)
+
+    def get(self, job_id):
+        """The in-memory job, or None if it ran in another process or has been pruned."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(1 for job in jobs if job.status == status)
+                for status in ("queued", "running", "succeeded", "failed")}
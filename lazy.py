@@ -0,0 +1,67 @@
+"""
+Deferred imports and client construction, so importing app.py does not pay for the Google SDKs
+(hundreds of milliseconds of imports plus credential discovery) before the first request needs them.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            module = importlib.import_module(self._name)
+            object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        # Patching through the proxy (e.g. in the benchmark harness) patches the real module
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+class LazyClient:
+    """
+    Stands in for a client object built by 'factory' on first use. Construction happens once, under a lock,
+    so concurrent first requests (or a warm-up thread racing a request) share one instance.
+    """
+
+    def __init__(self, name, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def initialized(self):
+        return self._instance is not None
+
+    def resolve(self):
+        """Returns the real client, building it if needed."""
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = self._factory()
+                    object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def __getattr__(self, attribute):
+        return getattr(self.resolve(), attribute)
+
+    def __repr__(self):
+        state = "initialized" if self._instance is not None else "not initialized"
+        return f"<LazyClient {self._name} ({state})>"
@@ -0,0 +1,248 @@
+"""
+Per-user semantic memory behind get_user_context.
+
+Past messages and scheduled events are embedded and kept in one small on-disk index per user:
+
+    vectors.f32     unit-length float32 rows (n x dim), appended, read back as a read-only memmap
+    ids.i64         int64 id of each row, derived from its source, so indexing a message twice is a no-op
+    snippets.jsonl  text and metadata of each row, in row order
+
+Because rows have unit length, a search is one matrix-vector product (cosine similarity) plus an
+argpartition for the top k. Snippets are embedded in batches on a single background thread, the only
+writer, so requests never wait for indexing. The index is a local cache of what Firestore already
+holds: an instance without it just starts remembering from the next message.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+from lazy import LazyModule
+from metrics import Counter
+
+np = LazyModule("numpy")
+
+MEMORY_SNIPPETS = Counter("urmindr_memory_snippets_total",
+                          "Snippets handed to the memory indexer, by outcome.", ["outcome"])
+
+
+def snippet_id(kind, key):
+    digest = hashlib.sha256(f"{kind}\x00{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little", signed=True)
+
+
+def normalize_rows(vectors, dim):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[1] != dim:
+        raise ValueError(f"expected embeddings of dimension {dim}, got shape {vectors.shape}")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class UserIndex:
+    """
+    One user's index files. Only MemoryStore's indexing thread appends, under the store's lock so no second
+    UserIndex for the same directory can be loaded (and trim the files) mid-append; searches hold 'lock' to read.
+    """
+
+    def __init__(self, directory, dim):
+        self.directory = directory
+        self.dim = dim
+        self.lock = threading.Lock()
+        self._vectors = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        meta_path = self._path("meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta.get("dim") != self.dim:
+            # New index, or one built with another embedding size that cannot be searched with this one
+            for name in ("vectors.f32", "ids.i64", "snippets.jsonl"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim}, f)
+
+        ids = np.fromfile(self._path("ids.i64"), dtype=np.int64) if os.path.exists(self._path("ids.i64")) else np.empty(0, np.int64)
+        snippets = []
+        if os.path.exists(self._path("snippets.jsonl")):
+            with open(self._path("snippets.jsonl"), encoding="utf-8") as f:
+                snippets = [json.loads(line) for line in f if line.endswith("\n")]
+        vector_bytes = os.path.getsize(self._path("vectors.f32")) if os.path.exists(self._path("vectors.f32")) else 0
+        count = min(vector_bytes // (4 * self.dim), len(ids), len(snippets))
+        if (vector_bytes, len(ids), len(snippets)) != (count * 4 * self.dim, count, count):
+            # A crash between the three appends leaves them uneven; drop the incomplete tail
+            ids, snippets = ids[:count], snippets[:count]
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.truncate(count * 4 * self.dim)
+            ids.tofile(self._path("ids.i64"))
+            with open(self._path("snippets.jsonl"), "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(snippet) + "\n" for snippet in snippets)
+        self.snippets = snippets
+        self.known = set(ids.tolist())
+        self._rows_by_chat = {}
+        for row, snippet in enumerate(snippets):
+            self._rows_by_chat.setdefault(snippet.get("chat_id"), []).append(row)
+
+    def __len__(self):
+        return len(self.snippets)
+
+    def append(self, ids, vectors, snippets):
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(vectors.astype(np.float32).tobytes())
+        with open(self._path("ids.i64"), "ab") as f:
+            f.write(np.asarray(ids, dtype=np.int64).tobytes())
+        with open(self._path("snippets.jsonl"), "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(snippet) + "\n" for snippet in snippets)
+        with self.lock:
+            for snippet in snippets:
+                self._rows_by_chat.setdefault(snippet.get("chat_id"), []).append(len(self.snippets))
+                self.snippets.append(snippet)
+            self.known.update(ids)
+            # Re-mapped with the new row count on the next search
+            self._vectors = None
+
+    def search(self, query, k, min_score, exclude_chat=None):
+        """Up to k snippets (with a 'score') whose cosine similarity to the unit vector 'query' is at least min_score."""
+        with self.lock:
+            count = len(self.snippets)
+            if not count:
+                return []
+            if self._vectors is None:
+                self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, self.dim))
+            scores = self._vectors @ query
+            if exclude_chat is not None and exclude_chat in self._rows_by_chat:
+                scores[self._rows_by_chat[exclude_chat]] = -np.inf
+            top = np.argpartition(-scores, k - 1)[:k] if count > k else np.arange(count)
+            top = top[np.argsort(-scores[top])]
+            return [dict(self.snippets[row], score=round(float(scores[row]), 4))
+                    for row in top if scores[row] >= min_score]
+
+
+class MemoryStore:
+    """
+    Queues snippets for indexing and answers top-k searches over each user's UserIndex.
+    'embed(texts, task_type)' returns one vector of length 'dim' per text; task_type is
+    RETRIEVAL_DOCUMENT for snippets and RETRIEVAL_QUERY for searches.
+    """
+
+    def __init__(self, directory, embed, dim, max_open_users=200, batch_size=32, max_queue=1000,
+                 snippet_chars=300, min_chars=16):
+        self.directory = directory
+        self.embed = embed
+        self.dim = dim
+        self.max_open_users = max_open_users
+        self.batch_size = batch_size
+        self.snippet_chars = snippet_chars
+        self.min_chars = min_chars
+        self.indexed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def _user_directory(self, user_id):
+        return os.path.join(self.directory, hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32])
+
+    def _open(self, user_id, create=True):
+        with self._lock:
+            return self._open_locked(user_id, create)
+
+    def _open_locked(self, user_id, create=True):
+        # Callers hold self._lock, so there is one live UserIndex per user even across LRU evictions
+        index = self._users.get(user_id)
+        if index is not None:
+            self._users.move_to_end(user_id)
+            return index
+        directory = self._user_directory(user_id)
+        if not create and not os.path.isdir(directory):
+            return None
+        index = self._users[user_id] = UserIndex(directory, self.dim)
+        while len(self._users) > self.max_open_users:
+            self._users.popitem(last=False)
+        return index
+
+    def remember(self, user_id, kind, key, text, chat_id=None, timestamp=None):
+        """Queues one snippet for indexing; 'kind' and 'key' identify its source so it is only indexed once."""
+        text = " ".join(str(text).split())
+        if len(text) < self.min_chars:
+            return
+        snippet = {"kind": kind, "text": text[:self.snippet_chars], "chat_id": chat_id,
+                   "at": timestamp.isoformat() if timestamp else None}
+        try:
+            self._queue.put_nowait((user_id, snippet_id(kind, key), snippet))
+        except queue.Full:
+            MEMORY_SNIPPETS.inc(outcome="dropped")
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="memory-indexer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._index(batch)
+            except Exception as e:
+                print(f"🔥 Error indexing {len(batch)} memory snippets: {e}")
+                MEMORY_SNIPPETS.inc(len(batch), outcome="failed")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _index(self, batch):
+        # One embedding call for the whole batch, whichever users it belongs to
+        fresh = []
+        seen = set()
+        for user_id, row_id, snippet in batch:
+            if row_id in seen or row_id in self._open(user_id).known:
+                MEMORY_SNIPPETS.inc(outcome="duplicate")
+                continue
+            seen.add(row_id)
+            fresh.append((user_id, row_id, snippet))
+        if not fresh:
+            return
+        vectors = normalize_rows(self.embed([snippet["text"] for _, _, snippet in fresh], "RETRIEVAL_DOCUMENT"), self.dim)
+        rows_by_user = OrderedDict()
+        for row, (user_id, _, _) in enumerate(fresh):
+            rows_by_user.setdefault(user_id, []).append(row)
+        for user_id, rows in rows_by_user.items():
+            with self._lock:
+                self._open_locked(user_id).append([fresh[row][1] for row in rows], vectors[rows],
+                                                  [fresh[row][2] for row in rows])
+        self.indexed += len(fresh)
+        MEMORY_SNIPPETS.inc(len(fresh), outcome="indexed")
+
+    def flush(self):
+        """Blocks until every queued snippet has been indexed (or failed)."""
+        self._queue.join()
+
+    def search(self, user_id, query, k=4, min_score=0.35, exclude_chat=None):
+        """
+        The k snippets most similar to 'query', best first. Users with nothing indexed return [] without an
+        embedding call; 'exclude_chat' leaves out the chat whose history is already in the prompt.
+        """
+        index = self._open(user_id, create=False)
+        if index is None or not len(index):
+            return []
+        query_vector = normalize_rows(self.embed([query], "RETRIEVAL_QUERY"), self.dim)[0]
+        return index.search(query_vector, k, min_score, exclude_chat)
+
+    def stats(self):
+        with self._lock:
+            return {"open_users": len(self._users), "queued": self._queue.qsize(), "indexed": self.indexed}
@@ -0,0 +1,28 @@
+"""
+One-off migration of array-based chats into the per-chat 'messages' subcollection.
+
+Usage:
+    python migrate_chats.py <user_id> [<user_id> ...]
+    python migrate_chats.py --all
+"""
+import sys
+
+from app import db, migrate_user_array_chats
+
+
+def main(argv):
+    if not argv:
+        print(__doc__)
+        return 1
+    if argv == ['--all']:
+        user_ids = [user_ref.id for user_ref in db.collection('users').list_documents()]
+    else:
+        user_ids = argv
+    for user_id in user_ids:
+        migrated = migrate_user_array_chats(user_id)
+        print(f"✅ Migrated {migrated} chats for user {user_id}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
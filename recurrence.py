@@ -0,0 +1,133 @@
+"""
+RRULE-style recurrence for the schedule_recurring_event tool.
+
+Supports the subset the model needs for routines: FREQ=DAILY/WEEKLY/MONTHLY with INTERVAL, BYDAY
+(weekdays, for daily and weekly rules) and COUNT or UNTIL. Rules are validated and expanded locally,
+so occurrences can be checked for past dates and conflicts before one recurring event is created.
+Expansion follows RFC 5545 with weeks starting on Monday; the first occurrence is the first matching
+day on or after the requested start date.
+"""
+import calendar
+import datetime
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# Expansion never looks further ahead than this, even for rules that match nothing (e.g. every 7 days on another weekday)
+HORIZON = datetime.timedelta(days=3660)
+
+
+class RecurrenceError(ValueError):
+    """The recurrence arguments do not describe a supported rule."""
+
+
+class Recurrence:
+    def __init__(self, frequency, interval=1, by_day=None, count=None, until=None):
+        self.frequency = str(frequency or "").upper()
+        if self.frequency not in FREQUENCIES:
+            raise RecurrenceError(f"frequency must be one of {', '.join(FREQUENCIES).lower()}")
+        try:
+            self.interval = int(interval or 1)
+        except (TypeError, ValueError):
+            raise RecurrenceError("interval must be a whole number")
+        if self.interval < 1:
+            raise RecurrenceError("interval must be at least 1")
+
+        # Accept 'MO', 'mon' or 'Monday'
+        self.by_day = []
+        for day in by_day or []:
+            code = str(day).strip().upper()[:2]
+            if code not in WEEKDAYS:
+                raise RecurrenceError(f"unknown weekday '{day}'")
+            if code not in self.by_day:
+                self.by_day.append(code)
+        self.by_day.sort(key=WEEKDAYS.index)
+        if self.by_day and self.frequency == "MONTHLY":
+            raise RecurrenceError("by_day is only supported for daily and weekly rules")
+
+        if (count is None) == (until is None):
+            raise RecurrenceError("give exactly one of count or until")
+        self.count = None
+        self.until = None
+        if count is not None:
+            try:
+                self.count = int(count)
+            except (TypeError, ValueError):
+                raise RecurrenceError("count must be a whole number")
+            if self.count < 1:
+                raise RecurrenceError("count must be at least 1")
+        else:
+            try:
+                self.until = datetime.date.fromisoformat(str(until))
+            except ValueError:
+                raise RecurrenceError("until must be a date in YYYY-MM-DD format")
+
+    def rrule(self):
+        """The RRULE line for the Calendar API; UNTIL is inclusive of the whole last day, in UTC like the event times."""
+        parts = [f"FREQ={self.frequency}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.by_day:
+            parts.append(f"BYDAY={','.join(self.by_day)}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        else:
+            parts.append(f"UNTIL={self.until:%Y%m%d}T235959Z")
+        return "RRULE:" + ";".join(parts)
+
+    def describe(self):
+        unit = {"DAILY": "day", "WEEKLY": "week", "MONTHLY": "month"}[self.frequency]
+        text = f"every {unit}" if self.interval == 1 else f"every {self.interval} {unit}s"
+        if self.by_day:
+            text += " on " + ", ".join(calendar.day_abbr[WEEKDAYS.index(day)] for day in self.by_day)
+        if self.count is not None:
+            text += f", {self.count} times"
+        else:
+            text += f", until {self.until.isoformat()}"
+        return text
+
+    def _candidates(self, start):
+        """
+        Days on or after start's date in increasing order, without the COUNT/UNTIL bound.
+        Daily rules yield every interval-th day and leave the BYDAY filter to expand().
+        """
+        day = start.date()
+        if self.frequency == "DAILY":
+            while True:
+                yield day
+                day += datetime.timedelta(days=self.interval)
+        elif self.frequency == "WEEKLY":
+            weekdays = [WEEKDAYS.index(code) for code in self.by_day] or [day.weekday()]
+            week_start = day - datetime.timedelta(days=day.weekday())
+            while True:
+                for weekday in weekdays:
+                    candidate = week_start + datetime.timedelta(days=weekday)
+                    if candidate >= day:
+                        yield candidate
+                week_start += datetime.timedelta(weeks=self.interval)
+        else:
+            year, month = day.year, day.month
+            while True:
+                # Months without that day of the month are skipped, as in RFC 5545
+                if day.day <= calendar.monthrange(year, month)[1]:
+                    yield datetime.date(year, month, day.day)
+                month += self.interval
+                year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+
+    def expand(self, start, limit):
+        """
+        Occurrence start datetimes (with start's time of day). Raises RecurrenceError if the rule has more
+        than 'limit' occurrences, so an open-ended UNTIL cannot make the caller expand years of events.
+        """
+        occurrences = []
+        horizon = start.date() + HORIZON
+        for day in self._candidates(start):
+            if self.count is not None and len(occurrences) >= self.count:
+                break
+            if (self.until is not None and day > self.until) or day > horizon:
+                break
+            if self.frequency == "DAILY" and self.by_day and WEEKDAYS[day.weekday()] not in self.by_day:
+                continue
+            if len(occurrences) >= limit:
+                raise RecurrenceError(f"the rule has more than {limit} occurrences; use a count or an earlier until date")
+            occurrences.append(datetime.datetime.combine(day, start.time()))
+        return occurrences
@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter
+
+RESPONSE_CACHE_REQUESTS = Counter("urmindr_response_cache_requests_total",
+                                  "Response cache lookups by outcome (hit, miss, coalesced, bypass).", ["cache", "result"])
+
+
+def normalize_prompt(prompt):
+    """Case- and whitespace-insensitive form of a prompt, so trivially different duplicates share an entry."""
+    return " ".join(str(prompt).split()).casefold()
+
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    Bounded LRU + TTL cache of model responses with in-flight request coalescing (singleflight):
+    concurrent misses for the same key wait for the first caller's model call instead of starting their own.
+    Failures are never cached; they are re-raised to every caller waiting on that call.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl_seconds=300):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value or None, without counting the lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, result):
+        RESPONSE_CACHE_REQUESTS.inc(cache=self.name, result=result)
+
+    def get_or_compute(self, key, compute):
+        """Returns (value, outcome) where outcome is 'hit', 'miss' or 'coalesced'."""
+        value = self.get(key)
+        if value is not None:
+            self.record("hit")
+            return value, "hit"
+
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _InFlight()
+
+        if not leader:
+            call.done.wait()
+            self.record("coalesced")
+            if call.error is not None:
+                raise call.error
+            return call.result, "coalesced"
+
+        self.record("miss")
+        try:
+            call.result = compute()
+            self.put(key, call.result)
+            return call.result, "miss"
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_entries": self.max_entries, "in_flight": len(self._in_flight)}
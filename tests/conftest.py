@@ -0,0 +1,40 @@
+import os
+import sys
+import types
+import uuid
+
+import pytest
+
+# The modules under test live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def installed_app():
+    """app.py with the bench fakes (see bench/fakes.py) in place of Firestore, Gemini, auth and Calendar."""
+    from bench import loadtest
+    args = types.SimpleNamespace(calendar_latency=0.0, firestore_latency=0.0, gemini_latency=0.0, gemini_jitter=0.0,
+                                 function_call_ratio=0.0, events_per_call=3, gemini_slow_ratio=0.0,
+                                 gemini_slow_latency=0.0)
+    core, _, _, calendar = loadtest.install_fakes(args)
+    yield core, calendar
+    calendar.stop()
+
+
+@pytest.fixture
+def app_env(installed_app, monkeypatch):
+    """
+    A fresh fake Firestore and Gemini for one test, a user of its own (so per-user caches start empty) and a
+    test client that signs in as that user.
+    """
+    from bench.fakes import FakeFirestore, FakeGemini
+    core, calendar = installed_app
+    db = FakeFirestore(latency=0.0)
+    gemini = FakeGemini(latency=0.0, jitter=0.0, function_call_ratio=0.0)
+    monkeypatch.setattr(core, "db", db)
+    monkeypatch.setattr(core, "client", gemini)
+    uid = f"user-{uuid.uuid4().hex[:8]}"
+    return types.SimpleNamespace(
+        core=core, db=db, gemini=gemini, calendar=calendar, uid=uid, access_token=f"google-{uid}",
+        client=core.app.test_client(), headers={"Authorization": f"Bearer bench-{uid}"},
+    )
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import AdmissionRejected, ConcurrencyLimiter, RateLimiter
+
+
+def test_rate_limiter_allows_a_burst_then_rejects():
+    limiter = RateLimiter(per_minute=60, burst=3)
+    for _ in range(3):
+        limiter.check("u1")
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.check("u1")
+    assert rejected.value.reason == "rate_limit"
+    assert rejected.value.retry_after >= 1
+    # Other users have their own bucket
+    limiter.check("u2")
+
+
+def test_rate_limiter_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+    limiter = RateLimiter(per_minute=60, burst=1)
+    limiter.check("u1")
+    with pytest.raises(AdmissionRejected):
+        limiter.check("u1")
+    now[0] += 1.0
+    limiter.check("u1")
+
+
+def test_rate_limiter_drops_least_recently_seen_keys():
+    limiter = RateLimiter(per_minute=60, burst=1, max_keys=2)
+    for key in ("a", "b", "c"):
+        limiter.check(key)
+    assert limiter.stats() == {"users": 2}
+    # 'a' was dropped, so it starts with a full bucket again
+    limiter.check("a")
+
+
+def test_disabled_rate_limiter():
+    limiter = RateLimiter(per_minute=0)
+    for _ in range(100):
+        limiter.check("u1")
+
+
+def test_concurrency_limiter_rejects_when_the_queue_is_full():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=0.01)
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire()
+    assert rejected.value.reason == "queue_full"
+    with pytest.raises(AdmissionRejected):
+        limiter.check()
+    limiter.release()
+    limiter.check()
+    with limiter.slot():
+        assert limiter.stats()["active"] == 1
+    assert limiter.stats()["active"] == 0
+
+
+def test_concurrency_limiter_queue_timeout():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, queue_timeout=0.01)
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire()
+    assert rejected.value.reason == "queue_timeout"
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_required_calls_wait_for_a_slot():
+    limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=0, queue_timeout=0.01)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def required_call():
+        with limiter.slot(required=True):
+            acquired.set()
+
+    thread = threading.Thread(target=required_call)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release()
+    thread.join(1)
+    assert acquired.is_set()
+    assert limiter.stats()["active"] == 0
+
+
+def test_try_acquire():
+    limiter = ConcurrencyLimiter(max_concurrent=1)
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+
+
+def test_async_slot():
+    limiter = ConcurrencyLimiter(max_concurrent=1)
+
+    async def run():
+        async with limiter.async_slot():
+            assert limiter.stats()["active"] == 1
+    asyncio.run(run())
+    assert limiter.stats()["active"] == 0
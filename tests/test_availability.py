@@ -0,0 +1,54 @@
+import datetime
+
+import pytest
+
+from availability import EXISTING_EVENT, BusyIndex, busy_intervals, parse_rfc3339
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2025, 1, 6, hour, minute)
+
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def test_parse_rfc3339_returns_naive_utc():
+    assert parse_rfc3339("2025-01-06T10:00:00Z") == at(10)
+    assert parse_rfc3339("2025-01-06T12:00:00+02:00") == at(10)
+    assert parse_rfc3339("2025-01-06T10:00:00") == at(10)
+
+
+def test_busy_intervals():
+    response = {"calendars": {"primary": {"busy": [{"start": "2025-01-06T10:00:00Z", "end": "2025-01-06T11:00:00Z"}]}}}
+    assert busy_intervals(response) == [(at(10), at(11), EXISTING_EVENT)]
+    assert busy_intervals({}) == []
+    with pytest.raises(ValueError):
+        busy_intervals({"calendars": {"primary": {"errors": [{"reason": "notFound"}]}}})
+
+
+def test_conflicts_are_half_open():
+    index = BusyIndex([(at(10), at(11), "standup")])
+    assert index.conflicts(at(10, 30), at(11, 30)) == ["standup"]
+    assert index.conflicts(at(11), at(12)) == []
+    assert index.conflicts(at(9), at(10)) == []
+
+
+def test_overlapping_and_touching_intervals_merge():
+    index = BusyIndex([(at(10), at(11), "a"), (at(11), at(12), "b"), (at(10, 30), at(10, 45), "c"), (at(14), at(15), "d")])
+    assert len(index) == 2
+    assert index.conflicts(at(11, 30), at(11, 45)) == ["a", "c", "b"]
+
+
+def test_add_merges_across_several_intervals():
+    index = BusyIndex([(at(9), at(10), "a"), (at(11), at(12), "b"), (at(13), at(14), "c")])
+    index.add(at(9, 30), at(13, 30), "new")
+    assert len(index) == 1
+    assert index.conflicts(at(12), at(12, 30)) == ["a", "b", "c", "new"]
+
+
+def test_next_free():
+    index = BusyIndex([(at(9), at(10), "a"), (at(10), at(11), "b"), (at(11, 30), at(12), "c")])
+    assert index.next_free(at(8), HOUR, at(22)) == at(8)
+    assert index.next_free(at(9), HOUR, at(22)) == at(12)
+    assert index.next_free(at(9), HOUR / 2, at(22)) == at(11)
+    assert index.next_free(at(9), HOUR, at(12, 30)) is None
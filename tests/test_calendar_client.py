@@ -0,0 +1,111 @@
+import datetime
+import types
+
+import pytest
+import requests
+
+import calendar_client as calendar_module
+from calendar_client import CalendarClient
+from deadline import deadline_scope
+
+NEW_YEAR = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class ScriptedSession:
+    """Answers requests from a script of statuses and exceptions, recording each call."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        status, headers = step if isinstance(step, tuple) else (step, {})
+        return types.SimpleNamespace(status_code=status, headers=headers, text="")
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(calendar_module.time, "sleep", slept.append)
+    return slept
+
+
+def client_with(session, **kwargs):
+    client = CalendarClient(base_url="https://calendar.test/v3", **kwargs)
+    client._session = session
+    return client
+
+
+def test_get_retries_5xx_and_connection_errors(sleeps):
+    session = ScriptedSession(503, requests.ConnectionError("reset"), 200)
+    response = client_with(session).get_event("token", "e1")
+    assert response.status_code == 200
+    assert len(session.calls) == 3 and len(sleeps) == 2
+    method, url, kwargs = session.calls[0]
+    assert (method, url) == ("GET", "https://calendar.test/v3/calendars/primary/events/e1")
+    assert kwargs["headers"] == {"Authorization": "Bearer token"}
+    assert kwargs["params"] == {"fields": calendar_module.EVENT_FIELDS}
+
+
+def test_retries_stop_after_max_retries(sleeps):
+    session = ScriptedSession(500, 500, 500)
+    assert client_with(session, max_retries=2).list_events("token").status_code == 500
+    assert len(session.calls) == 3
+
+
+def test_backoff_is_jittered_exponential_and_honours_retry_after(sleeps):
+    client = client_with(ScriptedSession(), backoff_base=0.5, backoff_max=3.0)
+    for attempt in range(5):
+        assert 0 <= client._backoff(attempt) <= min(3.0, 0.5 * 2 ** attempt)
+    assert client._backoff(0, types.SimpleNamespace(headers={"Retry-After": "2"})) == 2.0
+    assert client._backoff(0, types.SimpleNamespace(headers={"Retry-After": "60"})) == 3.0
+
+
+@pytest.mark.parametrize("failure", [500, requests.ReadTimeout("slow")])
+def test_insert_is_not_retried_when_it_may_have_succeeded(sleeps, failure):
+    session = ScriptedSession(failure, 200)
+    client = client_with(session)
+    if isinstance(failure, Exception):
+        with pytest.raises(requests.ReadTimeout):
+            client.insert_event("token", {"summary": "Lunch"})
+    else:
+        assert client.insert_event("token", {"summary": "Lunch"}).status_code == 500
+    assert len(session.calls) == 1 and sleeps == []
+
+
+@pytest.mark.parametrize("failure", [(429, {"Retry-After": "1"}), requests.ConnectTimeout("no route")])
+def test_insert_is_retried_when_it_never_reached_google(sleeps, failure):
+    session = ScriptedSession(failure, 200)
+    assert client_with(session).insert_event("token", {"summary": "Lunch"}).status_code == 200
+    assert len(session.calls) == 2
+
+
+def test_free_busy_post_is_retried_like_a_read(sleeps):
+    session = ScriptedSession(502, 200)
+    response = client_with(session).free_busy("token", NEW_YEAR, NEW_YEAR + datetime.timedelta(days=1))
+    assert response.status_code == 200 and len(session.calls) == 2
+
+
+def test_deadline_caps_the_timeout_and_skips_a_late_retry(sleeps):
+    session = ScriptedSession((503, {"Retry-After": "3"}), 200)
+    with deadline_scope(1.0):
+        assert client_with(session).list_events("token").status_code == 503
+    connect_timeout, read_timeout = session.calls[0][2]["timeout"]
+    assert connect_timeout <= 1.0 and read_timeout <= 1.0
+    assert sleeps == []
+
+
+def test_against_the_calendar_stub(installed_app):
+    _, calendar = installed_app
+    client = CalendarClient(base_url=calendar.base_url)
+    created = client.insert_event("client-test", {"id": "clienttest1", "summary": "Lunch",
+                                                  "start": {"dateTime": "2030-01-01T12:00:00+00:00"},
+                                                  "end": {"dateTime": "2030-01-01T13:00:00+00:00"}})
+    assert created.status_code == 200
+    assert client.get_event("client-test", "clienttest1").json()["summary"] == "Lunch"
+    assert client.get_event("client-test", "missing").status_code == 404
+    assert client.insert_event("client-test", {"id": "clienttest1"}).status_code == 409
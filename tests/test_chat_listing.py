@@ -0,0 +1,69 @@
+import datetime
+
+from chat_store import legacy_chat_header
+
+START = datetime.datetime(2024, 3, 1, 9, 0, tzinfo=datetime.timezone.utc)
+
+
+def legacy_messages(count):
+    return [{"role": "user" if n % 2 == 0 else "agent", "content": f"message {n}",
+             "timestamp": START + datetime.timedelta(minutes=n)} for n in range(count)]
+
+
+def test_legacy_chat_header_from_inline_messages():
+    header = legacy_chat_header({"startTime": START, "messages": legacy_messages(3)})
+    assert "messages" not in header
+    assert header["messageCount"] == 3
+    assert header["title"] == "message 0"
+    assert header["lastMessagePreview"] == "message 2"
+    assert header["lastActivity"] == START + datetime.timedelta(minutes=2)
+
+
+def test_legacy_chat_header_keeps_newer_turns():
+    later = START + datetime.timedelta(days=1)
+    header = legacy_chat_header({"title": "Plans", "messageCount": 2, "lastActivity": later,
+                                 "lastMessagePreview": "newest", "messages": legacy_messages(3)})
+    assert (header["title"], header["messageCount"], header["lastActivity"], header["lastMessagePreview"]) == (
+        "Plans", 5, later, "newest")
+
+
+def test_empty_legacy_chat_falls_back_to_its_start():
+    header = legacy_chat_header({"startTime": START, "messages": []})
+    assert (header["title"], header["messageCount"], header["lastActivity"]) == ("New chat", 0, START)
+
+
+def add_turn(app_env, prompt, chat_id=None):
+    body = {"prompt": prompt, "accessToken": app_env.access_token}
+    if chat_id:
+        body["chat_id"] = chat_id
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers, json=body)
+    assert response.status_code == 200
+    return response.get_json()["chat_id"]
+
+
+def test_all_user_chats_come_from_headers(app_env, monkeypatch):
+    chat_id = add_turn(app_env, "hello there")
+    legacy_ref = app_env.db.collection("users").document(app_env.uid).collection("chats").document("legacy")
+    legacy_ref.set({"startTime": START, "messages": legacy_messages(4)})
+
+    def no_message_reads(*args, **kwargs):
+        raise AssertionError("the listing must not read messages")
+
+    monkeypatch.setattr(app_env.core, "get_chat_messages", no_message_reads)
+    monkeypatch.setattr(app_env.core, "migrate_array_chat", no_message_reads)
+    response = app_env.client.get("/get_all_user_chats", query_string={"user_id": app_env.uid}, headers=app_env.headers)
+    assert response.status_code == 200
+    chats = response.get_json()
+    assert chats[chat_id]["messageCount"] == 2
+    assert chats["legacy"] == {"chat_id": "legacy", "title": "message 0", "lastMessagePreview": "message 3",
+                               "messageCount": 4, "lastActivity": (START + datetime.timedelta(minutes=3)).isoformat()}
+    # The legacy chat is left for migration on first read
+    assert "messages" in legacy_ref.get().to_dict()
+
+
+def test_chat_page_limit_is_at_least_one(app_env):
+    add_turn(app_env, "first chat")
+    add_turn(app_env, "second chat")
+    page = app_env.client.get("/api/chats", query_string={"limit": 0}, headers=app_env.headers).get_json()
+    assert len(page["chats"]) == 1
+    assert page["next_cursor"] is not None
@@ -0,0 +1,65 @@
+import datetime
+
+T0 = datetime.datetime(2024, 5, 1, 8, 0, tzinfo=datetime.timezone.utc)
+
+
+def legacy_messages(count, start=0):
+    return [{"role": "user" if n % 2 == 0 else "agent", "content": f"message {n}",
+             "timestamp": T0 + datetime.timedelta(minutes=n)} for n in range(start, start + count)]
+
+
+def chat_ref(app_env, chat_id):
+    return app_env.db.collection("users").document(app_env.uid).collection("chats").document(chat_id)
+
+
+def stored_messages(app_env, chat_id):
+    return [(doc.id, doc.to_dict()["content"])
+            for doc in chat_ref(app_env, chat_id).collection("messages").order_by("timestamp").stream()]
+
+
+def test_array_chat_moves_into_the_subcollection(app_env):
+    chat_ref(app_env, "old").set({"startTime": T0, "messages": legacy_messages(3)})
+    assert app_env.core.migrate_array_chat(app_env.uid, "old") == 3
+    assert stored_messages(app_env, "old") == [("legacy-000000", "message 0"), ("legacy-000001", "message 1"),
+                                               ("legacy-000002", "message 2")]
+    header = chat_ref(app_env, "old").get().to_dict()
+    assert "messages" not in header
+    assert (header["title"], header["messageCount"], header["lastMessagePreview"], header["lastActivity"]) == (
+        "message 0", 3, "message 2", T0 + datetime.timedelta(minutes=2))
+    # Already migrated: nothing to do
+    assert app_env.core.migrate_array_chat(app_env.uid, "old") == 0
+    assert app_env.core.migrate_array_chat(app_env.uid, "missing") == 0
+
+
+def test_turns_added_before_the_migration_are_kept(app_env):
+    later = T0 + datetime.timedelta(days=2)
+    chat_ref(app_env, "mixed").set({"startTime": T0, "title": "Trip", "messageCount": 1, "lastActivity": later,
+                                    "lastMessagePreview": "newest", "messages": legacy_messages(2)})
+    chat_ref(app_env, "mixed").collection("messages").document("t1").set(
+        {"role": "user", "content": "newest", "timestamp": later})
+    app_env.core.migrate_array_chat(app_env.uid, "mixed")
+    header = chat_ref(app_env, "mixed").get().to_dict()
+    assert (header["title"], header["messageCount"], header["lastMessagePreview"], header["lastActivity"]) == (
+        "Trip", 3, "newest", later)
+    assert [content for _, content in stored_messages(app_env, "mixed")] == ["message 0", "message 1", "newest"]
+
+
+def test_every_array_chat_of_a_user_is_migrated(app_env):
+    chat_ref(app_env, "a").set({"startTime": T0, "messages": legacy_messages(2)})
+    chat_ref(app_env, "b").set({"startTime": T0, "messages": legacy_messages(1)})
+    chat_ref(app_env, "new").set({"startTime": T0, "title": "New", "messageCount": 0, "lastActivity": T0})
+    assert app_env.core.migrate_user_array_chats(app_env.uid) == 2
+    assert app_env.core.migrate_user_array_chats(app_env.uid) == 0
+
+
+def test_reading_a_legacy_chat_migrates_it(app_env):
+    chat_ref(app_env, "old").set({"startTime": T0, "messages": legacy_messages(4)})
+    response = app_env.client.get("/api/chats/old/messages", query_string={"limit": 2}, headers=app_env.headers)
+    assert [m["content"] for m in response.get_json()["messages"]] == ["message 2", "message 3"]
+    assert "messages" not in chat_ref(app_env, "old").get().to_dict()
+
+
+def test_listing_backfills_untouched_legacy_chats(app_env):
+    chat_ref(app_env, "old").set({"startTime": T0, "messages": legacy_messages(2)})
+    page = app_env.client.get("/api/chats", headers=app_env.headers).get_json()
+    assert [(chat["chat_id"], chat["messageCount"]) for chat in page["chats"]] == [("old", 2)]
@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+
+from bench.fakes import FakeFirestore
+from chat_store import ChatNotFound, ChatStore, FirestoreChatStore, SqliteChatStore
+
+T0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def message(index, role="user"):
+    return {"role": role, "content": f"message {index}", "timestamp": T0 + datetime.timedelta(minutes=index)}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteChatStore(str(tmp_path / "chats.sqlite3"))
+
+
+def add_turns(store, chat_id, start, count, new_chat=False):
+    return store.add_messages("u1", chat_id, [(f"m{i}", message(i)) for i in range(start, start + count)],
+                              new_chat=new_chat, title="First chat")
+
+
+def test_chat_store_is_abstract():
+    with pytest.raises(TypeError):
+        ChatStore()
+
+
+def test_new_chat_header(store):
+    assert add_turns(store, "c1", 0, 2, new_chat=True)
+    header = store.get_chats("u1")["c1"]
+    assert header["title"] == "First chat"
+    assert header["messageCount"] == 2
+    assert header["lastMessagePreview"] == "message 1"
+    assert header["lastActivity"] == message(1)["timestamp"]
+
+
+def test_add_messages_updates_the_header(store):
+    add_turns(store, "c1", 0, 2, new_chat=True)
+    assert add_turns(store, "c1", 2, 2)
+    header = store.get_chats("u1")["c1"]
+    assert header["messageCount"] == 4
+    assert header["lastMessagePreview"] == "message 3"
+
+
+def test_replayed_messages_are_rejected(store):
+    add_turns(store, "c1", 0, 2, new_chat=True)
+    assert not add_turns(store, "c1", 1, 2)
+    assert store.get_chats("u1")["c1"]["messageCount"] == 2
+
+
+def test_new_chat_never_overwrites_an_existing_chat(store):
+    add_turns(store, "c1", 0, 2, new_chat=True)
+    assert not store.add_messages("u1", "c1", [("other", message(5))], new_chat=True, title="Second chat")
+    header = store.get_chats("u1")["c1"]
+    assert header["title"] == "First chat"
+    assert header["messageCount"] == 2
+
+
+def test_adding_to_a_missing_chat(store):
+    with pytest.raises(ChatNotFound):
+        add_turns(store, "missing", 0, 1)
+
+
+def test_get_messages(store):
+    add_turns(store, "c1", 0, 10, new_chat=True)
+    contents = lambda messages: [m["content"] for m in messages]
+    assert len(store.get_messages("u1", "c1")) == 10
+    assert contents(store.get_messages("u1", "c1", limit=2)) == ["message 8", "message 9"]
+    assert contents(store.get_messages("u1", "c1", limit=2, before=message(5)["timestamp"])) == ["message 3", "message 4"]
+    assert contents(store.get_messages("u1", "c1", limit=2, since=message(5)["timestamp"])) == ["message 6", "message 7"]
+    assert contents(store.get_messages("u1", "c1", since=message(5)["timestamp"], before=message(8)["timestamp"])) == [
+        "message 6", "message 7"]
+
+
+def test_list_chats_pages_by_activity(store):
+    for index in range(3):
+        store.add_messages("u1", f"c{index}", [(f"m{index}", message(index))], new_chat=True, title=f"chat {index}")
+    first = store.list_chats("u1", 2)
+    assert [chat_id for chat_id, _ in first] == ["c2", "c1"]
+    rest = store.list_chats("u1", 2, before_activity=first[-1][1]["lastActivity"])
+    assert [chat_id for chat_id, _ in rest] == ["c0"]
+
+
+def test_summary(store):
+    add_turns(store, "c1", 0, 1, new_chat=True)
+    assert store.get_summary("u1", "c1") == {}
+    assert store.get_summary("u1", "missing") is None
+    store.set_summary("u1", "c1", "Talked about lunch.", message(0)["timestamp"])
+    assert store.get_summary("u1", "c1") == {"summary": "Talked about lunch.", "summaryThrough": message(0)["timestamp"]}
+
+
+def test_export_and_import(store, tmp_path):
+    add_turns(store, "c1", 0, 3, new_chat=True)
+    exported = list(store.export_chats("u1"))
+    copy = SqliteChatStore(str(tmp_path / "copy.sqlite3"))
+    for chat_id, header, messages in exported:
+        copy.import_chat("u1", chat_id, header, messages)
+        # Importing again keeps the messages it already has
+        copy.import_chat("u1", chat_id, header, messages)
+    assert copy.list_users() == ["u1"]
+    assert copy.get_messages("u1", "c1") == store.get_messages("u1", "c1")
+    assert copy.get_chats("u1") == store.get_chats("u1")
+
+
+def test_legacy_firestore_chats_export_with_summary_fields(store):
+    db = FakeFirestore(latency=0.0)
+    chats = db.collection("users").document("u1").collection("chats")
+    chats.document("legacy").set({"startTime": T0, "messages": [message(0), message(1, role="agent")]})
+    chats.document("empty").set({"title": "Nothing yet"})
+    for chat_id, header, messages in FirestoreChatStore(lambda: db).export_chats("u1"):
+        store.import_chat("u1", chat_id, header, messages)
+    assert store.list_chats("u1", 10) == [
+        ("legacy", {"title": "message 0", "lastMessagePreview": "message 1", "messageCount": 2,
+                    "lastActivity": message(1)["timestamp"]}),
+        ("empty", {"title": "Nothing yet", "lastMessagePreview": "", "messageCount": 0,
+                   "lastActivity": datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)}),
+    ]
+    assert [m["content"] for m in store.get_messages("u1", "legacy")] == ["message 0", "message 1"]
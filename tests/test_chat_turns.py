@@ -0,0 +1,63 @@
+import pytest
+
+from chat_store import ChatNotFound
+
+
+def messages_of(app_env, chat_id):
+    return [(m["role"], m["content"]) for m in app_env.core.chat_store.get_messages(app_env.uid, chat_id)]
+
+
+def test_turn_is_committed_in_one_write(app_env):
+    turn = app_env.core.ChatTurnWriter(app_env.uid, title="Plan my week")
+    turn.add_message("user", "Plan my week")
+    turn.add_message("agent", "Done")
+    assert app_env.db.ops["commits"] == 0
+    assert turn.commit()
+    assert app_env.db.ops["commits"] == 1
+    assert messages_of(app_env, turn.chat_id) == [("user", "Plan my week"), ("agent", "Done")]
+    header = app_env.core.chat_store.get_chats(app_env.uid)[turn.chat_id]
+    assert header["title"] == "Plan my week"
+    assert header["messageCount"] == 2
+
+
+def test_replayed_turn_is_not_saved_twice(app_env):
+    for _ in range(2):
+        turn = app_env.core.ChatTurnWriter(app_env.uid, turn_id="req-1")
+        turn.add_message("user", "hello")
+        committed = turn.commit()
+    assert turn.chat_id == "chat-req-1"
+    assert not committed
+    assert messages_of(app_env, "chat-req-1") == [("user", "hello")]
+
+
+def test_turn_for_an_unknown_chat(app_env):
+    turn = app_env.core.ChatTurnWriter(app_env.uid, chat_id="missing")
+    turn.add_message("user", "hello")
+    with pytest.raises(ChatNotFound):
+        turn.commit()
+
+
+def test_retried_first_turn_reuses_its_chat(app_env):
+    body = {"prompt": "plan my week", "accessToken": app_env.access_token, "request_id": "abc123"}
+    chat_ids = [app_env.client.post("/api/toolcall", json=body, headers=app_env.headers).get_json()["chat_id"]
+                for _ in range(2)]
+    assert chat_ids == ["chat-abc123", "chat-abc123"]
+    assert list(app_env.core.chat_store.get_chats(app_env.uid)) == ["chat-abc123"]
+    assert len(messages_of(app_env, "chat-abc123")) == 2
+
+
+def test_unknown_chat_is_rejected_before_the_model_runs(app_env):
+    app_env.gemini.function_call_ratio = 1.0
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "plan my week", "accessToken": app_env.access_token,
+                                         "chat_id": "missing"})
+    assert response.status_code == 404
+    assert app_env.gemini.calls[app_env.core.TOOLCALL_MODEL] == 0
+    assert not app_env.calendar.events.get(f"Bearer {app_env.access_token}")
+
+
+@pytest.mark.parametrize("request_id", ["a/b", "x" * 300, 5, "__x__", ".."])
+def test_invalid_request_ids(app_env, request_id):
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "hi", "accessToken": app_env.access_token, "request_id": request_id})
+    assert response.status_code == 400
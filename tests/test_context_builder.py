@@ -0,0 +1,86 @@
+import datetime
+
+from context_builder import (
+    MESSAGE_OVERHEAD_TOKENS, build_summary_prompt, estimate_tokens, fit_history_to_budget, messages_to_summarize,
+)
+
+T0 = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def message(index, content="x" * 40):
+    return {"role": "user", "content": content, "timestamp": T0 + datetime.timedelta(minutes=index)}
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == MESSAGE_OVERHEAD_TOKENS
+    assert estimate_tokens(None) == MESSAGE_OVERHEAD_TOKENS
+    assert estimate_tokens("x" * 40) == 10 + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_everything_fits():
+    messages = [message(i) for i in range(3)]
+    assert fit_history_to_budget(messages, budget=1000) == ([], messages)
+
+
+def test_keeps_the_most_recent_messages_that_fit():
+    messages = [message(i) for i in range(5)]
+    # 14 tokens each, so three fit in 45
+    evicted, kept = fit_history_to_budget(messages, budget=45)
+    assert evicted == messages[:2]
+    assert kept == messages[2:]
+
+
+def test_always_keeps_the_newest_message():
+    messages = [message(0), message(1, "x" * 4000)]
+    evicted, kept = fit_history_to_budget(messages, budget=10)
+    assert evicted == messages[:1]
+    assert kept == messages[1:]
+
+
+def test_empty_history():
+    assert fit_history_to_budget([]) == ([], [])
+
+
+def test_messages_to_summarize_skips_summarized_ones():
+    messages = [message(i) for i in range(4)]
+    assert messages_to_summarize(messages, None) == messages
+    assert messages_to_summarize(messages, messages[1]["timestamp"]) == messages[2:]
+    assert messages_to_summarize([{"role": "user", "content": "no time"}], T0) == []
+
+
+def test_summary_prompt_includes_previous_summary_and_transcript():
+    prompt = build_summary_prompt("Met Bob.", [{"role": "user", "content": "lunch friday"}])
+    assert "Met Bob." in prompt
+    assert "user: lunch friday" in prompt
+    assert "(none yet)" in build_summary_prompt(None, [])
+
+
+def history(count):
+    # About 1000 tokens each, so three fit the default budget
+    return [dict(message(i, content=f"{i} " + "x" * 4000), role="user" if i % 2 == 0 else "agent") for i in range(count)]
+
+
+def replayed(contents):
+    return [int(content["parts"][0]["text"].split()[0]) for content in contents[1:-1]]
+
+
+def test_unsummarized_evictions_are_replayed(app_env, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(app_env.core, "schedule_summary_update", lambda *args: scheduled.append(args))
+    contents = app_env.core.assemble_contents(app_env.uid, "c1", "context", {}, history(5), "next")
+    assert replayed(contents) == [0, 1, 2, 3, 4]
+    assert scheduled == []
+    # Messages the summary already covers are not replayed
+    summary = {"summary": "Earlier.", "summaryThrough": T0 + datetime.timedelta(minutes=0)}
+    contents = app_env.core.assemble_contents(app_env.uid, "c1", "context", summary, history(5), "next")
+    assert replayed(contents) == [1, 2, 3, 4]
+    assert contents[0].endswith("Summary of the earlier conversation: Earlier.")
+
+
+def test_a_full_batch_of_evictions_is_summarized(app_env, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(app_env.core, "schedule_summary_update", lambda *args: scheduled.append(args))
+    chat_history = history(3 + app_env.core.SUMMARY_MIN_BATCH)
+    contents = app_env.core.assemble_contents(app_env.uid, "c1", "context", {}, chat_history, "next")
+    assert replayed(contents) == [len(chat_history) - 3, len(chat_history) - 2, len(chat_history) - 1]
+    assert [m["content"] for m in scheduled[0][3]] == [m["content"] for m in chat_history[:-3]]
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from deadline import Deadline, DeadlineExceeded, Hedger, bind, current_deadline, deadline_scope, time_left
+
+
+def test_time_left_without_a_deadline():
+    assert current_deadline() is None
+    assert time_left() is None
+    assert time_left(5) == 5
+
+
+def test_deadline_scope():
+    with deadline_scope(10) as deadline:
+        assert current_deadline() is deadline
+        assert 9 < time_left() <= 10
+        assert time_left(2) == 2
+        with deadline_scope(None):
+            assert time_left(3) == 3
+        assert current_deadline() is deadline
+    assert current_deadline() is None
+
+
+def test_zero_means_no_deadline():
+    with deadline_scope(0) as deadline:
+        assert deadline is None
+
+
+def test_an_existing_deadline_can_be_reentered():
+    deadline = Deadline(10)
+    with deadline_scope(deadline):
+        assert current_deadline() is deadline
+
+
+def test_check_raises_when_time_is_short():
+    deadline = Deadline(1)
+    deadline.check("the model call")
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("the model call", reserve=2)
+    assert issubclass(DeadlineExceeded, TimeoutError)
+
+
+def test_bind_carries_the_deadline_to_other_threads():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with deadline_scope(10) as deadline:
+            assert executor.submit(current_deadline).result() is None
+            assert executor.submit(bind(current_deadline)).result() is deadline
+
+
+def test_hedger_returns_the_result_and_records_latency():
+    hedger = Hedger(max_workers=2, min_samples=1)
+    assert hedger.call("model", lambda: "answer", timeout=1) == "answer"
+    assert hedger.quantile("model", 0.5) is not None
+    # Hedging is off unless enabled
+    assert hedger.delay("model") is None
+
+
+def test_hedger_times_out():
+    hedger = Hedger(max_workers=2)
+    with pytest.raises(DeadlineExceeded):
+        hedger.call("model", lambda: time.sleep(0.5), timeout=0.05)
+
+
+def test_hedger_reraises_errors():
+    def fail():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        Hedger(max_workers=2).call("model", fail, timeout=1)
+
+
+def test_hedger_waits_for_min_samples():
+    hedger = Hedger(enabled=True, min_samples=3, min_delay=0.01)
+    hedger.observe("model", 0.001)
+    hedger.observe("model", 0.002)
+    assert hedger.delay("model") is None
+    hedger.observe("model", 0.003)
+    assert hedger.delay("model") == 0.01
+
+
+def test_slow_call_is_hedged():
+    hedger = Hedger(max_workers=4, enabled=True, min_samples=1, min_delay=0.01)
+    hedger.observe("model", 0.01)
+    calls = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            calls.append(1)
+            first = len(calls) == 1
+        time.sleep(1 if first else 0.01)
+        return "slow" if first else "fast"
+
+    started = time.monotonic()
+    assert hedger.call("model", call, timeout=2) == "fast"
+    assert time.monotonic() - started < 0.5
+    assert len(calls) == 2
+
+
+def test_no_hedge_without_a_slot():
+    hedger = Hedger(max_workers=4, enabled=True, min_samples=1, min_delay=0.01)
+    hedger.observe("model", 0.01)
+    calls = []
+
+    def call():
+        calls.append(1)
+        time.sleep(0.1)
+        return "only"
+
+    assert hedger.call("model", call, timeout=1, try_hedge=lambda: False) == "only"
+    assert len(calls) == 1
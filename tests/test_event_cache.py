@@ -0,0 +1,139 @@
+import datetime
+import types
+
+import pytest
+
+from event_cache import CalendarSyncError, EventCache
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+
+
+def event(event_id, days_ahead, status="confirmed", recurrence=None):
+    start = NOW + datetime.timedelta(days=days_ahead)
+    item = {"id": event_id, "summary": event_id, "status": status,
+            "start": {"dateTime": start.isoformat()}, "end": {"dateTime": (start + datetime.timedelta(hours=1)).isoformat()}}
+    if recurrence:
+        item["recurrence"] = recurrence
+    return item
+
+
+class ScriptedCalendar:
+    """A CalendarClient whose list_events answers from a script of (status, body) pairs."""
+
+    def __init__(self, *pages):
+        self.pages = list(pages)
+        self.calls = []
+
+    def list_events(self, access_token, params=None, fields=None):
+        self.calls.append(dict(params))
+        status, body = self.pages.pop(0)
+        return types.SimpleNamespace(status_code=status, json=lambda: body, text=str(body))
+
+
+def test_full_sync_then_incremental_deltas():
+    calendar = ScriptedCalendar(
+        (200, {"items": [event("a", 1), event("b", 2)], "nextSyncToken": "s1"}),
+        (200, {"items": [event("b", 2, status="cancelled"), event("c", 3)], "nextSyncToken": "s2"}),
+    )
+    cache = EventCache(calendar, refresh_interval=0)
+    assert [e["id"] for e in cache.upcoming_events("token")] == ["a", "b"]
+    assert "timeMin" in calendar.calls[0] and "syncToken" not in calendar.calls[0]
+    assert [e["id"] for e in cache.upcoming_events("token")] == ["a", "c"]
+    assert calendar.calls[1]["syncToken"] == "s1" and "timeMin" not in calendar.calls[1]
+    assert cache.stats()["syncs"] == 2
+
+
+def test_fresh_cache_is_a_hit():
+    calendar = ScriptedCalendar((200, {"items": [event("a", 1)], "nextSyncToken": "s1"}))
+    cache = EventCache(calendar, refresh_interval=60)
+    cache.upcoming_events("token")
+    assert [e["id"] for e in cache.upcoming_events("token", max_results=1)] == ["a"]
+    assert len(calendar.calls) == 1 and cache.stats()["hits"] == 1
+
+
+def test_pages_are_followed():
+    calendar = ScriptedCalendar(
+        (200, {"items": [event("a", 1)], "nextPageToken": "p2"}),
+        (200, {"items": [event("b", 2)], "nextSyncToken": "s1"}),
+    )
+    assert [e["id"] for e in EventCache(calendar).upcoming_events("token")] == ["a", "b"]
+    assert calendar.calls[1]["pageToken"] == "p2"
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync():
+    calendar = ScriptedCalendar(
+        (200, {"items": [event("a", 1)], "nextSyncToken": "s1"}),
+        (410, {"error": "gone"}),
+        (200, {"items": [event("b", 2)], "nextSyncToken": "s2"}),
+    )
+    cache = EventCache(calendar, refresh_interval=0)
+    cache.upcoming_events("token")
+    assert [e["id"] for e in cache.upcoming_events("token")] == ["b"]
+    assert "syncToken" in calendar.calls[1] and "timeMin" in calendar.calls[2]
+
+
+def test_sync_errors_are_raised():
+    with pytest.raises(CalendarSyncError):
+        EventCache(ScriptedCalendar((403, {"error": "forbidden"}))).upcoming_events("token")
+
+
+def test_only_the_window_is_kept_and_it_is_re_anchored():
+    calendar = ScriptedCalendar(
+        (200, {"items": [event("soon", 1), event("far", 40), event("past", -3)], "nextSyncToken": "s1"}),
+        (200, {"items": [event("soon", 1)], "nextSyncToken": "s2"}),
+    )
+    cache = EventCache(calendar, refresh_interval=0, window_ahead=datetime.timedelta(days=28))
+    assert [e["id"] for e in cache.upcoming_events("token")] == ["soon"]
+    assert not cache.covers("token", NOW + datetime.timedelta(days=40))
+    # Less than half of the look-ahead left: the next read is a full sync of a new window
+    user = cache._get_user("token")
+    user.window = (user.window[0], NOW + datetime.timedelta(days=10))
+    cache.upcoming_events("token")
+    assert "timeMin" in calendar.calls[1]
+    assert cache.covers("token", NOW + datetime.timedelta(days=20))
+
+
+def test_users_are_evicted_by_count_and_idle_time():
+    pages = [(200, {"items": [event("a", 1)], "nextSyncToken": "s1"}) for _ in range(4)]
+    cache = EventCache(ScriptedCalendar(*pages), max_users=1)
+    cache.upcoming_events("token-1")
+    cache.upcoming_events("token-2")
+    assert cache.stats()["users"] == 1
+    assert cache.cached_event("token-1", "a") is None and cache.cached_event("token-2", "a") is not None
+    cache.ttl_seconds = 0
+    assert cache.cached_event("token-2", "a") is None
+    assert cache.stats()["users"] == 0
+
+
+def test_refreshed_tokens_share_the_user_cache():
+    calendar = ScriptedCalendar((200, {"items": [event("a", 1)], "nextSyncToken": "s1"}))
+    cache = EventCache(calendar, refresh_interval=60)
+    cache.bind_token("old-token", "u1")
+    cache.upcoming_events("old-token")
+    cache.bind_token("new-token", "u1")
+    assert cache.cached_event("new-token", "a") is not None
+    assert len(calendar.calls) == 1
+
+
+def test_created_events_are_written_through_once_synced():
+    calendar = ScriptedCalendar((200, {"items": [], "nextSyncToken": "s1"}))
+    cache = EventCache(calendar, refresh_interval=60)
+    cache.record_event("token", event("early", 1))
+    cache.upcoming_events("token")
+    assert cache.cached_event("token", "early") is None
+    cache.record_event("token", event("new", 1))
+    cache.record_event("token", event("far", 60))
+    assert cache.cached_event("token", "new") is not None and cache.cached_event("token", "far") is None
+    # A series is left to the next sync, which is due straight away
+    cache.record_event("token", event("series", 1, recurrence=["RRULE:FREQ=DAILY;COUNT=3"]))
+    assert cache.cached_event("token", "series") is None and cache._get_user("token").last_sync == 0
+
+
+def test_against_the_calendar_stub(installed_app):
+    core, calendar = installed_app
+    cache = EventCache(core.calendar_client, refresh_interval=0)
+    token = "event-cache-test"
+    calendar.events[f"Bearer {token}"] = [event("a", 1)]
+    assert [e["id"] for e in cache.upcoming_events(token)] == ["a"]
+    calendar.events[f"Bearer {token}"].append(event("b", 2))
+    assert [e["id"] for e in cache.upcoming_events(token)] == ["a", "b"]
@@ -0,0 +1,41 @@
+import datetime
+
+import pytest
+import requests
+
+from deadline import DeadlineExceeded
+
+
+def test_agenda_lists_the_local_day(app_env):
+    tomorrow = datetime.datetime.now().astimezone().replace(hour=12, minute=0, second=0, microsecond=0) \
+        + datetime.timedelta(days=1)
+    app_env.calendar.events[f"Bearer {app_env.access_token}"] = [{
+        "id": "lunch1", "summary": "Lunch", "status": "confirmed",
+        "start": {"dateTime": tomorrow.isoformat()}, "end": {"dateTime": (tomorrow + datetime.timedelta(hours=1)).isoformat()},
+    }]
+    result = app_env.core.agenda_result(app_env.access_token, 1)
+    assert result["response"] == "On your calendar tomorrow (1):\n• Lunch - 12:00"
+
+
+@pytest.mark.parametrize("error", [requests.ConnectionError("calendar down"), requests.Timeout("read timed out"),
+                                   DeadlineExceeded("out of time")])
+def test_agenda_gives_up_when_calendar_cannot_be_read(app_env, monkeypatch, error):
+    def fail(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(app_env.core.event_cache, "upcoming_events", fail)
+    assert app_env.core.agenda_result(app_env.access_token, 0) is None
+
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "what's on my calendar today", "accessToken": app_env.access_token})
+    assert response.status_code == 200
+    assert "X-Fast-Path" not in response.headers
+    assert app_env.gemini.calls[app_env.core.TOOLCALL_MODEL] == 1
+
+
+def test_time_is_answered_locally(app_env):
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "what time is it", "accessToken": app_env.access_token})
+    assert response.status_code == 200
+    assert response.headers["X-Fast-Path"] == "time"
+    assert app_env.gemini.calls[app_env.core.TOOLCALL_MODEL] == 0
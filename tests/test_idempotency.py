@@ -0,0 +1,66 @@
+import datetime
+import re
+
+import pytest
+
+from idempotency import IdempotencyScope, calendar_event_id
+
+START = datetime.datetime(2025, 1, 6, 9, 0)
+
+
+def test_event_key_is_stable_and_normalizes_the_topic():
+    scope = IdempotencyScope("u1")
+    assert scope.event_key("Team  Sync", START, 1) == scope.event_key("team sync", START, 1.0)
+
+
+def test_event_key_depends_on_every_part():
+    key = IdempotencyScope("u1").event_key("sync", START, 1)
+    assert key != IdempotencyScope("u2").event_key("sync", START, 1)
+    assert key != IdempotencyScope("u1", "r1").event_key("sync", START, 1)
+    assert key != IdempotencyScope("u1").event_key("standup", START, 1)
+    assert key != IdempotencyScope("u1").event_key("sync", START + datetime.timedelta(hours=1), 1)
+    assert key != IdempotencyScope("u1").event_key("sync", START, 2)
+
+
+def test_calendar_event_id_is_valid_for_the_calendar_api():
+    event_id = calendar_event_id(IdempotencyScope("u1").event_key("sync", START, 1))
+    assert re.fullmatch(r"[a-v0-9]{5,1024}", event_id)
+    assert event_id == calendar_event_id(IdempotencyScope("u1").event_key("sync", START, 1))
+
+
+def tomorrow():
+    return (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+
+
+def calendar_events(app_env):
+    return app_env.calendar.events.get(f"Bearer {app_env.access_token}", [])
+
+
+@pytest.mark.parametrize("tool, replay_text", [
+    ("handle_schedule_meeting", "already scheduled"),
+    ("handle_schedule_multiple_events", "already scheduled earlier"),
+])
+def test_retry_without_request_id_on_a_cold_cache(app_env, tool, replay_text):
+    retro = {"topic": "Retro", "date": tomorrow(), "time": "10:00"}
+    review = {"topic": "Review", "date": tomorrow(), "time": "14:00"}
+    args = retro if tool == "handle_schedule_meeting" else {"events": [retro, review]}
+    handler = getattr(app_env.core, tool)
+    first = handler(args, app_env.access_token, scope=IdempotencyScope(app_env.uid))
+    assert "error" not in first
+    created = len(calendar_events(app_env))
+    # A retry of the turn: same user and events, nothing remembered in memory and no synced event cache
+    retried = handler(args, app_env.access_token, scope=IdempotencyScope(app_env.uid))
+    assert "error" not in retried and replay_text in retried["response"]
+    assert len(calendar_events(app_env)) == created
+
+
+def test_warm_cache_answers_without_asking_google(app_env):
+    app_env.core.event_cache.upcoming_events(app_env.access_token)
+    gets = app_env.calendar.requests["get"]
+    args = {"topic": "Retro", "date": tomorrow(), "time": "10:00"}
+    for _ in range(2):
+        result = app_env.core.handle_schedule_meeting(args, app_env.access_token, scope=IdempotencyScope(app_env.uid))
+        assert "error" not in result
+    assert "already scheduled" in result["response"]
+    assert app_env.calendar.requests["get"] == gets
+    assert len(calendar_events(app_env)) == 1
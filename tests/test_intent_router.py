@@ -0,0 +1,69 @@
+import pytest
+
+from intent_router import IntentRouter
+
+ROUTED = [
+    ("what time is it", "time"),
+    ("What time is it right now?", "time"),
+    ("time?", "time"),
+    ("what's the time", "time"),
+    ("tell me the current time please", "time"),
+    ("what's the date today", "date"),
+    ("what day is it", "date"),
+    ("what day is today", "date"),
+    ("what's on my calendar today", "agenda_today"),
+    ("whats on today", "agenda_today"),
+    ("what's on my calendar tomorrow", "agenda_tomorrow"),
+    ("any meetings tomorrow?", "agenda_tomorrow"),
+]
+
+# Prompts that look like a routed intent but ask for something its local answer would get wrong
+NEAR_MISSES = [
+    "what day is it tomorrow",
+    "what was the date yesterday",
+    "what's the date next friday",
+    "what day was it two days ago",
+    "what time is it in Tokyo",
+    "what time is my meeting with Bob",
+    "what time is the standup",
+    "what time is the event",
+    "what time is it there",
+    "what's the time there",
+    "schedule a meeting today",
+    "cancel my meetings tomorrow",
+    "move today's standup to 3pm",
+    "add lunch to my calendar tomorrow",
+    "what's the weather today",
+    "how long until my next meeting",
+]
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(threshold=0.8)
+
+
+@pytest.mark.parametrize("prompt, intent", ROUTED)
+def test_routes_trivial_prompts(router, prompt, intent):
+    assert router.route(prompt) == intent
+
+
+@pytest.mark.parametrize("prompt", NEAR_MISSES)
+def test_near_misses_go_to_the_model(router, prompt):
+    assert router.route(prompt) is None
+
+
+def test_relative_day_words_rule_out_date():
+    intent, confidence = IntentRouter().classify("what day is it tomorrow")
+    assert intent != "date"
+    assert confidence < 0.8
+
+
+def test_disabled_router_routes_nothing():
+    assert IntentRouter(enabled=False).route("what time is it") is None
+
+
+def test_stats_count_hits(router):
+    router.answered(router.route("what time is it"), True)
+    router.route("plan my week")
+    assert router.stats() == {"seen": 2, "hits": 1, "hit_rate": 0.5}
@@ -0,0 +1,123 @@
+import datetime
+import json
+import time
+
+from jobs import Job, JobManager
+
+
+def wait_until_done(job, timeout=5):
+    ends_at = time.monotonic() + timeout
+    while not job.done and time.monotonic() < ends_at:
+        job.wait_for_change(job.version, timeout=0.1)
+    return job
+
+
+def sse_events(response):
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if line.startswith(("event", "data")))
+        if lines:
+            events.append((lines.get("event"), json.loads(lines["data"])))
+    return events
+
+
+def test_job_reports_progress_and_result():
+    saved = []
+    manager = JobManager(lambda job: saved.append(job.to_dict()), max_workers=1, persist_interval=0)
+
+    def work(job):
+        job.plan(2)
+        job.event_finished(True)
+        job.event_finished(False)
+        return {"response": "done"}
+
+    job = wait_until_done(manager.submit(Job("u1", "toolcall", chat_id="c1"), work))
+    assert job.status == "succeeded"
+    assert job.result == {"response": "done"}
+    assert job.to_dict()["progress"] == {"planned": 2, "completed": 1, "failed": 1}
+    assert [record["status"] for record in saved][:2] == ["queued", "running"]
+    assert saved[-1]["status"] == "succeeded"
+    assert manager.get(job.id) is job
+
+
+def test_failed_job_keeps_the_error():
+    manager = JobManager(lambda job: None, max_workers=1)
+
+    def work(job):
+        raise RuntimeError("model down")
+
+    job = wait_until_done(manager.submit(Job("u1", "toolcall"), work))
+    assert job.status == "failed"
+    assert job.error == "model down"
+
+
+def test_finished_jobs_expire():
+    manager = JobManager(lambda job: None, max_workers=1, retention_seconds=0)
+    job = wait_until_done(manager.submit(Job("u1", "toolcall"), lambda job: None))
+    manager.submit(Job("u1", "toolcall"), lambda job: None)
+    assert manager.get(job.id) is None
+
+
+def test_persist_errors_do_not_fail_the_job():
+    def persist(job):
+        raise RuntimeError("firestore down")
+
+    job = wait_until_done(JobManager(persist, max_workers=1).submit(Job("u1", "toolcall"), lambda job: "ok"))
+    assert job.status == "succeeded"
+
+
+def start_async_turn(app_env):
+    app_env.gemini.function_call_ratio = 1.0
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "plan my week", "accessToken": app_env.access_token, "async": True})
+    assert response.status_code == 202
+    return response.get_json()
+
+
+def test_async_turn_runs_as_a_job(app_env):
+    accepted = start_async_turn(app_env)
+    job = wait_until_done(app_env.core.job_manager.get(accepted["job_id"]))
+    assert job.status == "succeeded"
+    progress = job.to_dict()["progress"]
+    assert progress["planned"] > 0 and progress["completed"] == progress["planned"]
+    status = app_env.client.get(f"/api/jobs/{job.id}", headers=app_env.headers).get_json()
+    assert status["status"] == "succeeded"
+    # Jobs belong to the user who started them
+    other = app_env.client.get(f"/api/jobs/{job.id}", headers={"Authorization": "Bearer bench-someone-else"})
+    assert other.status_code == 404
+
+
+def test_failed_job_still_saves_the_user_turn(app_env, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("calendar exploded")
+
+    monkeypatch.setattr(app_env.core, "handle_gemini_response", fail)
+    accepted = start_async_turn(app_env)
+    job = wait_until_done(app_env.core.job_manager.get(accepted["job_id"]))
+    assert job.status == "failed"
+    messages = app_env.core.chat_store.get_messages(app_env.uid, accepted["chat_id"])
+    assert [(m["role"], m["content"]) for m in messages] == [
+        ("user", "plan my week"), ("agent", "Sorry, I couldn't finish that: calendar exploded")]
+
+
+def test_stream_ends_when_a_persisted_job_goes_stale(app_env, monkeypatch):
+    monkeypatch.setattr(app_env.core, "JOB_POLL_INTERVAL", 0)
+    job = Job(app_env.uid, "toolcall")
+    job.status = "running"
+    job.updated_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    app_env.core.save_job(job)
+    response = app_env.client.get(f"/api/jobs/{job.id}?stream=1", headers=app_env.headers)
+    assert [event for event, _ in sse_events(response)] == ["progress", "error"]
+    assert "stopped reporting progress" in sse_events(response)[-1][1]["error"]
+
+
+def test_stream_of_a_live_job_is_bounded(app_env, monkeypatch):
+    monkeypatch.setattr(app_env.core, "JOB_STREAM_MAX_SECONDS", 0.2)
+    job = Job(app_env.uid, "toolcall")
+    job.status = "running"
+    monkeypatch.setattr(app_env.core.job_manager, "get", lambda job_id: job)
+    started = time.monotonic()
+    response = app_env.client.get(f"/api/jobs/{job.id}?stream=1", headers=app_env.headers)
+    events = sse_events(response)
+    assert time.monotonic() - started < 2
+    assert [event for event, _ in events] == ["progress", "error"]
@@ -0,0 +1,101 @@
+import os
+import threading
+
+import numpy as np
+
+from memory_index import MemoryStore
+
+DIM = 8
+TOPICS = ["dentist", "gym", "budget", "flight"]
+
+
+def embed(texts, task_type):
+    """One axis per topic word, so a snippet matches the queries that mention its topic."""
+    vectors = np.full((len(texts), DIM), 0.01, dtype=np.float32)
+    for row, text in enumerate(texts):
+        for axis, topic in enumerate(TOPICS):
+            if topic in text.lower():
+                vectors[row, axis] = 1.0
+    return vectors
+
+
+def make_store(tmp_path, **kwargs):
+    return MemoryStore(str(tmp_path), embed, DIM, **kwargs)
+
+
+def test_remember_and_search(tmp_path):
+    store = make_store(tmp_path)
+    store.remember("u1", "message", "m1", "user: book the dentist for Tuesday", chat_id="c1")
+    store.remember("u1", "message", "m2", "user: move gym to the evening please", chat_id="c2")
+    store.remember("u2", "message", "m3", "user: when is my dentist appointment", chat_id="c3")
+    store.flush()
+    results = store.search("u1", "dentist again?")
+    assert [r["text"] for r in results] == ["user: book the dentist for Tuesday"]
+    assert results[0]["score"] > 0.9
+    assert store.search("u1", "dentist again?", exclude_chat="c1") == []
+    assert store.search("nobody", "dentist") == []
+
+
+def test_duplicates_and_short_snippets_are_skipped(tmp_path):
+    store = make_store(tmp_path)
+    for _ in range(3):
+        store.remember("u1", "message", "m1", "user: book the dentist for Tuesday")
+    store.remember("u1", "message", "m2", "ok")
+    store.flush()
+    assert store.indexed == 1
+
+
+def test_index_survives_a_restart(tmp_path):
+    store = make_store(tmp_path)
+    store.remember("u1", "event", "e1", "Flight to Lisbon on 2026-11-02")
+    store.flush()
+    reopened = make_store(tmp_path)
+    assert [r["text"] for r in reopened.search("u1", "when is my flight")] == ["Flight to Lisbon on 2026-11-02"]
+    reopened.remember("u1", "event", "e1", "Flight to Lisbon on 2026-11-02")
+    reopened.flush()
+    assert reopened.indexed == 0
+
+
+def test_uneven_files_are_trimmed_on_load(tmp_path):
+    store = make_store(tmp_path)
+    store.remember("u1", "message", "m1", "user: set a budget for groceries")
+    store.flush()
+    directory = store._user_directory("u1")
+    # A crash after the vectors were written but before the ids and snippets
+    with open(os.path.join(directory, "vectors.f32"), "ab") as f:
+        f.write(np.ones(DIM, dtype=np.float32).tobytes())
+    reopened = make_store(tmp_path)
+    assert len(reopened.search("u1", "budget", min_score=0)) == 1
+    assert os.path.getsize(os.path.join(directory, "vectors.f32")) == 4 * DIM
+
+
+def test_other_embedding_size_starts_over(tmp_path):
+    store = make_store(tmp_path)
+    store.remember("u1", "message", "m1", "user: set a budget for groceries")
+    store.flush()
+    smaller = MemoryStore(str(tmp_path), lambda texts, task_type: np.ones((len(texts), 4)), 4)
+    assert smaller.search("u1", "budget", min_score=0) == []
+
+
+def test_evicted_users_reload_while_indexing(tmp_path):
+    store = make_store(tmp_path, max_open_users=1, batch_size=4)
+    stop = threading.Event()
+
+    def search_until_stopped():
+        while not stop.is_set():
+            for user_id in ("u0", "u1", "u2"):
+                store.search(user_id, "dentist", min_score=0)
+
+    searcher = threading.Thread(target=search_until_stopped)
+    searcher.start()
+    try:
+        for n in range(60):
+            store.remember(f"u{n % 3}", "message", f"m{n}", f"user: dentist reminder number {n}")
+        store.flush()
+    finally:
+        stop.set()
+        searcher.join()
+    reopened = make_store(tmp_path)
+    for user_id in ("u0", "u1", "u2"):
+        assert len(reopened.search(user_id, "dentist", k=100, min_score=0)) == 20
+    assert store.stats()["open_users"] == 1
@@ -0,0 +1,73 @@
+import re
+
+from metrics import CONTENT_TYPE, CallbackGauge, Counter, Gauge, Histogram, timed
+
+
+def test_counter_and_gauge_render_one_sample_per_label_set():
+    counter = Counter("test_widgets_total", "Widgets made.", ["color"])
+    counter.inc(color="red")
+    counter.inc(2, color="blue")
+    counter.inc(color="red")
+    assert counter.value(color="red") == 2
+    assert counter.render() == ["# HELP test_widgets_total Widgets made.", "# TYPE test_widgets_total counter",
+                                'test_widgets_total{color="blue"} 2', 'test_widgets_total{color="red"} 2']
+    gauge = Gauge("test_queue_depth", "Items queued.")
+    gauge.set(5)
+    gauge.dec(2)
+    assert gauge.render()[-1] == "test_queue_depth 3"
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_escaped_total", "Escaping.", ["path"])
+    counter.inc(path='a"b\\c\nd')
+    assert counter.render()[-1] == 'test_escaped_total{path="a\\"b\\\\c\\nd"} 1'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_latency_seconds", "Latency.", ["op"], buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, op="read")
+    assert histogram.render()[2:] == [
+        'test_latency_seconds_bucket{op="read",le="0.1"} 1',
+        'test_latency_seconds_bucket{op="read",le="1"} 3',
+        'test_latency_seconds_bucket{op="read",le="+Inf"} 4',
+        'test_latency_seconds_sum{op="read"} 4.05',
+        'test_latency_seconds_count{op="read"} 4',
+    ]
+
+
+def test_timed_records_failures_too():
+    histogram = Histogram("test_timed_seconds", "Timed.", buckets=(1,))
+
+    @timed(histogram)
+    def fail():
+        raise ValueError("boom")
+
+    try:
+        fail()
+    except ValueError:
+        pass
+    assert histogram.render()[-1] == "test_timed_seconds_count 1"
+
+
+def test_callback_gauge_keeps_its_last_values_when_the_callback_fails():
+    values = {("open",): 2}
+    gauge = CallbackGauge("test_pool", "Pool state.", lambda: dict(values), ["stat"])
+    assert gauge.render()[-1] == 'test_pool{stat="open"} 2'
+    values = None
+    assert gauge.render()[-1] == 'test_pool{stat="open"} 2'
+
+
+def test_metrics_endpoint(app_env):
+    app_env.client.get("/healthz")
+    response = app_env.client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n")
+    assert re.search(r'^urmindr_request_seconds_count\{endpoint="/healthz",method="GET",status="200"\} \d+$', body, re.M)
+    for name in ("urmindr_token_cache", "urmindr_event_cache", "urmindr_jobs", "urmindr_memory_index"):
+        assert f"# TYPE {name} gauge" in body
+    # Every sample line is 'name{labels} value'
+    for line in body.splitlines():
+        assert line.startswith("#") or re.fullmatch(r'[a-z_]+(\{.*\})? \S+', line), line
@@ -0,0 +1,81 @@
+import datetime
+
+import pytest
+
+from recurrence import Recurrence, RecurrenceError
+
+# A Monday
+START = datetime.datetime(2025, 1, 6, 9, 30)
+
+
+def days(occurrences):
+    return [occurrence.date().isoformat() for occurrence in occurrences]
+
+
+def test_daily_with_interval():
+    rule = Recurrence("daily", interval=2, count=3)
+    assert days(rule.expand(START, 10)) == ["2025-01-06", "2025-01-08", "2025-01-10"]
+    assert rule.rrule() == "RRULE:FREQ=DAILY;INTERVAL=2;COUNT=3"
+
+
+def test_occurrences_keep_the_time_of_day():
+    assert all(occurrence.time() == START.time() for occurrence in Recurrence("daily", count=3).expand(START, 10))
+
+
+def test_daily_by_day_filters_weekdays():
+    rule = Recurrence("daily", by_day=["sat", "Sunday"], count=3)
+    assert days(rule.expand(START, 10)) == ["2025-01-11", "2025-01-12", "2025-01-18"]
+
+
+def test_weekly_by_day_starts_on_or_after_start():
+    rule = Recurrence("weekly", by_day=["FR", "MO", "WE"], count=4)
+    assert rule.by_day == ["MO", "WE", "FR"]
+    assert days(rule.expand(START + datetime.timedelta(days=1), 10)) == [
+        "2025-01-08", "2025-01-10", "2025-01-13", "2025-01-15"]
+
+
+def test_weekly_with_interval():
+    rule = Recurrence("weekly", interval=2, until="2025-02-03")
+    assert days(rule.expand(START, 10)) == ["2025-01-06", "2025-01-20", "2025-02-03"]
+    assert rule.rrule() == "RRULE:FREQ=WEEKLY;INTERVAL=2;UNTIL=20250203T235959Z"
+
+
+def test_monthly_skips_months_without_the_day():
+    rule = Recurrence("monthly", count=3)
+    assert days(rule.expand(datetime.datetime(2025, 1, 31, 8), 10)) == ["2025-01-31", "2025-03-31", "2025-05-31"]
+
+
+def test_describe():
+    assert Recurrence("weekly", by_day=["MO", "TH"], count=5).describe() == "every week on Mon, Thu, 5 times"
+    assert Recurrence("monthly", interval=3, until="2025-12-31").describe() == "every 3 months, until 2025-12-31"
+
+
+def test_too_many_occurrences():
+    with pytest.raises(RecurrenceError):
+        Recurrence("daily", until="2030-01-01").expand(START, 50)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"frequency": "hourly", "count": 1},
+    {"frequency": "daily", "interval": -1, "count": 1},
+    {"frequency": "daily", "interval": "often", "count": 1},
+    {"frequency": "daily", "by_day": ["XX"], "count": 1},
+    {"frequency": "monthly", "by_day": ["MO"], "count": 1},
+    {"frequency": "daily"},
+    {"frequency": "daily", "count": 2, "until": "2025-02-01"},
+    {"frequency": "daily", "count": 0},
+    {"frequency": "daily", "until": "next week"},
+])
+def test_invalid_rules(kwargs):
+    with pytest.raises(RecurrenceError):
+        Recurrence(**kwargs)
+
+
+@pytest.mark.parametrize("duration_hours", [0, -1, "two", None])
+def test_recurring_event_needs_a_positive_duration(app_env, duration_hours):
+    start = datetime.date.today() + datetime.timedelta(days=1)
+    result = app_env.core.handle_schedule_recurring_event(
+        {"topic": "Standup", "start_date": start.isoformat(), "time": "09:00", "frequency": "daily", "count": 3,
+         "duration_hours": duration_hours}, app_env.access_token)
+    assert result["error"].startswith("Cannot schedule recurring event 'Standup'")
+    assert app_env.calendar.events.get(f"Bearer {app_env.access_token}", {}) == {}
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from response_cache import ResponseCache, cache_key, normalize_prompt
+
+
+def test_cache_key_ignores_case_and_whitespace():
+    assert normalize_prompt("  Plan   my\nWEEK ") == "plan my week"
+    assert cache_key("model", "Plan my week") == cache_key("model", "plan  my week")
+    assert cache_key("model", "plan my week") != cache_key("other", "plan my week")
+
+
+def test_get_or_compute_caches():
+    cache = ResponseCache("test")
+    assert cache.get_or_compute("k", lambda: "v") == ("v", "miss")
+    assert cache.get_or_compute("k", lambda: "other") == ("v", "hit")
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("response_cache.time.monotonic", lambda: now[0])
+    cache = ResponseCache("test", ttl_seconds=10)
+    cache.put("k", "v")
+    now[0] += 9
+    assert cache.get("k") == "v"
+    now[0] += 1
+    assert cache.get("k") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache("test", max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_failures_are_not_cached():
+    cache = ResponseCache("test")
+
+    def fail():
+        raise RuntimeError("model down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("k", fail)
+    assert cache.get_or_compute("k", lambda: "v") == ("v", "miss")
+
+
+def test_concurrent_misses_share_one_call():
+    cache = ResponseCache("test")
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(1)
+        return "v"
+
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+    follower.start()
+    # Give the follower time to find the call in flight before it finishes
+    follower.join(0.05)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+    assert len(calls) == 1
+    assert sorted(results) == [("v", "coalesced"), ("v", "miss")]
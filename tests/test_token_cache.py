@@ -0,0 +1,54 @@
+import time
+
+from token_cache import TokenCache
+
+
+def test_hit_and_miss_counts():
+    cache = TokenCache()
+    decoded = {"uid": "u1", "exp": time.time() + 3600}
+    assert cache.get("token") is None
+    cache.put("token", decoded)
+    assert cache.get("token") == decoded
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_tokens_are_not_returned(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("token_cache.time.time", lambda: now[0])
+    cache = TokenCache(leeway_seconds=30)
+    cache.put("token", {"uid": "u1", "exp": 1100})
+    now[0] = 1069
+    assert cache.get("token") is not None
+    now[0] = 1070
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_tokens_without_exp_or_already_expired_are_not_stored():
+    cache = TokenCache()
+    cache.put("a", {"uid": "u1"})
+    cache.put("b", {"uid": "u1", "exp": time.time() - 1})
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_tokens_are_evicted():
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 3600
+    cache.put("a", {"uid": "a", "exp": exp})
+    cache.put("b", {"uid": "b", "exp": exp})
+    cache.get("a")
+    cache.put("c", {"uid": "c", "exp": exp})
+    assert cache.get("b") is None
+    assert cache.get("a")["uid"] == "a"
+
+
+def test_invalidate_and_clear():
+    cache = TokenCache()
+    exp = time.time() + 3600
+    cache.put("a", {"uid": "a", "exp": exp})
+    cache.put("b", {"uid": "b", "exp": exp})
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    cache.clear()
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,88 @@
+from google.genai import types
+
+
+def reply(*parts):
+    return types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=list(parts)))])
+
+
+def call(name, **args):
+    return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+
+def text(value):
+    return types.Part(text=value)
+
+
+class ScriptedModel:
+    """Stands in for call_gemini, answering each follow-up call from a script and keeping what it was sent."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def __call__(self, model, contents, config, required=False):
+        self.sent.append(list(contents))
+        return self.responses.pop(0)
+
+
+def test_tool_results_are_fed_back_until_the_model_answers(app_env, monkeypatch):
+    model = ScriptedModel(reply(call("get_time"), call("reschedule_everything")), reply(text("All done.")))
+    monkeypatch.setattr(app_env.core, "call_gemini", model)
+    contents = ["context", {"role": "user", "parts": [{"text": "what time is it, and clear my week"}]}]
+    result = app_env.core.handle_gemini_response(reply(call("get_time")), app_env.access_token, contents, config={})
+    assert result["response"] == "All done."
+    assert [c["name"] for c in result["tool_calls"]] == ["get_time", "get_time", "reschedule_everything"]
+    assert result["tool_calls"][2]["result"] == {"error": "Unknown function call: reschedule_everything"}
+    # Each follow-up carries the model's calls and then one function response per call, in order
+    follow_up = model.sent[-1]
+    assert len(follow_up) == 6
+    assert [p.function_response.name for p in follow_up[3].parts] == ["get_time"]
+    assert [p.function_response.name for p in follow_up[5].parts] == ["get_time", "reschedule_everything"]
+    assert "current time" in follow_up[5].parts[0].function_response.response["response"]
+
+
+def test_the_loop_stops_at_the_step_budget(app_env, monkeypatch):
+    monkeypatch.setattr(app_env.core, "MAX_TOOL_STEPS", 2)
+    model = ScriptedModel(*(reply(call("get_time")) for _ in range(5)))
+    monkeypatch.setattr(app_env.core, "call_gemini", model)
+    result = app_env.core.handle_gemini_response(reply(call("get_time")), app_env.access_token, ["context"], config={})
+    assert len(model.sent) == 1
+    assert len(result["tool_calls"]) == 2
+    # Without closing text, the tools' own messages are the answer
+    assert result["response"].count("The current time is") == 2
+
+
+def test_the_loop_stops_at_the_time_budget(app_env, monkeypatch):
+    monkeypatch.setattr(app_env.core, "TOOL_TIME_BUDGET", 0)
+    model = ScriptedModel(reply(text("never sent")))
+    monkeypatch.setattr(app_env.core, "call_gemini", model)
+    result = app_env.core.handle_gemini_response(reply(call("get_time")), app_env.access_token, ["context"], config={})
+    assert model.sent == [] and len(result["tool_calls"]) == 1
+
+
+def test_without_contents_only_the_first_calls_run(app_env, monkeypatch):
+    model = ScriptedModel()
+    monkeypatch.setattr(app_env.core, "call_gemini", model)
+    result = app_env.core.handle_gemini_response(reply(call("get_time")), app_env.access_token)
+    assert model.sent == [] and result["tool_calls"][0]["name"] == "get_time"
+
+
+def test_text_and_empty_responses(app_env):
+    handle = app_env.core.handle_gemini_response
+    assert handle(reply(text("Hello!")), app_env.access_token) == {"response": "Hello!"}
+    assert handle(types.GenerateContentResponse(candidates=[]), app_env.access_token) == {
+        "response": "No response from the model."}
+    assert handle(reply(), app_env.access_token) == {"response": "Empty response from the model."}
+
+
+def test_a_turn_with_tool_calls_end_to_end(app_env):
+    app_env.gemini.function_call_ratio = 1.0
+    app_env.gemini.events_per_call = 2
+    response = app_env.client.post("/api/toolcall", headers=app_env.headers,
+                                   json={"prompt": "plan my week", "accessToken": app_env.access_token})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body["scheduled_count"] == 2
+    # One call that asked for the tool, one that answered after its result
+    assert app_env.gemini.calls[app_env.core.TOOLCALL_MODEL] == 2
+    assert body["response"] == "Here is your plan. I've taken care of it, quack!"
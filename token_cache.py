@@ -0,0 +1,68 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of decoded Firebase ID tokens.
+    Entries are keyed by a SHA-256 of the raw token and expire at the token's 'exp' claim.
+    """
+
+    def __init__(self, max_size=1024, leeway_seconds=0):
+        self.max_size = max_size
+        self.leeway_seconds = leeway_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+    def get(self, id_token):
+        """Returns the cached decoded token, or None if it is missing or expired."""
+        key = self._key(id_token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, decoded = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decoded
+
+    def put(self, id_token, decoded):
+        """Stores a decoded token until its 'exp' claim, evicting the least recently used entry when full."""
+        exp = decoded.get("exp")
+        if not exp or self.max_size <= 0:
+            return
+        expires_at = float(exp) - self.leeway_seconds
+        if expires_at <= time.time():
+            return
+        key = self._key(id_token)
+        with self._lock:
+            self._entries[key] = (expires_at, decoded)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, id_token):
+        with self._lock:
+            self._entries.pop(self._key(id_token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
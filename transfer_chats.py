@@ -0,0 +1,91 @@
+"""
+Moves chat history between chat stores, e.g. from Firestore into SQLite before switching CHAT_STORE.
+
+Usage:
+    python transfer_chats.py export <store> <file.jsonl> [<user_id> ...]
+    python transfer_chats.py import <store> <file.jsonl>
+    python transfer_chats.py copy <from_store> <to_store> [<user_id> ...]
+
+A store is 'firestore' or 'sqlite[:<path>]' (default path: CHAT_DB_PATH). Exports hold one chat per
+line, with its header and messages; importing a chat again keeps the messages it already has.
+Without user ids every user's chats are transferred.
+"""
+import datetime
+import json
+import os
+import sys
+
+from chat_store import create_chat_store
+
+HEADER_TIMESTAMPS = ('startTime', 'lastActivity', 'summaryThrough')
+
+
+def open_store(spec):
+    backend, _, path = spec.partition(':')
+    if backend == 'firestore':
+        # Importing app initializes the Firebase Admin SDK
+        from app import db
+        return create_chat_store('firestore', firestore_client=lambda: db)
+    return create_chat_store(backend, sqlite_path=path or os.environ.get("CHAT_DB_PATH", "data/chats.sqlite3"))
+
+
+def exported_chats(store, user_ids):
+    for user_id in user_ids or store.list_users():
+        for chat_id, header, messages in store.export_chats(user_id):
+            yield user_id, chat_id, header, messages
+
+
+def encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot export {type(value).__name__} values")
+
+
+def parse_timestamp(value):
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def read_chats(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chat = json.loads(line)
+            header = {key: parse_timestamp(value) if key in HEADER_TIMESTAMPS else value
+                      for key, value in chat['header'].items()}
+            messages = [dict(message, timestamp=parse_timestamp(message.get('timestamp'))) for message in chat['messages']]
+            yield chat['user_id'], chat['chat_id'], header, messages
+
+
+def import_chats(store, chats):
+    count = 0
+    for user_id, chat_id, header, messages in chats:
+        store.import_chat(user_id, chat_id, header, messages)
+        count += 1
+    return count
+
+
+def main(argv):
+    if len(argv) < 3 or argv[0] not in ('export', 'import', 'copy'):
+        print(__doc__)
+        return 1
+    command = argv[0]
+    if command == 'export':
+        count = 0
+        with open(argv[2], 'w', encoding='utf-8') as f:
+            for user_id, chat_id, header, messages in exported_chats(open_store(argv[1]), argv[3:]):
+                f.write(json.dumps({'user_id': user_id, 'chat_id': chat_id, 'header': header, 'messages': messages},
+                                   default=encode) + "\n")
+                count += 1
+        print(f"✅ Exported {count} chats to {argv[2]}")
+    elif command == 'import':
+        count = import_chats(open_store(argv[1]), read_chats(argv[2]))
+        print(f"✅ Imported {count} chats from {argv[2]}")
+    else:
+        count = import_chats(open_store(argv[2]), exported_chats(open_store(argv[1]), argv[3:]))
+        print(f"✅ Copied {count} chats from {argv[1]} to {argv[2]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
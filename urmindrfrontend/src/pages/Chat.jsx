@@ -4,7 +4,7 @@ import { getAuth, onAuthStateChanged } from "firebase/auth";
 
 import microphoneIcon from "../assets/microphone icon.png";
 
-function formatChatIdForDisplay(isoDateString) {
+function formatDateForDisplay(isoDateString) {
   const date = new Date(isoDateString);
   const month = (date.getMonth() + 1).toString().padStart(2, "0");
   const day = date.getDate().toString().padStart(2, "0");
@@ -20,7 +20,9 @@ function Chat() {
   const [input, setInput] = useState("");
   const [user, setUser] = useState(null);
   const [currentChatId, setCurrentChatId] = useState(null);
-  const [historicalChats, setHistoricalChats] = useState({}); // New state for historical chats
+  const [historicalChats, setHistoricalChats] = useState([]); // Chat summaries, most recent first
+  const [nextChatsCursor, setNextChatsCursor] = useState(null); // Cursor for the next page of summaries, if any
+  const [loadingChats, setLoadingChats] = useState(false);
 
   useEffect(() => {
     const auth = getAuth();
@@ -36,16 +38,34 @@ function Chat() {
     }
   }, [user]);
 
-  const loadChat = (chatId, messages) => {
-    console.log("Loading chat:", chatId, messages);
+  const loadChat = async (chatId) => {
+    console.log("Loading chat:", chatId);
     setCurrentChatId(chatId);
-    setMessages(
-      messages.map((msg) => ({
-        text: msg.content,
-        sender: msg.role === "user" ? "user" : "bot",
-      }))
-    );
-    fetchAndDisplayOldChats(); // Refetch chat history after loading a chat
+    try {
+      const idToken = await user.getIdToken();
+      const response = await fetch(
+        `http://127.0.0.1:5000/api/chats/${encodeURIComponent(chatId)}/messages`,
+        {
+          method: "GET",
+          headers: {
+            Authorization: `Bearer ${idToken}`,
+          },
+        }
+      );
+      const result = await response.json();
+      if (!response.ok) {
+        console.error("Error loading chat:", result.error);
+        return;
+      }
+      setMessages(
+        result.messages.map((msg) => ({
+          text: msg.content,
+          sender: msg.role === "user" ? "user" : "bot",
+        }))
+      );
+    } catch (error) {
+      console.error("Network error loading chat:", error);
+    }
   };
 
   const sendMessageToApi = async (message, chatId = null) => {
@@ -171,15 +191,19 @@ function Chat() {
     setMessages([]);
   };
 
-  const fetchAndDisplayOldChats = async () => {
+  // Without a cursor the first page replaces the list; with one the next page is appended
+  const fetchAndDisplayOldChats = async (cursor = null) => {
     if (!user) {
       console.error("No user logged in.");
       return;
     }
 
+    setLoadingChats(true);
     try {
       const idToken = await user.getIdToken();
-      const url = `http://127.0.0.1:5000/get_all_user_chats?user_id=${user.uid}`;
+      const url = cursor
+        ? `http://127.0.0.1:5000/api/chats?cursor=${encodeURIComponent(cursor)}`
+        : "http://127.0.0.1:5000/api/chats";
 
       const response = await fetch(url, {
         method: "GET",
@@ -195,9 +219,14 @@ function Chat() {
       }
 
       const chatsData = await response.json();
-      setHistoricalChats(chatsData);
+      setHistoricalChats((previousChats) =>
+        cursor ? [...previousChats, ...chatsData.chats] : chatsData.chats
+      );
+      setNextChatsCursor(chatsData.next_cursor);
     } catch (error) {
       console.error("Network error fetching old chats:", error);
+    } finally {
+      setLoadingChats(false);
     }
   };
 
@@ -213,21 +242,41 @@ function Chat() {
       {/* Sidebar for historical chats */}
       <div className="w-1/5 bg-gray-100 p-4 overflow-y-auto border-r">
         <h2 className="text-lg font-bold mb-4">Historical Chats</h2>
-        {Object.entries(historicalChats).length > 0 ? (
+        {historicalChats.length > 0 ? (
           <ul>
-            {Object.entries(historicalChats)
-              .sort(([chatIdA], [chatIdB]) => chatIdB.localeCompare(chatIdA))
-              .map(([chatId, messages]) => (
+            {historicalChats.map((chat) => (
                 <li
-                  key={chatId}
+                  key={chat.chat_id}
                   className={`cursor-pointer p-2 mb-2 rounded-lg ${
-                    currentChatId === chatId ? "bg-blue-200" : "hover:bg-gray-200"
+                    currentChatId === chat.chat_id ? "bg-blue-200" : "hover:bg-gray-200"
                   }`}
-                  onClick={() => loadChat(chatId, messages)}
+                  onClick={() => loadChat(chat.chat_id)}
+                  title={chat.title}
                 >
-                  {formatChatIdForDisplay(chatId)}
+                  <div className="font-semibold truncate">
+                    {chat.title || "New chat"}
+                  </div>
+                  {chat.lastMessagePreview && (
+                    <div className="text-sm text-gray-600 truncate">
+                      {chat.lastMessagePreview}
+                    </div>
+                  )}
+                  <div className="text-xs text-gray-500">
+                    {formatDateForDisplay(chat.lastActivity || chat.chat_id)}
+                  </div>
                 </li>
               ))}
+            {nextChatsCursor && (
+              <li>
+                <button
+                  className="w-full p-2 text-sm text-blue-600 hover:bg-gray-200 rounded-lg disabled:text-gray-400"
+                  onClick={() => fetchAndDisplayOldChats(nextChatsCursor)}
+                  disabled={loadingChats}
+                >
+                  {loadingChats ? "Loading..." : "Load older chats"}
+                </button>
+              </li>
+            )}
           </ul>
         ) : (
           <p>No historical chats found.</p>